@@ -0,0 +1,628 @@
+"""Benchmark the housing search pipeline offline.
+
+Runs against a recorded corpus (--corpus, see replay.py) or, by default,
+a synthetic one, and reports p50/p95/p99 latency and throughput for
+end-to-end searches and for each pipeline stage. Results are written as
+JSON and can be compared against a stored baseline:
+
+    python benchmark.py --output results.json
+    python benchmark.py --baseline results.json --tolerance 0.15
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cache import canonicalize_url
+from replay import COMPLETIONS, CRAWLS, Corpus, completion_key
+
+logger = logging.getLogger("benchmark")
+
+LOCATIONS = ["copenhagen", "frederiksberg", "aarhus", "odense", "aalborg"]
+STREETS = ["Nørrebrogade", "Vesterbrogade", "Amagerbrogade", "Østerbrogade", "Jagtvej", "Istedgade"]
+
+# Queries the rule-based parser handles, and queries that need the LLM.
+TEMPLATE_QUERIES = [
+    "apartment in {location} {rooms} rooms under {price}dkk per month",
+    "lejlighed i {location}, {rooms} værelser, max {price_dk} kr",
+    "{rooms}-room flat in {location} under {price_k}k",
+    "{rooms} rooms in {location} or {other_location} under {price} kr",
+]
+FREEFORM_QUERIES = [
+    "somewhere quiet near {location} for a family, not too expensive",
+    "I need a place in {location} close to the university",
+]
+
+CARDS_PER_RESULTS_PAGE = 18
+SCALING_PAGE_COUNTS = [10, 100, 1000, 10000, 100000]
+FILTER_LISTING_COUNTS = [1000, 10000, 100000, 1000000]
+GROUPS = ["stages", "end_to_end", "scaling", "extraction", "filtering"]
+CONCURRENCY_LEVELS = [1, 4, 16, 64]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], wall_time: float, items: int) -> Dict[str, float]:
+    """Summarize per-call latencies (seconds) into milliseconds and throughput."""
+    values = sorted(latencies)
+    return {
+        "calls": len(values),
+        "items": items,
+        "mean_ms": 1000 * sum(values) / len(values) if values else 0.0,
+        "p50_ms": 1000 * percentile(values, 0.50),
+        "p95_ms": 1000 * percentile(values, 0.95),
+        "p99_ms": 1000 * percentile(values, 0.99),
+        "throughput_per_s": items / wall_time if wall_time > 0 else 0.0,
+    }
+
+
+def measure(fn: Callable[[Any], Any], inputs: List[Any], items_per_call: int = 1) -> Dict[str, float]:
+    """Call fn once per input sequentially and summarize the latencies."""
+    latencies = []
+    start = time.perf_counter()
+    for value in inputs:
+        call_start = time.perf_counter()
+        fn(value)
+        latencies.append(time.perf_counter() - call_start)
+    return summarize(latencies, time.perf_counter() - start, len(inputs) * items_per_call)
+
+
+def measure_threaded(fn: Callable[[Any], Any], inputs: List[Any], workers: int) -> Dict[str, float]:
+    """Call fn for every input from a pool of worker threads."""
+    def timed(value):
+        call_start = time.perf_counter()
+        fn(value)
+        return time.perf_counter() - call_start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        latencies = list(executor.map(timed, inputs))
+    return summarize(latencies, time.perf_counter() - start, len(inputs))
+
+
+def measure_async(fn: Callable[[Any], Any], inputs: List[Any], concurrency: int) -> Dict[str, float]:
+    """Await fn for every input on one event loop, at most concurrency at a time."""
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(value):
+            async with semaphore:
+                call_start = time.perf_counter()
+                await fn(value)
+                return time.perf_counter() - call_start
+
+        return await asyncio.gather(*(timed(value) for value in inputs))
+
+    start = time.perf_counter()
+    latencies = asyncio.run(run())
+    return summarize(latencies, time.perf_counter() - start, len(inputs))
+
+
+def _synthetic_card(rng: random.Random, location: str, rooms: int,
+                    listing_id: int) -> Tuple[List[str], str, Dict[str, Any]]:
+    """Build the text lines, link and structured data of one synthetic listing."""
+    price = rng.randrange(6000, 30000, 250)
+    size = rng.randint(25, 160)
+    floor = rng.randint(0, 6)
+    title = f"{rooms} room apartment on {rng.choice(STREETS)}, {location.title()}"
+    price_text = f"{price:,} DKK" if rng.random() < 0.5 else f"{price:,} kr.".replace(",", ".")
+    lines = [
+        title,
+        f"{rooms} rooms · {size} m² · Floor {floor}",
+        f"Rent {price_text} per month",
+        f"Deposit {price * 3:,} DKK",
+        "Available from 1 December",
+    ]
+    link = f"/en/rental-properties/{location}/{rooms}-rooms/apartment-id-{listing_id}"
+    data = {"id": listing_id, "title": title, "url": link, "monthly_rent": {"amount": price, "currency": "DKK"},
+            "deposit": price * 3, "rooms": rooms, "size_m2": size, "floor": floor,
+            "available_from": f"{datetime.now().year}-12-01"}
+    return lines, link, data
+
+
+def synthetic_page(rng: random.Random, location: str, rooms: int, listing_id: int) -> Dict[str, Any]:
+    """Build a crawled page shaped like a boligportal listing page."""
+    lines, link, _ = _synthetic_card(rng, location, rooms, listing_id)
+    lines.append("Log in to contact the landlord. Help · Terms · Privacy")
+    return {"url": f"https://www.boligportal.dk{link}", "text": "\n".join(lines),
+            "links": [link, "/en/help", "/en/login"]}
+
+
+def synthetic_results_page(rng: random.Random, location: str, rooms: int, cards: int,
+                           first_id: int, structured: bool = False) -> Dict[str, Any]:
+    """Build a crawled page shaped like a boligportal search results page with several cards.
+
+    With structured set, the page's raw HTML also embeds the listings as
+    hydration state.
+    """
+    lines = ["BoligPortal", f"Rental properties in {location.title()}", f"{rng.randint(50, 900)} results"]
+    links = ["/en/login", "/en/help"]
+    results = []
+    for listing_id in range(first_id, first_id + cards):
+        card_lines, link, data = _synthetic_card(rng, location, rooms, listing_id)
+        lines.extend(card_lines)
+        links.extend([link, link])
+        results.append(data)
+    lines.append("Help · Terms · Privacy")
+    page = {"url": f"https://www.boligportal.dk/en/rental-properties/{location}/{rooms}-rooms/",
+            "text": "\n".join(lines), "links": links}
+    if structured:
+        state = json.dumps({"props": {"pageProps": {"filters": {"rooms": rooms}, "results": results}}})
+        page["rawHtml"] = (f"<html><head><script id=\"__NEXT_DATA__\" type=\"application/json\">{state}"
+                           f"</script></head><body>{''.join(f'<p>{line}</p>' for line in lines)}</body></html>")
+    return page
+
+
+def synthetic_pages(count: int, seed: int = 0, cards_per_results_page: int = 18) -> List[Dict[str, Any]]:
+    """Build count synthetic crawled pages: a results page for every 15, the rest listing pages."""
+    rng = random.Random(seed)
+    pages = []
+    for i in range(count):
+        location, rooms = rng.choice(LOCATIONS), rng.randint(1, 5)
+        if i % 15 == 0:
+            pages.append(synthetic_results_page(rng, location, rooms, cards_per_results_page, i * 100))
+        else:
+            pages.append(synthetic_page(rng, location, rooms, i * 100))
+    return pages
+
+
+def synthetic_listings(count: int, seed: int = 0) -> List[Any]:
+    """Build count Listing records directly, without pages to extract them from."""
+    from listings import Listing
+
+    rng = random.Random(seed)
+    listings = []
+    for i in range(count):
+        location, rooms = rng.choice(LOCATIONS), rng.randint(1, 5)
+        listings.append(Listing(
+            title=f"{rooms} room apartment on {rng.choice(STREETS)}",
+            price_dkk=float(rng.randrange(6000, 30000, 250)) if rng.random() > 0.02 else None,
+            location=location,
+            size_m2=float(rng.randint(25, 160)),
+            bedrooms=rooms if rng.random() > 0.02 else None,
+            listing_url=f"/en/rental-properties/{location}/{rooms}-rooms/apartment-id-{i}",
+            floor=rng.randint(0, 6),
+        ))
+    return listings
+
+
+def synthetic_queries(count: int, seed: int = 0, freeform_share: float = 0.2) -> List[str]:
+    """Build count queries, freeform_share of which need the LLM to parse."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        price = rng.randrange(8000, 25000, 500)
+        location, other_location = rng.sample(LOCATIONS, 2)
+        values = {
+            "location": location,
+            "other_location": other_location,
+            "rooms": rng.randint(1, 4),
+            "price": price,
+            "price_dk": f"{price:,}".replace(",", "."),
+            "price_k": price // 1000,
+        }
+        templates = FREEFORM_QUERIES if rng.random() < freeform_share else TEMPLATE_QUERIES
+        queries.append(rng.choice(templates).format(**values))
+    return queries
+
+
+def build_synthetic_corpus(path: str, planner: Any, queries: List[str], pages_per_crawl: int,
+                           backend: str, seed: int = 0):
+    """Record synthetic completions and crawls for queries into a corpus at path.
+
+    planner is an agent whose search URL planning and parse prompts are
+    used to key the recordings.
+    """
+    from housing_search import HousingCriteria
+    from query_parser import KNOWN_LOCATIONS, parse_query_rules
+
+    rng = random.Random(seed)
+    corpus = Corpus(path)
+    listing_id = 0
+    seen_urls = set()
+    for query in queries:
+        criteria = parse_query_rules(query)
+        if criteria is None:
+            location = next((KNOWN_LOCATIONS[word] for word in query.lower().split() if word in KNOWN_LOCATIONS),
+                            "copenhagen")
+            criteria = {"location": location, "max_price": 15000, "min_bedrooms": 2,
+                        "property_type": "apartment"}
+            request = {"model": "gpt-3.5-turbo", "messages": planner._query_parse_messages(query)}
+            corpus.append(COMPLETIONS, completion_key(request), json.dumps(criteria), 0.8)
+
+        housing_criteria = HousingCriteria(**criteria)
+        for url, location, rooms in planner.plan_searches(housing_criteria):
+            if url in seen_urls:
+                continue
+            seen_urls.add(url)
+            pages = [synthetic_results_page(rng, location, rooms, CARDS_PER_RESULTS_PAGE, listing_id)]
+            listing_id += CARDS_PER_RESULTS_PAGE
+            for _ in range(pages_per_crawl - 1):
+                pages.append(synthetic_page(rng, location, rooms, listing_id))
+                listing_id += 1
+            corpus.append(CRAWLS, f"{backend}:{canonicalize_url(url)}", pages, 8.0)
+
+
+def make_agent(corpus_path: str, latency: str, backend: str):
+    """Create an agent replaying corpus_path, with caches disabled for cold measurements."""
+    os.environ["REPLAY_CORPUS"] = corpus_path
+    os.environ["REPLAY_LATENCY"] = latency
+    os.environ["FETCH_BACKEND"] = backend
+    os.environ["CRAWL_CACHE_TTL"] = "0"
+    os.environ["CRAWL_CACHE_STALE_TTL"] = "0"
+    os.environ["PARSE_CACHE_SIZE"] = "1"
+    os.environ["RESULT_CACHE_SIZE"] = "0"
+    os.environ.pop("PARSE_CACHE_PATH", None)
+    os.environ.pop("CRAWL_CACHE_PATH", None)
+    from housing_search import HousingSearchAgent
+    return HousingSearchAgent()
+
+
+def filter_listings(listings: List[Any], criteria: Any) -> List[Any]:
+    """Filter listings as the search pipeline does, compiling criteria once."""
+    from listings import compile_predicate
+
+    matches = compile_predicate(criteria)
+    return [listing for listing in listings if matches(listing)]
+
+
+def bench_stages(agent: Any, queries: List[str], results: Dict[str, Any]):
+    """Time each pipeline stage separately over the same queries."""
+    criteria_list = [agent._parse_query(query) for query in queries]
+    plans = [agent.plan_search_urls(criteria) for criteria in criteria_list]
+    backend = agent._get_backend()
+    crawls = [[page for url in urls for page in agent._crawl(url, backend)] for urls in plans]
+    extracted = [agent._extract_listings(pages, criteria) for pages, criteria in zip(crawls, criteria_list)]
+    filtered = [filter_listings(listings, criteria) for listings, criteria in zip(extracted, criteria_list)]
+
+    results["stage.parse"] = measure(agent._parse_query, queries)
+    results["stage.url_build"] = measure(agent.plan_search_urls, criteria_list)
+    results["stage.crawl"] = measure(lambda urls: agent._perform_crawls(urls, backend.name), plans)
+    pairs = list(zip(crawls, criteria_list))
+    results["stage.extraction"] = measure(lambda pair: agent._extract_listings(*pair), pairs)
+    pairs = list(zip(extracted, criteria_list))
+    results["stage.filtering"] = measure(
+        lambda pair: filter_listings(*pair), pairs
+    )
+    results["stage.rendering"] = measure(agent._construct_response, filtered)
+
+
+def first_streamed_piece(agent: Any) -> Callable[[str], str]:
+    """Return a function streaming a search and stopping at its first piece of response."""
+    def first_piece(query: str) -> str:
+        stream = agent.stream_housing(query)
+        try:
+            return next(stream)
+        finally:
+            stream.close()
+    return first_piece
+
+
+def bench_end_to_end(agent: Any, queries: List[str], levels: List[int], results: Dict[str, Any]):
+    """Time whole searches sequentially and under increasing concurrency."""
+    results["search_housing"] = measure(agent.search_housing, queries)
+    results["stream_housing"] = measure(lambda query: "".join(agent.stream_housing(query)), queries)
+    results["stream_housing.first_result"] = measure(first_streamed_piece(agent), queries)
+    for level in levels:
+        results[f"search_housing.threads_{level}"] = measure_threaded(agent.search_housing, queries, level)
+        results[f"asearch_housing.concurrency_{level}"] = measure_async(agent.asearch_housing, queries, level)
+
+
+def bench_scaling(agent: Any, page_counts: List[int], results: Dict[str, Any]):
+    """Time extraction and filtering as the number of crawled pages grows."""
+    from housing_search import HousingCriteria
+
+    criteria = HousingCriteria(location="copenhagen", max_price=15000, min_bedrooms=2)
+    for count in page_counts:
+        pages = synthetic_pages(count, seed=count)
+        repeats = max(1, min(20, 10000 // count))
+        results[f"scaling.extraction.pages_{count}"] = measure(
+            lambda _: agent._extract_listings(pages, criteria), range(repeats), items_per_call=count
+        )
+        listings = agent._extract_listings(pages, criteria)
+        results[f"scaling.filtering.pages_{count}"] = measure(
+            lambda _: filter_listings(listings, criteria), range(repeats), items_per_call=count
+        )
+
+
+# The per-field searches extraction used before its field scanner,
+# kept as the baseline the "extraction" group compares against.
+_LEGACY_PRICE_RE = re.compile(r'(\d+(?:[.,]\d{3})*(?:[.,]\d{2})?)\s*(?:DKK|kr\.?)', re.IGNORECASE)
+_LEGACY_DEPOSIT_RE = re.compile(r'\b(?:deposit|depositum|prepaid\s+rent|forudbetalt\s+leje)\b', re.IGNORECASE)
+_LEGACY_ROOMS_RE = re.compile(r'(\d+)\s*(?:room|rm|bedroom|værelser)', re.IGNORECASE)
+_LEGACY_SIZE_RE = re.compile(r'(\d+)\s*m²')
+_LEGACY_AVAILABLE_RE = re.compile(r'\b(?:available\s+(?:from|now|immediately)|ledig\s+(?:fra|nu)|overtagelse)\b(.*)',
+                                  re.IGNORECASE)
+
+
+def legacy_card_fields(text: str) -> Dict[str, Any]:
+    """Extract a card's fields with one regex search per field and line."""
+    fields: Dict[str, Any] = {}
+    for line in text.split("\n"):
+        price_match = _LEGACY_PRICE_RE.search(line)
+        if price_match:
+            name = "deposit_dkk" if _LEGACY_DEPOSIT_RE.search(line) else "price_dkk"
+            fields.setdefault(name, float(re.sub(r"[.,]", "", price_match.group(1))))
+        rooms_match = _LEGACY_ROOMS_RE.search(line)
+        if rooms_match:
+            fields.setdefault("bedrooms", int(rooms_match.group(1)))
+        size_match = _LEGACY_SIZE_RE.search(line)
+        if size_match:
+            fields.setdefault("size_m2", float(size_match.group(1)))
+        available_match = _LEGACY_AVAILABLE_RE.search(line)
+        if available_match:
+            fields.setdefault("available_from", available_match.group(1).strip())
+    return fields
+
+
+# How pages were split into cards before the scanner: card boundaries from
+# per-line searches, then every card searched again for its fields.
+_LEGACY_LISTING_URL_RE = re.compile(r'/rental-properties/[^?#]*?(?:-id-\d+|/\d+)/?(?:[?#]|$)')
+_LEGACY_TRAILING_FIELDS = {"price", "deposit", "available"}
+
+
+def _legacy_line_fields(line: str) -> Dict[str, str]:
+    fields = {}
+    price_match = _LEGACY_PRICE_RE.search(line)
+    if price_match:
+        fields["deposit" if _LEGACY_DEPOSIT_RE.search(line) else "price"] = price_match.group(1)
+    rooms_match = _LEGACY_ROOMS_RE.search(line)
+    if rooms_match:
+        fields["rooms"] = rooms_match.group(1)
+    size_match = _LEGACY_SIZE_RE.search(line)
+    if size_match:
+        fields["size"] = size_match.group(1)
+    available_match = _LEGACY_AVAILABLE_RE.search(line)
+    if available_match:
+        fields["available"] = available_match.group(1).strip()
+    return fields
+
+
+def _legacy_head_length(fields: List[Dict[str, str]], price_line: int, floor: int) -> int:
+    seen: Dict[str, str] = {}
+    length = 0
+    for i in range(price_line - 1, floor - 1, -1):
+        line_fields = fields[i]
+        if _LEGACY_TRAILING_FIELDS.intersection(line_fields):
+            break
+        if any(seen.get(field, value) != value for field, value in line_fields.items()):
+            break
+        seen.update(line_fields)
+        length += 1
+    return length
+
+
+def _legacy_card_texts(text: str) -> List[str]:
+    lines = [line for line in text.split('\n') if line.strip()]
+    fields = [_legacy_line_fields(line) for line in lines]
+    prices = [i for i, line_fields in enumerate(fields) if "price" in line_fields]
+    if len(prices) < 2:
+        return ['\n'.join(lines)] if lines else []
+    heads = sorted(_legacy_head_length(fields, price, previous + 1) for previous, price in zip(prices, prices[1:]))
+    head = heads[len(heads) // 2]
+    if prices[0] < head:
+        head = 0
+    starts = [max(0, prices[0] - head)]
+    starts += [max(previous + 1, price - head) for previous, price in zip(prices, prices[1:])]
+    bounds = starts + [len(lines)]
+    return ['\n'.join(lines[start:end]) for start, end in zip(bounds, bounds[1:])]
+
+
+def _legacy_extract_card_fields(text: str) -> Dict[str, Optional[float]]:
+    price = None
+    for match in _LEGACY_PRICE_RE.finditer(text):
+        line_start = text.rfind('\n', 0, match.start()) + 1
+        line_end = text.find('\n', match.end())
+        if _LEGACY_DEPOSIT_RE.search(text[line_start:line_end if line_end != -1 else len(text)]):
+            continue
+        price = float(re.sub(r'[.,]', '', match.group(1)))
+        break
+    room_match = _LEGACY_ROOMS_RE.search(text)
+    size_match = _LEGACY_SIZE_RE.search(text)
+    return {
+        "price_dkk": price,
+        "bedrooms": int(room_match.group(1)) if room_match else None,
+        "size_m2": float(size_match.group(1)) if size_match else None,
+    }
+
+
+def legacy_extract_page(page: Dict[str, Any]) -> List[Tuple[str, Optional[str], Dict[str, Any]]]:
+    """Extract a page's cards as split_cards and extract_card_fields did before the field scanner.
+
+    Returns (text, link, fields) per card. Only price, rooms and size are
+    extracted, against the scanner's every field and parsed dates.
+    """
+    texts = _legacy_card_texts(page.get('text', ''))
+    links = list(dict.fromkeys(link for link in page.get('links', []) if _LEGACY_LISTING_URL_RE.search(link)))
+    if len(texts) == 1:
+        page_url = page.get('url')
+        links = [page_url if page_url and _LEGACY_LISTING_URL_RE.search(page_url) else (links[0] if links else None)]
+    elif len(links) != len(texts):
+        links = [None] * len(texts)
+    return [(text, link, _legacy_extract_card_fields(text)) for text, link in zip(texts, links)]
+
+
+def bench_extraction(page_counts: List[int], results: Dict[str, Any]):
+    """Compare the field scanner with per-field regex searches, per card and per page, and text with
+    structured data."""
+    from extraction import PageScan, extract_page, extract_structured_cards, extract_text_cards
+
+    for count in page_counts:
+        pages = synthetic_pages(count, seed=count)
+        cards = [card.text for page in pages for card in extract_page(page)]
+        repeats = max(3, min(20, 10000 // count))
+        results[f"extraction.legacy_fields.pages_{count}"] = measure(
+            lambda _: [legacy_card_fields(text) for text in cards], range(repeats), items_per_call=len(cards)
+        )
+        results[f"extraction.scan_fields.pages_{count}"] = measure(
+            lambda _: [PageScan(text).fields() for text in cards], range(repeats), items_per_call=len(cards)
+        )
+        results[f"extraction.legacy_page.pages_{count}"] = measure(
+            lambda _: [legacy_extract_page(page) for page in pages], range(repeats), items_per_call=count
+        )
+        results[f"extraction.extract_page.pages_{count}"] = measure(
+            lambda _: [extract_page(page) for page in pages], range(repeats), items_per_call=count
+        )
+
+        # The same results pages with and without embedded structured data.
+        rng = random.Random(count)
+        results_pages = [synthetic_results_page(rng, rng.choice(LOCATIONS), rng.randint(1, 5),
+                                                CARDS_PER_RESULTS_PAGE, i * 100, structured=True)
+                         for i in range(max(1, count // 15))]
+        results[f"extraction.text_path.results_pages_{len(results_pages)}"] = measure(
+            lambda _: [extract_text_cards(page) for page in results_pages], range(repeats),
+            items_per_call=len(results_pages)
+        )
+        results[f"extraction.structured_path.results_pages_{len(results_pages)}"] = measure(
+            lambda _: [extract_structured_cards(page) for page in results_pages], range(repeats),
+            items_per_call=len(results_pages)
+        )
+
+
+def bench_filtering(agent: Any, listing_counts: List[int], results: Dict[str, Any]):
+    """Compare filtering listings one by one with filtering a ListingBatch at once."""
+    from housing_search import HousingCriteria
+    from listings import ListingBatch
+
+    criteria = HousingCriteria(location="copenhagen", max_price=15000, min_bedrooms=2)
+    all_fields = HousingCriteria(location="copenhagen", max_price=15000, min_bedrooms=2, min_size_m2=40,
+                                 max_size_m2=120, furnished=True, immediate_availability=True)
+    for count in listing_counts:
+        listings = synthetic_listings(count, seed=count)
+        repeats = max(3, min(20, 100000 // count))
+        results[f"filtering.per_listing.listings_{count}"] = measure(
+            lambda _: filter_listings(listings, criteria), range(repeats), items_per_call=count
+        )
+        results[f"filtering.per_listing_all_fields.listings_{count}"] = measure(
+            lambda _: filter_listings(listings, all_fields), range(repeats), items_per_call=count
+        )
+        results[f"filtering.batch_build.listings_{count}"] = measure(
+            lambda _: ListingBatch.from_listings(listings), range(repeats), items_per_call=count
+        )
+        batch = ListingBatch.from_listings(listings)
+        results[f"filtering.batch_mask.listings_{count}"] = measure(
+            lambda _: batch.criteria_mask(criteria), range(repeats), items_per_call=count
+        )
+        results[f"filtering.batch_mask_all_fields.listings_{count}"] = measure(
+            lambda _: batch.criteria_mask(all_fields), range(repeats), items_per_call=count
+        )
+        results[f"filtering.batch_filter.listings_{count}"] = measure(
+            lambda _: batch.filter(criteria), range(repeats), items_per_call=count
+        )
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return descriptions of benchmarks whose p50 regressed beyond tolerance."""
+    regressions = []
+    for name, current in sorted(results.items()):
+        previous = baseline.get(name)
+        if not previous or not previous.get("p50_ms"):
+            continue
+        ratio = current["p50_ms"] / previous["p50_ms"]
+        marker = ""
+        if ratio > 1 + tolerance:
+            marker = "  REGRESSION"
+            regressions.append(f"{name}: p50 {previous['p50_ms']:.3f} -> {current['p50_ms']:.3f} ms")
+        print(f"{name:48s} {previous['p50_ms']:10.3f} -> {current['p50_ms']:10.3f} ms  x{ratio:5.2f}{marker}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="replay this recorded corpus instead of synthetic data")
+    parser.add_argument("--queries", type=int, default=200, help="number of synthetic queries")
+    parser.add_argument("--pages-per-crawl", type=int, default=15, help="synthetic pages per crawl")
+    parser.add_argument("--latency", default="none", help="REPLAY_LATENCY model for crawls and completions")
+    parser.add_argument("--backend", default="firecrawl", help="fetch backend name to replay")
+    parser.add_argument("--max-pages", type=int, default=SCALING_PAGE_COUNTS[-1],
+                        help="largest page count in the scaling benchmarks")
+    parser.add_argument("--max-listings", type=int, default=FILTER_LISTING_COUNTS[-1],
+                        help="largest listing count in the filtering benchmarks")
+    parser.add_argument("--concurrency", type=int, nargs="*", default=CONCURRENCY_LEVELS)
+    parser.add_argument("--only", nargs="*", choices=GROUPS,
+                        help="run only these benchmark groups")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against results JSON from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed p50 slowdown vs. baseline")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+    groups = set(args.only or GROUPS)
+
+    queries = synthetic_queries(args.queries, seed=args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_path = args.corpus
+        if corpus_path is None:
+            corpus_path = tmp
+            # Agents index the corpus when created, so plan with a throwaway
+            # agent and create the measured one once the corpus is built.
+            planner = make_agent(corpus_path, args.latency, args.backend)
+            build_synthetic_corpus(corpus_path, planner, queries, args.pages_per_crawl, args.backend, seed=args.seed)
+        agent = make_agent(corpus_path, args.latency, args.backend)
+
+        results: Dict[str, Any] = {}
+        if "stages" in groups:
+            bench_stages(agent, queries, results)
+        if "end_to_end" in groups:
+            bench_end_to_end(agent, queries, args.concurrency, results)
+        if "scaling" in groups:
+            bench_scaling(agent, [n for n in SCALING_PAGE_COUNTS if n <= args.max_pages], results)
+        if "extraction" in groups:
+            bench_extraction([n for n in SCALING_PAGE_COUNTS if n <= args.max_pages], results)
+        if "filtering" in groups:
+            bench_filtering(agent, [n for n in FILTER_LISTING_COUNTS if n <= args.max_listings], results)
+
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "corpus": args.corpus or "synthetic",
+            "queries": len(queries),
+            "latency": args.latency,
+            "backend": args.backend,
+        },
+        "results": results,
+    }
+
+    for name, stats in results.items():
+        print(f"{name:48s} p50 {stats['p50_ms']:10.3f} ms  p95 {stats['p95_ms']:10.3f} ms  "
+              f"p99 {stats['p99_ms']:10.3f} ms  {stats['throughput_per_s']:12.1f}/s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        print(f"\nComparison with {args.baseline}:")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,551 @@
+import asyncio
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache with optional TTL.
+
+    max_bytes optionally bounds the total size of the values too, measured
+    as their JSON length like DiskCache does; values larger than that on
+    their own aren't kept.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _pop(self, key: str):
+        self._entries.pop(key, None)
+        self._bytes -= self._sizes.pop(key, 0)
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Return (value, stored_at) for key, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if self.ttl is not None and time.time() - entry[1] > self.ttl:
+                self._pop(key)
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the cached value for key, or default."""
+        entry = self.get_entry(key)
+        return default if entry is None else entry[0]
+
+    def set(self, key: str, value: Any, stored_at: Optional[float] = None):
+        """Store value under key, evicting the least recently used entries."""
+        size = len(json.dumps(value)) if self.max_bytes is not None else 0
+        with self._lock:
+            self._pop(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                self.evictions += 1
+                return
+            self._entries[key] = (value, time.time() if stored_at is None else stored_at)
+            self._sizes[key] = size
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, key: str):
+        """Remove key from the cache if present."""
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit, miss and eviction counters, and the size of the values held if bounded by bytes."""
+        stats = {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+        if self.max_bytes is not None:
+            stats["bytes"] = self._bytes
+        return stats
+
+
+class DiskCache:
+    """SQLite-backed cache of JSON-serializable values that survives restarts."""
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: Optional[float] = None,
+                 max_bytes: Optional[int] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        self._conn.commit()
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Return (value, stored_at) for key, or None if missing or expired."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, stored_at = row
+            now = time.time()
+            if self.ttl is not None and now - stored_at > self.ttl:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._conn.commit()
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        try:
+            return json.loads(value), stored_at
+        except ValueError as e:
+            logger.warning(f"Discarding corrupt cache entry {key}: {str(e)}")
+            self.delete(key)
+            return None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the cached value for key, or default."""
+        entry = self.get_entry(key)
+        return default if entry is None else entry[0]
+
+    def set(self, key: str, value: Any, stored_at: Optional[float] = None):
+        """Store a JSON-serializable value under key."""
+        now = time.time()
+        payload = json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, payload, now if stored_at is None else stored_at, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop expired entries and the least recently used ones above max_entries or max_bytes."""
+        if self.ttl is not None:
+            cursor = self._conn.execute("DELETE FROM entries WHERE stored_at < ?", (time.time() - self.ttl,))
+            self.evictions += cursor.rowcount
+        count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if count > self.max_entries:
+            cursor = self._conn.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+            self.evictions += cursor.rowcount
+        if self.max_bytes is not None:
+            total = self._conn.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM entries").fetchone()[0]
+            if total > self.max_bytes:
+                victims = []
+                rows = self._conn.execute("SELECT key, LENGTH(value) FROM entries ORDER BY accessed_at")
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    victims.append((key,))
+                    total -= size
+                self._conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+                self.evictions += len(victims)
+
+    def delete(self, key: str):
+        """Remove key from the cache if present."""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit, miss and eviction counters."""
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class TieredCache:
+    """In-memory LRU tier in front of an optional on-disk tier."""
+
+    def __init__(self, memory: LRUCache, disk: Optional[DiskCache] = None):
+        self.memory = memory
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Return (value, stored_at) from the fastest tier that has key."""
+        entry = self.memory.get_entry(key)
+        if entry is None and self.disk is not None:
+            entry = self.disk.get_entry(key)
+            if entry is not None:
+                self.memory.set(key, entry[0], stored_at=entry[1])
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the cached value for key, or default."""
+        entry = self.get_entry(key)
+        return default if entry is None else entry[0]
+
+    def set(self, key: str, value: Any, stored_at: Optional[float] = None):
+        """Store value in every tier."""
+        self.memory.set(key, value, stored_at=stored_at)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value, stored_at=stored_at)
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                logger.warning(f"Failed to write cache entry to disk: {str(e)}")
+
+    def delete(self, key: str):
+        """Remove key from every tier."""
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def clear(self):
+        """Remove all entries from every tier."""
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return counters for each tier."""
+        stats = {"hits": self.hits, "misses": self.misses, "memory": self.memory.stats()}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+class ResultCache:
+    """Recent search results that also answer narrower searches.
+
+    Entries are keyed by search criteria. covers(cached, criteria) tells
+    whether a cached search's results include every result of criteria;
+    the caller then filters them down locally instead of searching again.
+    locations(criteria), if given, lists the locations a search covers:
+    a covering search includes every location of the narrower one, so
+    only entries indexed under one of them are checked.
+    """
+
+    def __init__(self, covers: Callable[[Any, Any], bool], max_entries: int = 128, ttl: float = 300,
+                 locations: Optional[Callable[[Any], List[str]]] = None):
+        self.covers = covers
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.locations = locations
+        self._entries: "OrderedDict[str, Tuple[str, Any, Any, float, List[Any]]]" = OrderedDict()
+        # Keys of the entries covering each (namespace, location), least recently used first.
+        self._by_location: "Dict[Tuple[str, Any], OrderedDict[str, None]]" = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.covering_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(criteria: Any, namespace: str) -> str:
+        return namespace + json.dumps(vars(criteria), sort_keys=True, default=str)
+
+    def _entry_locations(self, criteria: Any) -> List[Any]:
+        return list(self.locations(criteria)) if self.locations else [None]
+
+    def _pop(self, key: str):
+        namespace, _, _, _, locations = self._entries.pop(key)
+        for location in locations:
+            keys = self._by_location[(namespace, location)]
+            del keys[key]
+            if not keys:
+                del self._by_location[(namespace, location)]
+
+    def _touch(self, key: str):
+        self._entries.move_to_end(key)
+        namespace, _, _, _, locations = self._entries[key]
+        for location in locations:
+            self._by_location[(namespace, location)].move_to_end(key)
+
+    def _candidates(self, criteria: Any, namespace: str) -> List[str]:
+        """Return the keys of the entries that may cover criteria, most recently used first."""
+        locations = self._entry_locations(criteria)
+        if not locations:
+            return [key for key in reversed(self._entries) if self._entries[key][0] == namespace]
+        keys = min((self._by_location.get((namespace, location), {}) for location in locations), key=len)
+        return list(reversed(keys))
+
+    def get(self, criteria: Any, namespace: str = "") -> Optional[Tuple[Any, Any]]:
+        """Return (cached criteria, results) of the latest search covering criteria, or None.
+
+        namespace separates results that aren't interchangeable, such as
+        those of different fetch backends.
+        """
+        key = self._key(criteria, namespace)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[3] > self.ttl:
+                self._pop(key)
+            elif entry is not None:
+                self._touch(key)
+                self.exact_hits += 1
+                return entry[1], entry[2]
+            for entry_key in self._candidates(criteria, namespace):
+                _, cached, results, stored_at, _ = self._entries[entry_key]
+                if now - stored_at > self.ttl:
+                    self._pop(entry_key)
+                elif self.covers(cached, criteria):
+                    self._touch(entry_key)
+                    self.covering_hits += 1
+                    return cached, results
+            self.misses += 1
+            return None
+
+    def set(self, criteria: Any, results: Any, namespace: str = ""):
+        """Store the results of a complete search for criteria."""
+        with self._lock:
+            key = self._key(criteria, namespace)
+            if key in self._entries:
+                self._pop(key)
+            # Copied so later changes to the caller's criteria don't alter the entry.
+            cached = copy.deepcopy(criteria)
+            locations = self._entry_locations(cached)
+            self._entries[key] = (namespace, cached, results, time.time(), locations)
+            for location in locations:
+                self._by_location.setdefault((namespace, location), OrderedDict())[key] = None
+            while len(self._entries) > self.max_entries:
+                self._pop(next(iter(self._entries)))
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+            self._by_location.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return entry count and exact, covering and missed lookups."""
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "covering_hits": self.covering_hits,
+            "misses": self.misses,
+        }
+
+
+def canonicalize_url(url: str) -> str:
+    """Canonicalize a search URL so equivalent searches share a cache key.
+
+    Scheme and host are lowercased, the fragment, empty parameters and
+    trailing slashes are dropped and query parameters are sorted.
+    """
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip("/") or "/"
+    params = sorted((key, value) for key, value in parse_qsl(parts.query) if value != "")
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(params), ""))
+
+
+class PageCollector:
+    """Collects the pages of a streamed crawl for caching, as long as they total at most max_bytes.
+
+    Measured as JSON, like LRUCache. A crawl that grows past max_bytes
+    drops what it collected and isn't cached, so streaming it never holds
+    more than that.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.pages: Optional[List[Dict]] = []
+        self.size = 0
+
+    def add(self, batch: List[Dict]):
+        """Add a batch of pages, or give up collecting once they are too large."""
+        if self.pages is None:
+            return
+        self.size += len(json.dumps(batch))
+        if self.size > self.max_bytes:
+            self.pages = None
+        else:
+            self.pages.extend(batch)
+
+
+class CrawlCache:
+    """Crawl results keyed by canonical search URL, with stale-while-revalidate.
+
+    Entries younger than ttl are served as is. Entries up to stale_ttl past
+    that are served immediately while a background refresh replaces them.
+    Older entries are treated as misses.
+    """
+
+    def __init__(self, cache: TieredCache, ttl: float, stale_ttl: float = 0, max_refresh_workers: int = 4):
+        self.cache = cache
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.fresh_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self._refreshing: Set[str] = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_refresh_workers, thread_name_prefix="crawl-refresh")
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _lookup(self, key: str) -> Tuple[Optional[List[Dict]], bool]:
+        """Return (cached pages or None, whether they need refreshing)."""
+        entry = self.cache.get_entry(key)
+        if entry is None:
+            self.misses += 1
+            return None, False
+        data, stored_at = entry
+        age = time.time() - stored_at
+        if age <= self.ttl:
+            self.fresh_hits += 1
+            return data, False
+        if age <= self.ttl + self.stale_ttl:
+            self.stale_hits += 1
+            return data, True
+        self.misses += 1
+        return None, False
+
+    def _claim_refresh(self, key: str) -> bool:
+        """Mark key as refreshing; False if a refresh is already running."""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def get(self, url: str, fetch: Callable[[str], List[Dict]], namespace: str = "") -> List[Dict]:
+        """Return crawl pages for url, calling fetch on a miss or refreshing in the background.
+
+        namespace separates results for the same URL that aren't
+        interchangeable, such as those of different fetch backends.
+        """
+        key = namespace + canonicalize_url(url)
+        data, stale = self._lookup(key)
+        if data is None:
+            data = fetch(url)
+            self.cache.set(key, data)
+            return data
+        if stale and self._claim_refresh(key):
+            logger.info(f"Serving stale crawl for {url} while refreshing")
+            self._executor.submit(self._refresh, key, url, fetch)
+        return data
+
+    def peek(self, url: str, namespace: str = "") -> Optional[List[Dict]]:
+        """Return crawl pages for url if cached and fresh, without fetching or refreshing."""
+        data, stale = self._lookup(namespace + canonicalize_url(url))
+        return None if stale else data
+
+    def put(self, url: str, data: List[Dict], namespace: str = ""):
+        """Store the complete crawl pages for url, as a fetch on a miss would."""
+        self.cache.set(namespace + canonicalize_url(url), data)
+
+    def _refresh(self, key: str, url: str, fetch: Callable[[str], List[Dict]]):
+        try:
+            self.cache.set(key, fetch(url))
+            self.refreshes += 1
+        except Exception as e:
+            self.refresh_failures += 1
+            logger.warning(f"Background refresh of {url} failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    async def aget(self, url: str, fetch: Callable[[str], Awaitable[List[Dict]]],
+                   namespace: str = "") -> List[Dict]:
+        """Async variant of get; background refreshes run as tasks on the running loop."""
+        key = namespace + canonicalize_url(url)
+        data, stale = self._lookup(key)
+        if data is None:
+            data = await fetch(url)
+            self.cache.set(key, data)
+            return data
+        if stale and self._claim_refresh(key):
+            logger.info(f"Serving stale crawl for {url} while refreshing")
+            task = asyncio.create_task(self._arefresh(key, url, fetch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return data
+
+    async def _arefresh(self, key: str, url: str, fetch: Callable[[str], Awaitable[List[Dict]]]):
+        try:
+            self.cache.set(key, await fetch(url))
+            self.refreshes += 1
+        except Exception as e:
+            self.refresh_failures += 1
+            logger.warning(f"Background refresh of {url} failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit, miss and refresh counters."""
+        return {
+            "fresh_hits": self.fresh_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "tiers": self.cache.stats(),
+        }
@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Poll quickly right after a job is expected to finish, then back off
+# exponentially so long crawls don't hammer the status endpoint.
+MIN_POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 5.0
+POLL_BACKOFF = 1.5
+HISTORY_WINDOW = 50
+
+
+class CrawlFailedError(RuntimeError):
+    """Raised when a crawl job fails, is cancelled or times out."""
+
+
+def url_pattern(url: str) -> str:
+    """Group URLs whose crawls take similar time: host and path with numbers masked."""
+    parts = urlsplit(url)
+    return re.sub(r"\d+", "#", f"{parts.netloc}{parts.path}".rstrip("/"))
+
+
+class CompletionHistory:
+    """Recent crawl completion times, per URL pattern."""
+
+    def __init__(self, window: int = HISTORY_WINDOW):
+        self.window = window
+        self._durations: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=self.window))
+        self._lock = threading.Lock()
+
+    def record(self, url: str, seconds: float):
+        """Record how long a crawl of url took to complete."""
+        with self._lock:
+            self._durations[url_pattern(url)].append(seconds)
+
+    def estimate(self, url: str) -> Optional[float]:
+        """Return a conservative (lower-quartile) completion time for url, if known."""
+        with self._lock:
+            durations = sorted(self._durations.get(url_pattern(url), ()))
+        if not durations:
+            return None
+        return durations[len(durations) // 4]
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Return sample count and median completion time per URL pattern."""
+        with self._lock:
+            items = [(pattern, sorted(durations)) for pattern, durations in self._durations.items()]
+        return {
+            pattern: {"samples": len(durations), "median": durations[len(durations) // 2]}
+            for pattern, durations in items if durations
+        }
+
+
+def poll_delays(expected: Optional[float] = None,
+                min_interval: float = MIN_POLL_INTERVAL,
+                max_interval: float = MAX_POLL_INTERVAL,
+                backoff: float = POLL_BACKOFF) -> Iterator[float]:
+    """Yield the delays to wait before each status poll.
+
+    Without history, polling starts at min_interval. With an expected
+    completion time, the first poll waits until just before it. Either way
+    the interval then grows by backoff up to max_interval.
+    """
+    if expected is not None and expected > min_interval:
+        yield expected * 0.9
+    interval = min_interval
+    while True:
+        yield interval
+        interval = min(interval * backoff, max_interval)
+
+
+class CrawlJob:
+    """Handle to a submitted crawl job, backed by a Future of its page data."""
+
+    def __init__(self, url: str, manager: "CrawlJobManager"):
+        self.url = url
+        self.job_id: Optional[str] = None
+        self.submitted_at = time.time()
+        self.polls = 0
+        self._manager = manager
+        self._future: Future = Future()
+        self._cancel_event = threading.Event()
+
+    def done(self) -> bool:
+        """Return True if the job has completed, failed or been cancelled."""
+        return self._future.done()
+
+    def result(self, timeout: Optional[float] = None) -> List[Dict]:
+        """Wait for the crawled pages, raising CrawlFailedError if the job failed."""
+        return self._future.result(timeout)
+
+    def add_done_callback(self, fn: Callable[["CrawlJob"], Any]):
+        """Call fn with this job once it finishes."""
+        self._future.add_done_callback(lambda _: fn(self))
+
+    def cancel(self) -> bool:
+        """Stop polling and cancel the remote crawl. Returns False if already finished."""
+        if self.done():
+            return False
+        self._cancel_event.set()
+        self._manager._cancel_remote(self)
+        return True
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+
+class CrawlJobManager:
+    """Submits Firecrawl crawl jobs and polls them on an adaptive schedule."""
+
+    def __init__(self, firecrawl: Any, timeout: float = 300,
+                 history: Optional[CompletionHistory] = None, max_workers: int = 32):
+        self.firecrawl = firecrawl
+        self.timeout = timeout
+        self.history = history or CompletionHistory()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crawl-job")
+
+    def submit(self, url: str, params: Dict[str, Any]) -> CrawlJob:
+        """Submit a crawl of url and return its handle without waiting."""
+        job = CrawlJob(url, self)
+        self._executor.submit(self._run, job, params)
+        return job
+
+    def _run(self, job: CrawlJob, params: Dict[str, Any]):
+        """Submit and poll job in a worker thread, resolving its future."""
+        try:
+            job.job_id = self._submit_remote(job.url, params)
+            if job.cancelled:
+                self._cancel_remote(job)
+            for delay in poll_delays(self.history.estimate(job.url)):
+                if job._cancel_event.wait(self._bounded_delay(job, delay)):
+                    raise CrawlFailedError(f"Crawl {job.job_id} cancelled")
+                data = self._poll(job)
+                if data is not None:
+                    job._future.set_result(data)
+                    return
+        except Exception as e:
+            job._future.set_exception(e)
+
+    async def arun(self, url: str, params: Dict[str, Any]) -> List[Dict]:
+        """Submit a crawl of url and await its pages on the running event loop."""
+        job = CrawlJob(url, self)
+        try:
+            # The Firecrawl client is blocking, so each request runs in a worker
+            # thread; the waits between polls hold no thread at all.
+            job.job_id = await asyncio.to_thread(self._submit_remote, url, params)
+            for delay in poll_delays(self.history.estimate(url)):
+                await asyncio.sleep(self._bounded_delay(job, delay))
+                data = await asyncio.to_thread(self._poll, job)
+                if data is not None:
+                    return data
+        except asyncio.CancelledError:
+            if job.job_id:
+                await asyncio.to_thread(self._cancel_remote, job)
+            raise
+
+    def stream(self, url: str, params: Dict[str, Any],
+               stop: Optional[threading.Event] = None) -> Iterator[List[Dict]]:
+        """Submit a crawl of url and yield its pages in batches as polls find them.
+
+        Firecrawl reports the pages scraped so far while a job runs, so each
+        poll yields the pages added since the one before. Setting stop, or
+        closing the generator, before the crawl finishes cancels the job.
+        """
+        job = CrawlJob(url, self)
+        stop = stop or job._cancel_event
+        finished = False
+        try:
+            if stop.is_set():
+                raise CrawlFailedError(f"Crawl of {url} cancelled before it started")
+            job.job_id = self._submit_remote(url, params)
+            seen = 0
+            # Pages are wanted as they come, so don't wait for the expected
+            # completion time before the first poll.
+            for delay in poll_delays():
+                if stop.wait(self._bounded_delay(job, delay)):
+                    raise CrawlFailedError(f"Crawl {job.job_id} cancelled")
+                pages, finished = self._poll_progress(job)
+                if len(pages) > seen:
+                    yield pages[seen:]
+                    seen = len(pages)
+                if finished:
+                    return
+        finally:
+            if not finished:
+                self._cancel_remote(job)
+
+    async def astream(self, url: str, params: Dict[str, Any]) -> AsyncIterator[List[Dict]]:
+        """Async variant of stream; cancelling the consuming task cancels the job."""
+        job = CrawlJob(url, self)
+        finished = False
+        try:
+            job.job_id = await asyncio.to_thread(self._submit_remote, url, params)
+            seen = 0
+            for delay in poll_delays():
+                await asyncio.sleep(self._bounded_delay(job, delay))
+                pages, finished = await asyncio.to_thread(self._poll_progress, job)
+                if len(pages) > seen:
+                    yield pages[seen:]
+                    seen = len(pages)
+                if finished:
+                    return
+        finally:
+            if not finished and job.job_id:
+                await asyncio.to_thread(self._cancel_remote, job)
+
+    def _submit_remote(self, url: str, params: Dict[str, Any]) -> str:
+        """Start a crawl job and return its id."""
+        response = self.firecrawl.async_crawl_url(url, params=params)
+        job_id = response.get('id')
+        if not job_id:
+            raise CrawlFailedError(f"Crawl submission failed: {response.get('error', response)}")
+        logger.info(f"Submitted crawl {job_id} for URL: {url}")
+        return job_id
+
+    def _poll(self, job: CrawlJob) -> Optional[List[Dict]]:
+        """Check job once; return its pages if completed, None if still running."""
+        pages, finished = self._poll_progress(job)
+        return pages if finished else None
+
+    def _poll_progress(self, job: CrawlJob) -> Tuple[List[Dict], bool]:
+        """Check job once; return the pages scraped so far and whether it has completed."""
+        job.polls += 1
+        status = self.firecrawl.check_crawl_status(job.job_id)
+        state = status.get('status')
+        if state == 'completed':
+            elapsed = time.time() - job.submitted_at
+            self.history.record(job.url, elapsed)
+            logger.info(f"Crawl {job.job_id} completed in {elapsed:.1f}s after {job.polls} polls")
+            return status.get('data', []), True
+        if state in ('failed', 'cancelled'):
+            raise CrawlFailedError(f"Crawl {job.job_id} {state}")
+        return status.get('data') or [], False
+
+    def _bounded_delay(self, job: CrawlJob, delay: float) -> float:
+        """Clamp delay to the job's remaining time, raising once it has timed out."""
+        remaining = job.submitted_at + self.timeout - time.time()
+        if remaining <= 0:
+            self._cancel_remote(job)
+            raise CrawlFailedError(f"Crawl {job.job_id} did not finish within {self.timeout}s")
+        return min(delay, remaining)
+
+    def _cancel_remote(self, job: CrawlJob):
+        """Ask Firecrawl to stop a running job, if it has been submitted."""
+        if not job.job_id:
+            return
+        try:
+            self.firecrawl.cancel_crawl(job.job_id)
+            logger.info(f"Cancelled crawl {job.job_id}")
+        except Exception as e:
+            logger.warning(f"Failed to cancel crawl {job.job_id}: {str(e)}")
+
+    def shutdown(self):
+        """Stop accepting jobs and release the polling threads."""
+        self._executor.shutdown(wait=False)
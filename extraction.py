@@ -0,0 +1,660 @@
+import json
+import logging
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from collections import Counter
+from functools import lru_cache
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+from crawl_jobs import url_pattern
+
+logger = logging.getLogger(__name__)
+
+# Distinct URL patterns counted for pages that yielded no listing; further
+# patterns are counted together under "other".
+MAX_EMPTY_PAGE_PATTERNS = 50
+
+# Cards on a page share a template, so how well a way of splitting the
+# page fits them shows in this many cards from each end; the first and
+# last cards are where a wrong split loses or gains details.
+CARD_SPLIT_SAMPLE = 3
+
+# Starts with a plain digit, which the number pattern below relies on.
+_AMOUNT = r'\d(?:\d{0,2}(?:[.,\u00a0]\d{3})+(?:[.,]\d{1,2})?|\d*(?:[.,]\d{1,2})?)'
+
+# A page's fields are found in two passes over its lower-cased text, one
+# for numbers and one for keywords. Each pattern starts with a plain digit
+# or letter, which lets the regex engine skip straight to where a field
+# can start; case-insensitive letters, anchors or lookarounds in front
+# would have it try every position instead. So checks that look back (a
+# number's start, a word boundary, a deposit's keyword) are made on the
+# matches.
+_NUMBER_FIELD_RE = re.compile(rf'''
+    (?P<amount>{_AMOUNT})\s*
+    (?:
+      (?P<price>dkk|kr\.?|,-)
+    | (?P<size>m²|m2\b|kvm\b|sqm\b)
+    | (?P<rooms>-?\s*(?:room|rm\b|bedroom|værelse|vær\.))
+    | (?P<floor_ordinal>(?:\.|st|nd|rd|th)?\s*(?:floor|sal)\b)
+    )
+''', re.VERBOSE)
+_NUMBER_CHARS = frozenset('0123456789.,')
+_DEPOSIT_BEFORE_RE = re.compile(r'(?:deposit(?:um)?|prepaid\s+rent|forudbetalt\s+leje)\b[^\n\d]{0,30}$')
+# How far before an amount its deposit keyword is looked for.
+_DEPOSIT_WINDOW = 60
+
+# The phrases of each keyword field. Earlier phrases win at equal
+# positions, so "unfurnished" is read before "furnished" can match in it.
+_KEYWORD_PHRASES: Dict[str, List[str]] = {
+    "available_now": [r'available\s+(?:now|immediately)\b', r'ledig\s+nu\b'],
+    "available": [r'available\s+from', r'ledig\s+fra', r'overtagelse(?:sdato)?', r'move-?in\s+date'],
+    "floor": [r'floor', r'etage'],
+    "unfurnished": [r'unfurnished\b', r'not\s+furnished\b', r'umøbleret\b'],
+    "furnished": [r'furnished\b', r'møbleret\b'],
+    "no_pets": [r'no\s+pets\b', r'pets\s+not\s+allowed\b', r'husdyr\s+ikke\s+tilladt\b', r'ingen\s+husdyr\b'],
+    "pets": [r'pets?\s+(?:allowed|ok|welcome)\b', r'pet[\s-]friendly\b', r'husdyr\s+tilladt\b'],
+}
+# Which field a keyword belongs to is read with _KEYWORD_KIND_RE once it
+# is found; naming the groups in the scanning pattern would hide its
+# first letters.
+_KEYWORD_RE = re.compile('|'.join(phrase for phrases in _KEYWORD_PHRASES.values() for phrase in phrases))
+_KEYWORD_KIND_RE = re.compile('|'.join(f"(?P<{name}>{'|'.join(phrases)})"
+                                       for name, phrases in _KEYWORD_PHRASES.items()))
+_AVAILABLE_VALUE_RE = re.compile(r'\s*:?\s*([^\n·|]{1,40})')
+_FLOOR_VALUE_RE = re.compile(r'\s*:?\s*(-?\d+|ground|stuen|st\b|kl\b|basement)')
+
+# Line breaks, with the blank lines after them folded in.
+_LINE_BREAK_RE = re.compile(r'\n\s*')
+_AMOUNT_RE = re.compile(_AMOUNT)
+_LISTING_URL_RE = re.compile(r'/rental-properties/[^?#]*?(?:-id-\d+|/\d+)/?(?:[?#]|$)')
+# Listing links written into a page's text, and the start of the URL
+# around one.
+_TEXT_LISTING_URL_RE = re.compile(r'/rental-properties/[^\s?#()<>\[\]"]*?(?:-id-\d+|/\d+)/?(?=[\s?#()<>\[\]"]|$)')
+_URL_HEAD_RE = re.compile(r'[^\s()<>\[\]"]*$')
+
+_MONTHS = {
+    'january': 1, 'januar': 1, 'jan': 1, 'february': 2, 'februar': 2, 'feb': 2,
+    'march': 3, 'marts': 3, 'mar': 3, 'april': 4, 'apr': 4, 'may': 5, 'maj': 5,
+    'june': 6, 'juni': 6, 'jun': 6, 'july': 7, 'juli': 7, 'jul': 7,
+    'august': 8, 'aug': 8, 'september': 9, 'sept': 9, 'sep': 9,
+    'october': 10, 'oktober': 10, 'oct': 10, 'okt': 10,
+    'november': 11, 'nov': 11, 'december': 12, 'dec': 12,
+}
+_NUMERIC_DATE_RE = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})|(\d{1,2})[./-](\d{1,2})[./-](\d{2,4})')
+_DAY_MONTH_RE = re.compile(r'(\d{1,2})\.?\s+([a-zæøå]+)\.?(?:,?\s+(\d{4}))?', re.IGNORECASE)
+_MONTH_DAY_RE = re.compile(r'([a-z]+)\.?\s+(\d{1,2})(?:st|nd|rd|th)?(?:,?\s+(\d{4}))?', re.IGNORECASE)
+
+_FLOOR_WORDS = {'ground': 0, 'stuen': 0, 'st': 0, 'kl': -1, 'basement': -1}
+
+
+def parse_amount(text: str) -> Optional[float]:
+    """Parse an amount in English ("12,500.00") or Danish ("12.500,00") format."""
+    if text.isdigit():
+        return float(text)
+    text = text.replace('\u00a0', '')
+    last_dot, last_comma = text.rfind('.'), text.rfind(',')
+    if last_dot >= 0 and last_comma >= 0:
+        decimal, thousands = ('.', ',') if last_dot > last_comma else (',', '.')
+        text = text.replace(thousands, '').replace(decimal, '.')
+    elif last_dot >= 0 or last_comma >= 0:
+        separator = '.' if last_dot >= 0 else ','
+        groups = text.split(separator)
+        # "12.500" and "1,250,000" group thousands; "19.5" has a decimal part.
+        if len(groups[0]) <= 3 and all(len(group) == 3 for group in groups[1:]):
+            text = ''.join(groups)
+        else:
+            text = text.replace(separator, '.')
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def parse_available_date(text: str, today: Optional[date] = None) -> Optional[str]:
+    """Parse an availability date like "1 December", "1. december 2026" or "01-12-2026".
+
+    Returns an ISO date. A date without a year is the next such date,
+    allowing for listings that became available within the past month.
+    """
+    today = today or date.today()
+    match = _NUMERIC_DATE_RE.search(text)
+    if match:
+        if match.group(1):
+            year, month, day = int(match.group(1)), int(match.group(2)), int(match.group(3))
+        else:
+            day, month, year = int(match.group(4)), int(match.group(5)), int(match.group(6))
+            if year < 100:
+                year += 2000
+    else:
+        match = _DAY_MONTH_RE.search(text)
+        if match and match.group(2).lower() in _MONTHS:
+            day, month = int(match.group(1)), _MONTHS[match.group(2).lower()]
+        else:
+            match = _MONTH_DAY_RE.search(text)
+            if not match or match.group(1).lower() not in _MONTHS:
+                return None
+            month, day = _MONTHS[match.group(1).lower()], int(match.group(2))
+        year = int(match.group(3)) if match.group(3) else None
+
+    try:
+        if year is not None:
+            return date(year, month, day).isoformat()
+        available = date(today.year, month, day)
+        if available < today - timedelta(days=31):
+            available = date(today.year + 1, month, day)
+        return available.isoformat()
+    except ValueError:
+        return None
+
+
+# Cards on a page mostly repeat a handful of availability dates, and rents
+# and deposits are mostly round amounts.
+_cached_available_date = lru_cache(maxsize=1024)(parse_available_date)
+_cached_amount = lru_cache(maxsize=1024)(parse_amount)
+
+
+def _parse_floor(value: str) -> int:
+    return _FLOOR_WORDS[value.lower()] if value.lower() in _FLOOR_WORDS else int(value)
+
+
+def _whole_number(text: str) -> Optional[int]:
+    return int(text) if text.isdigit() else None
+
+
+def _available_after(text: str, end: int) -> Optional[str]:
+    match = _AVAILABLE_VALUE_RE.match(text, end)
+    return _cached_available_date(match.group(1), date.today()) if match else None
+
+
+def _floor_after(text: str, end: int) -> Optional[int]:
+    match = _FLOOR_VALUE_RE.match(text, end)
+    return _parse_floor(match.group(1)) if match else None
+
+
+# Listing field and parser of the amount for each unit of _NUMBER_FIELD_RE.
+_NUMBER_FIELDS: Dict[str, Tuple[str, Callable[[str], Any]]] = {
+    "price": ("price_dkk", _cached_amount),
+    "size": ("size_m2", _cached_amount),
+    "rooms": ("bedrooms", _whole_number),
+    "floor_ordinal": ("floor", _whole_number),
+}
+
+# Listing field and value parser, given the text and where the phrase
+# ends, for each field of _KEYWORD_PHRASES.
+_KEYWORD_FIELDS: Dict[str, Tuple[str, Callable[[str, int], Any]]] = {
+    "available_now": ("available_from", lambda text, end: date.today().isoformat()),
+    "available": ("available_from", _available_after),
+    "floor": ("floor", _floor_after),
+    "unfurnished": ("furnished", lambda text, end: False),
+    "furnished": ("furnished", lambda text, end: True),
+    "no_pets": ("pets_allowed", lambda text, end: False),
+    "pets": ("pets_allowed", lambda text, end: True),
+}
+
+
+class FieldMatch(NamedTuple):
+    """One field value found in a page's text, with where it was found."""
+    name: str
+    value: Any
+    start: int
+    end: int
+
+
+@dataclass
+class Card:
+    """The text, link and extracted fields of one listing on a crawled page."""
+    text: str
+    url: Optional[str] = None
+    fields: Dict[str, Any] = field(default_factory=dict)
+
+
+def _first_values(matches: List[FieldMatch]) -> Dict[str, Any]:
+    """Return the first value found for each field."""
+    values: Dict[str, Any] = {}
+    for match in matches:
+        if match.name not in values:
+            values[match.name] = match.value
+    return values
+
+
+def _lower(text: str) -> str:
+    """Lower-case text, keeping every character's position."""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    # A few characters lower-case to two; they are kept as they are.
+    return "".join(char.lower() if len(char.lower()) == 1 else char for char in text)
+
+
+def _number_fields(text: str) -> List[FieldMatch]:
+    matches = []
+    for match in _NUMBER_FIELD_RE.finditer(text):
+        start = match.start()
+        if start and text[start - 1] in _NUMBER_CHARS:
+            # The tail of a number that isn't a field itself.
+            continue
+        name, parse = _NUMBER_FIELDS[match.lastgroup]
+        value = parse(match.group(1))
+        if value is None:
+            continue
+        if name == "price_dkk" and _DEPOSIT_BEFORE_RE.search(text, max(0, start - _DEPOSIT_WINDOW), start):
+            name = "deposit_dkk"
+        matches.append(FieldMatch(name, value, start, match.end()))
+    return matches
+
+
+def _keyword_fields(text: str) -> List[FieldMatch]:
+    matches = []
+    for match in _KEYWORD_RE.finditer(text):
+        start = match.start()
+        if start and (text[start - 1].isalnum() or text[start - 1] == "_"):
+            continue
+        kind = _KEYWORD_KIND_RE.match(text, start)
+        name, parse = _KEYWORD_FIELDS[kind.lastgroup]
+        value = parse(text, kind.end())
+        if value is not None:
+            matches.append(FieldMatch(name, value, start, kind.end()))
+    return matches
+
+
+class PageScan:
+    """Every listing field in a page's text, in the order they appear."""
+
+    def __init__(self, text: str):
+        self.text = text
+        lowered = _lower(text)
+        self.matches = _number_fields(lowered) + _keyword_fields(lowered)
+        self.matches.sort(key=attrgetter("start"))
+
+    def fields(self) -> Dict[str, Any]:
+        """Return the first value of each field on the page."""
+        return _first_values(self.matches)
+
+    def cards(self) -> List[Card]:
+        """Split the page into one card per listing, each with its own fields.
+
+        Where the text links each listing, as Markdown does, a card starts
+        at the line holding its link and carries the link. Otherwise cards
+        are cut around their rents.
+        """
+        if sum(match.name == "price_dkk" for match in self.matches) < 2:
+            text = self.text.strip()
+            return [Card(text, fields=self.fields())] if text else []
+        return self._linked_cards() or self._priced_cards()
+
+    def _span_cards(self, starts: List[int], urls: List[Optional[str]]) -> List[Card]:
+        """Cut the text into cards at the character offsets in starts."""
+        match_starts = [match.start for match in self.matches]
+        cards = []
+        for start, end, url in zip(starts, starts[1:] + [len(self.text)], urls):
+            first, last = bisect_left(match_starts, start), bisect_left(match_starts, end)
+            cards.append(Card(self.text[start:end].strip(), url, _first_values(self.matches[first:last])))
+        return cards
+
+    def _linked_cards(self) -> List[Card]:
+        starts: List[int] = []
+        urls: List[Optional[str]] = []
+        for match in _TEXT_LISTING_URL_RE.finditer(self.text):
+            line_start = self.text.rfind("\n", 0, match.start()) + 1
+            url_start = _URL_HEAD_RE.search(self.text, line_start, match.start()).start()
+            url = self.text[url_start:match.end()]
+            # A card often links its listing twice, from its image and title.
+            if url in urls:
+                continue
+            starts.append(line_start if not starts or line_start > starts[-1] else url_start)
+            urls.append(url)
+        return self._span_cards(starts, urls) if len(starts) > 1 else []
+
+    def _priced_cards(self) -> List[Card]:
+        """Cut the text into cards around their rents.
+
+        Every card has one rent, and cards on a page share a template, so
+        each card's title sits the same number of lines before its rent. Of
+        the possible numbers, the one giving the most complete cards without
+        conflicting values is taken: cards that start too late lose their
+        first details to the card before, and cards that start too early
+        take its last ones. Ties go to the split whose cards open with the
+        most distinct titles, lines mostly of words rather than fields, which
+        tells titles from both detail lines and boilerplate ("Show on map");
+        then to the earliest start.
+        """
+        line_starts = [0] + [match.end() for match in _LINE_BREAK_RE.finditer(self.text)]
+        match_lines = [bisect_right(line_starts, match.start) - 1 for match in self.matches]
+        line_fields: Dict[int, Dict[str, Any]] = {}
+        for line, match in zip(match_lines, self.matches):
+            line_fields.setdefault(line, {}).setdefault(match.name, match.value)
+        prices = [line for line, fields in line_fields.items() if "price_dkk" in fields]
+
+        def title(line: int) -> Optional[str]:
+            end = line_starts[line + 1] if line + 1 < len(line_starts) else len(self.text)
+            text = self.text[line_starts[line]:end].strip()
+            matches = self.matches[bisect_left(match_lines, line):bisect_right(match_lines, line)]
+            return text if 2 * sum(match.end - match.start for match in matches) < len(text) else None
+
+        lines = list(line_fields)
+        splits = []
+        for head in range(max(price - previous for previous, price in zip(prices, prices[1:]))):
+            starts = [max(0, prices[0] - head)]
+            starts += [max(previous + 1, price - head) for previous, price in zip(prices, prices[1:])]
+            spans = list(zip(starts, starts[1:] + [len(line_starts)]))
+            sample = spans[:CARD_SPLIT_SAMPLE] + spans[CARD_SPLIT_SAMPLE:][-CARD_SPLIT_SAMPLE:]
+            titles = {title(start) for start, _ in sample} - {None}
+            splits.append((self._completeness(lines, line_fields, sample), len(titles), head, starts))
+        starts = max(splits)[3]
+        return self._span_cards([line_starts[start] for start in starts], [None] * len(starts))
+
+    @staticmethod
+    def _completeness(lines: List[int], line_fields: Dict[int, Dict[str, Any]], spans: List[Tuple[int, int]]) -> int:
+        """Count the fields of the cards spanning spans of lines, less the values that conflict within a card."""
+        score = 0
+        for start, end in spans:
+            card: Dict[str, Any] = {}
+            for line in lines[bisect_left(lines, start):bisect_left(lines, end)]:
+                for name, value in line_fields[line].items():
+                    if card.setdefault(name, value) != value:
+                        score -= 1
+            score += len(card)
+        return score
+
+
+def listing_links(links: List[str]) -> List[str]:
+    """Return the distinct links that point at individual listings, in page order."""
+    return list(dict.fromkeys(link for link in links if _LISTING_URL_RE.search(link)))
+
+
+def extract_text_cards(page: Dict) -> List[Card]:
+    """Extract one card per listing from a crawled page's text, pairing each with its link.
+
+    Cards cut at listing links in the text keep those. Otherwise links are
+    paired with cards by position only when the page has exactly one
+    listing link per card; a page holding a single listing gets its own
+    URL or first listing link.
+    """
+    cards = PageScan(page.get('text', '')).cards()
+    if not cards:
+        return []
+
+    links = listing_links(page.get('links', []))
+    page_url = page.get('url') or page.get('metadata', {}).get('sourceURL')
+
+    if len(cards) == 1:
+        if page_url and _LISTING_URL_RE.search(page_url):
+            cards[0].url = page_url
+        else:
+            cards[0].url = links[0] if links else next(
+                (link for link in page.get('links', []) if '/rental-properties/' in link), None
+            )
+        return cards
+
+    if any(card.url for card in cards):
+        return cards
+    if len(links) != len(cards):
+        logger.debug(f"Page has {len(cards)} cards but {len(links)} listing links; leaving links unpaired")
+        return cards
+    for card, url in zip(cards, links):
+        card.url = url
+    return cards
+
+
+# Embedded structured data: JSON-LD, JSON script blocks (Next.js and similar
+# hydration state) and inline "window.__STATE__ = {...}" assignments.
+_SCRIPT_RE = re.compile(r'<script\b([^>]*)>(.*?)</script\s*>', re.IGNORECASE | re.DOTALL)
+_STATE_ASSIGNMENT_RE = re.compile(r'(?:window\.)?__[A-Za-z0-9_]+__\s*=\s*(?=[{\[])')
+_JSON_DECODER = json.JSONDecoder()
+# How deep to search decoded state for listings; hydration state nests
+# listings a few levels down, never dozens.
+_MAX_STRUCTURED_DEPTH = 12
+
+# Keys listing objects use for each field, in order of preference.
+_PRICE_KEYS = ("monthly_rent", "monthlyRent", "rent", "price")
+_DEPOSIT_KEYS = ("deposit", "deposit_amount", "depositAmount")
+_ROOMS_KEYS = ("rooms", "room_count", "roomCount", "numberOfRooms", "bedrooms", "numberOfBedrooms")
+_SIZE_KEYS = ("size_m2", "sizeM2", "size", "floorSize", "area")
+_FLOOR_KEYS = ("floor",)
+_AVAILABLE_KEYS = ("available_from", "availableFrom", "availabilityStarts", "move_in_date")
+_URL_KEYS = ("absolute_url", "listing_url", "url")
+_TITLE_KEYS = ("title", "headline", "name")
+_FURNISHED_KEYS = ("furnished", "is_furnished", "isFurnished")
+_PETS_KEYS = ("pets_allowed", "petsAllowed", "pets")
+_BOOLEAN_STRINGS = {"true": True, "yes": True, "ja": True, "false": False, "no": False, "nej": False}
+
+
+def _first_value(obj: Dict, keys: Tuple[str, ...]) -> Any:
+    for key in keys:
+        value = obj.get(key)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def _structured_number(value: Any) -> Optional[float]:
+    """Read a number given as a number, a formatted string or a {"value": ...} object."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, dict):
+        return _structured_number(_first_value(value, ("value", "amount", "price")))
+    if isinstance(value, str):
+        match = _AMOUNT_RE.search(value)
+        return parse_amount(match.group(0)) if match else None
+    return None
+
+
+def _structured_flag(value: Any) -> Optional[bool]:
+    """Read a yes/no value given as a boolean or a string such as "true" or "nej"."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return _BOOLEAN_STRINGS.get(value.strip().lower())
+    return None
+
+
+def _structured_card(obj: Dict) -> Optional[Card]:
+    """Build a card from a structured-data object, if it describes a listing.
+
+    A listing has a price, a room count or size, and a URL or title, which
+    tells it apart from search filters that also carry prices and rooms.
+    """
+    offers = obj.get("offers")
+    if isinstance(offers, list):
+        offers = offers[0] if offers else None
+    if not isinstance(offers, dict):
+        offers = {}
+
+    price = _structured_number(_first_value(obj, _PRICE_KEYS) or _first_value(offers, _PRICE_KEYS))
+    rooms = _structured_number(_first_value(obj, _ROOMS_KEYS))
+    size = _structured_number(_first_value(obj, _SIZE_KEYS))
+    url = _first_value(obj, _URL_KEYS) or offers.get("url")
+    title = _first_value(obj, _TITLE_KEYS)
+    if price is None or (rooms is None and size is None) or not (url or title):
+        return None
+
+    fields: Dict[str, Any] = {"price_dkk": price}
+    if rooms is not None:
+        fields["bedrooms"] = int(rooms)
+    if size is not None:
+        fields["size_m2"] = size
+    deposit = _structured_number(_first_value(obj, _DEPOSIT_KEYS) or _first_value(offers, _DEPOSIT_KEYS))
+    if deposit is not None:
+        fields["deposit_dkk"] = deposit
+    floor = _structured_number(_first_value(obj, _FLOOR_KEYS))
+    if floor is not None:
+        fields["floor"] = int(floor)
+    available = _first_value(obj, _AVAILABLE_KEYS) or _first_value(offers, _AVAILABLE_KEYS)
+    if isinstance(available, str):
+        fields["available_from"] = _cached_available_date(available, date.today())
+    for name, keys in (("furnished", _FURNISHED_KEYS), ("pets_allowed", _PETS_KEYS)):
+        flag = _structured_flag(_first_value(obj, keys))
+        if flag is not None:
+            fields[name] = flag
+    return Card(str(title or ""), url if isinstance(url, str) else None, fields)
+
+
+def _collect_structured_cards(obj: Any, cards: List[Card], depth: int = 0):
+    if depth > _MAX_STRUCTURED_DEPTH:
+        return
+    if isinstance(obj, dict):
+        card = _structured_card(obj)
+        if card:
+            cards.append(card)
+            return
+        for value in obj.values():
+            if isinstance(value, (dict, list)):
+                _collect_structured_cards(value, cards, depth + 1)
+    elif isinstance(obj, list):
+        for value in obj:
+            if isinstance(value, (dict, list)):
+                _collect_structured_cards(value, cards, depth + 1)
+
+
+def _embedded_documents(html: str) -> List[Any]:
+    """Decode the JSON documents embedded in an HTML page's script tags."""
+    documents = []
+    for match in _SCRIPT_RE.finditer(html):
+        attributes, body = match.group(1).lower(), match.group(2).strip()
+        if not body:
+            continue
+        try:
+            if 'json' in attributes:
+                documents.append(json.loads(body))
+                continue
+            for assignment in _STATE_ASSIGNMENT_RE.finditer(body):
+                documents.append(_JSON_DECODER.raw_decode(body, assignment.end())[0])
+        except ValueError as e:
+            logger.debug(f"Skipping undecodable embedded data: {str(e)}")
+    return documents
+
+
+def extract_structured_cards(page: Dict) -> List[Card]:
+    """Extract listing cards from the structured data embedded in a page's raw HTML."""
+    html = page.get('rawHtml') or page.get('html') or ''
+    if '<script' not in html:
+        return []
+
+    cards: List[Card] = []
+    for document in _embedded_documents(html):
+        _collect_structured_cards(document, cards)
+
+    # The same listing is often in both JSON-LD and hydration state.
+    unique: Dict[Any, Card] = {}
+    for card in cards:
+        unique.setdefault(card.url or id(card), card)
+    return list(unique.values())
+
+
+def _listing_path(url: str) -> str:
+    return urlsplit(url).path.rstrip("/")
+
+
+def _card_figures(card: Card) -> Tuple[Any, Any, Any]:
+    return card.fields.get("price_dkk"), card.fields.get("bedrooms"), card.fields.get("size_m2")
+
+
+def merge_cards(structured: List[Card], text_cards: List[Card]) -> List[Card]:
+    """Combine a page's structured and text cards into one card per listing.
+
+    A text card is matched to the structured card with the same listing
+    path or, failing that, the same rent, rooms and size. Structured values
+    are exact, so they win; the text card adds the fields they lack. Text
+    cards with a rent that match no structured card are listings the
+    structured data left out, and follow the structured ones.
+    """
+    by_path = {_listing_path(card.url): card for card in structured if card.url}
+    by_figures: Dict[Tuple[Any, Any, Any], Card] = {}
+    for card in structured:
+        by_figures.setdefault(_card_figures(card), card)
+
+    merged = list(structured)
+    matched = set()
+    for card in text_cards:
+        match = by_path.get(_listing_path(card.url)) if card.url else None
+        if match is None or id(match) in matched:
+            match = by_figures.get(_card_figures(card))
+        if match is None or id(match) in matched:
+            if "price_dkk" in card.fields:
+                merged.append(card)
+            continue
+        matched.add(id(match))
+        match.fields = {**card.fields, **match.fields}
+        match.url = match.url or card.url
+        match.text = match.text or card.text
+    return merged
+
+
+def extract_page(page: Dict) -> List[Card]:
+    """Extract one card per listing from a crawled page.
+
+    Uses the page's embedded structured data when it describes listings,
+    which gives exact values, merged with the cards in its text; otherwise
+    the text cards alone.
+    """
+    structured = extract_structured_cards(page)
+    text_cards = extract_text_cards(page)
+    return merge_cards(structured, text_cards) if structured else text_cards
+
+
+class PageExtractor:
+    """Extracts listing cards from pages like extract_page, counting which path each page took.
+
+    Pages that yield no listing, or only text without a rent, are also
+    counted by URL pattern: each one was a crawl credit spent for nothing,
+    and the patterns show what the crawl scope should exclude.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.structured_pages = 0
+        self.text_pages = 0
+        self.empty_pages = 0
+        self.structured_listings = 0
+        self.text_listings = 0
+        self.empty_page_patterns: Counter = Counter()
+
+    def extract(self, page: Dict) -> List[Card]:
+        """Extract the cards on page."""
+        structured = extract_structured_cards(page)
+        cards = extract_text_cards(page)
+        if structured:
+            cards = merge_cards(structured, cards)
+
+        with self._lock:
+            if structured:
+                self.structured_pages += 1
+                self.structured_listings += len(structured)
+                self.text_listings += len(cards) - len(structured)
+            elif any("price_dkk" in card.fields for card in cards):
+                self.text_pages += 1
+                self.text_listings += len(cards)
+            else:
+                # A page whose text holds no rent, such as a help or login
+                # page, still comes back as one card; no search matches it.
+                self.empty_pages += 1
+                self._count_empty_page(page)
+        return cards
+
+    def _count_empty_page(self, page: Dict):
+        url = page.get('url') or page.get('metadata', {}).get('sourceURL')
+        pattern = url_pattern(url) if url else "unknown"
+        if pattern not in self.empty_page_patterns and len(self.empty_page_patterns) >= MAX_EMPTY_PAGE_PATTERNS:
+            pattern = "other"
+        self.empty_page_patterns[pattern] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return page and listing counts per extraction path, and empty pages by URL pattern."""
+        with self._lock:
+            pages = self.structured_pages + self.text_pages + self.empty_pages
+            return {
+                "structured_pages": self.structured_pages,
+                "text_pages": self.text_pages,
+                "empty_pages": self.empty_pages,
+                "empty_page_share": self.empty_pages / pages if pages else 0.0,
+                "empty_page_patterns": dict(self.empty_page_patterns.most_common()),
+                "structured_listings": self.structured_listings,
+                "text_listings": self.text_listings,
+            }
@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import re
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from crawl_jobs import CrawlJob, CrawlJobManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+)
+
+
+# Path patterns of pages a results crawl never needs: account, help and
+# marketing pages linked from every page of the site.
+DEFAULT_EXCLUDE_PATHS = [
+    r"/(?:login|log-in|signin|sign-in|signup|sign-up|register|logout|account|user|profile|favourites|favorites)(?:/|$)",
+    r"/(?:help|faq|support|contact|about|about-us|press|blog|news|jobs|careers)(?:/|$)",
+    r"/(?:terms|privacy|cookies|cookie-policy|conditions|gdpr)(?:/|$)",
+    r"/(?:create-listing|landlord|udlejer|pricing|subscription|payment)(?:/|$)",
+]
+
+# A listing's own page, as opposed to a page of search results.
+LISTING_PATH = r"(?:-id-\d+|/\d+)/?$"
+
+
+@dataclass
+class CrawlScope:
+    """Which pages a crawl of a search results URL may visit.
+
+    Built into Firecrawl's includePaths, excludePaths and maxDepth for each
+    search URL. By default the crawl keeps to the results page itself (and
+    its further pages, which share its path) and the listings it links to.
+    With listings_only, only the listings are crawled after the results
+    page. exclude_paths always win over the include patterns.
+    """
+    max_depth: int = 2
+    listings_only: bool = False
+    include_paths: List[str] = field(default_factory=list)
+    exclude_paths: List[str] = field(default_factory=lambda: list(DEFAULT_EXCLUDE_PATHS))
+
+    def include_patterns(self, url: str) -> List[str]:
+        """Return the path patterns a crawl starting at url may follow."""
+        path = urlsplit(url).path.rstrip("/")
+        # Listings are filed under the site's listings root, not always
+        # under the results path they were found from.
+        root, found, _ = path.partition("/rental-properties")
+        listings_root = root + found if found else path.rsplit("/", 1)[0]
+        patterns = [f"^{re.escape(listings_root)}/.*{LISTING_PATH}"]
+        if not self.listings_only:
+            patterns.append(f"^{re.escape(path)}/?$")
+        return patterns + self.include_paths
+
+    @staticmethod
+    def skip_patterns(url: str, skip_urls: Sequence[str]) -> List[str]:
+        """Return exclude patterns for the listing pages among skip_urls.
+
+        Only listings' own pages are skipped: results pages, the one at url
+        and its further pages alike, are where new listings appear, and
+        excludes win over includes. Each pattern matches a page's path and
+        query exactly, so it never covers other pages under the same path.
+        """
+        search_path = urlsplit(url).path.rstrip("/")
+        patterns = []
+        for skip_url in skip_urls:
+            parts = urlsplit(skip_url)
+            path = parts.path.rstrip("/")
+            if path == search_path or not re.search(LISTING_PATH, path):
+                continue
+            query = rf"\?{re.escape(parts.query)}" if parts.query else ""
+            patterns.append(f"^{re.escape(path)}/?{query}$")
+        return patterns
+
+    def params(self, url: str, skip_urls: Sequence[str] = ()) -> Dict[str, Any]:
+        """Firecrawl crawl parameters restricting a crawl of url to this scope, minus skip_urls."""
+        return {
+            'includePaths': self.include_patterns(url),
+            'excludePaths': list(self.exclude_paths) + self.skip_patterns(url, skip_urls),
+            'maxDepth': self.max_depth,
+            # The sitemap lists every page on the site; only follow links
+            # from the results page.
+            'ignoreSitemap': True,
+        }
+
+
+class FetchBackend(ABC):
+    """Fetches the pages of a search results URL.
+
+    Pages are dicts shaped like Firecrawl documents: 'text', 'links' and,
+    where available, 'rawHtml' and 'url'.
+    """
+
+    name = ""
+    # Whether submit() runs crawls as jobs to wait on or cancel.
+    runs_jobs = False
+
+    @abstractmethod
+    def fetch(self, url: str) -> List[Dict]:
+        """Fetch the pages for url."""
+
+    async def afetch(self, url: str) -> List[Dict]:
+        """Fetch the pages for url without blocking the event loop."""
+        return await asyncio.to_thread(self.fetch, url)
+
+    def stream(self, url: str, stop: Optional[threading.Event] = None) -> Iterator[List[Dict]]:
+        """Yield the pages for url in batches as they arrive, until done or stop is set.
+
+        Backends that fetch every page at once yield them as one batch.
+        """
+        yield self.fetch(url)
+
+    async def astream(self, url: str) -> AsyncIterator[List[Dict]]:
+        """Yield the pages for url in batches as they arrive, without blocking the event loop."""
+        yield await self.afetch(url)
+
+    def fetch_new(self, url: str, skip_urls: Sequence[str]) -> List[Dict]:
+        """Fetch the pages for url, leaving out the already known pages skip_urls where possible.
+
+        Backends that fetch only the results page itself have nothing to
+        skip and fetch it in full.
+        """
+        return self.fetch(url)
+
+    def submit(self, url: str) -> CrawlJob:
+        """Submit a crawl of url and return a handle to wait on or cancel; see runs_jobs."""
+        raise NotImplementedError(f"The {self.name} backend doesn't run crawl jobs")
+
+    def completion_times(self) -> Optional[Dict[str, Dict[str, float]]]:
+        """Return recent crawl completion times per URL pattern, if this backend keeps them."""
+        return None
+
+    def close(self):
+        """Release any pooled resources."""
+
+
+class FirecrawlBackend(FetchBackend):
+    """Crawls through Firecrawl jobs, polled on an adaptive schedule."""
+
+    name = "firecrawl"
+    runs_jobs = True
+
+    def __init__(self, firecrawl: Any, page_limit: int = 15, timeout: float = 300,
+                 scope: Optional[CrawlScope] = None):
+        self.page_limit = page_limit
+        self.scope = scope or CrawlScope()
+        self.jobs = CrawlJobManager(firecrawl, timeout=timeout)
+
+    def crawl_params(self, url: str, skip_urls: Sequence[str] = ()) -> Dict[str, Any]:
+        """Firecrawl parameters for crawling the search results page at url, skipping skip_urls."""
+        return {
+            'limit': self.page_limit,
+            **self.scope.params(url, skip_urls),
+            'scrapeOptions': {
+                # rawHtml carries the structured data (JSON-LD, hydration
+                # state) that listings are extracted from when present.
+                'formats': ['text', 'links', 'rawHtml']
+            }
+        }
+
+    def submit(self, url: str) -> CrawlJob:
+        """Submit a crawl of url and return a handle to wait on or cancel."""
+        return self.jobs.submit(url, self.crawl_params(url))
+
+    def fetch(self, url: str) -> List[Dict]:
+        return self.submit(url).result()
+
+    def fetch_new(self, url: str, skip_urls: Sequence[str]) -> List[Dict]:
+        # Skipped pages also leave the page limit for pages not seen yet.
+        return self.jobs.submit(url, self.crawl_params(url, skip_urls)).result()
+
+    async def afetch(self, url: str) -> List[Dict]:
+        return await self.jobs.arun(url, self.crawl_params(url))
+
+    def stream(self, url: str, stop: Optional[threading.Event] = None) -> Iterator[List[Dict]]:
+        return self.jobs.stream(url, self.crawl_params(url), stop)
+
+    async def astream(self, url: str) -> AsyncIterator[List[Dict]]:
+        async for pages in self.jobs.astream(url, self.crawl_params(url)):
+            yield pages
+
+    def completion_times(self) -> Optional[Dict[str, Dict[str, float]]]:
+        return self.jobs.history.stats()
+
+    def close(self):
+        self.jobs.shutdown()
+
+
+class _PageParser(HTMLParser):
+    """Collects visible text and link targets from an HTML page."""
+
+    BLOCK_TAGS = {
+        "p", "div", "br", "li", "ul", "ol", "tr", "td", "th", "table", "section",
+        "article", "header", "footer", "h1", "h2", "h3", "h4", "h5", "h6", "a",
+    }
+    SKIP_TAGS = {"script", "style", "noscript", "template", "svg"}
+
+    def __init__(self, base_url: str):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.lines: List[str] = []
+        self.links: List[str] = []
+        self._current: List[str] = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag: str, attrs: List[Any]):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self._break_line()
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href and not href.startswith(("#", "javascript:", "mailto:", "tel:")):
+                self.links.append(urljoin(self.base_url, href))
+
+    def handle_endtag(self, tag: str):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self.BLOCK_TAGS:
+            self._break_line()
+
+    def handle_data(self, data: str):
+        if not self._skip_depth:
+            self._current.append(data)
+
+    def _break_line(self):
+        line = " ".join("".join(self._current).split())
+        if line:
+            self.lines.append(line)
+        self._current = []
+
+    def close(self):
+        super().close()
+        self._break_line()
+
+
+def html_to_page(url: str, html: str) -> Dict[str, Any]:
+    """Convert an HTML document to a Firecrawl-shaped page dict."""
+    parser = _PageParser(url)
+    parser.feed(html)
+    parser.close()
+    return {
+        "url": url,
+        "text": "\n".join(parser.lines),
+        "links": list(dict.fromkeys(parser.links)),
+        "rawHtml": html,
+    }
+
+
+class DirectHTTPBackend(FetchBackend):
+    """Fetches the results page directly over a pooled keep-alive session."""
+
+    name = "http"
+
+    def __init__(self, pool_size: int = 10, timeout: float = 15,
+                 user_agent: str = DEFAULT_USER_AGENT, session: Optional[requests.Session] = None):
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        retry = Retry(total=2, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=("GET",))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "User-Agent": user_agent,
+            "Accept": "text/html,application/xhtml+xml",
+            "Accept-Language": "en,da;q=0.8",
+        })
+
+    def fetch(self, url: str) -> List[Dict]:
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        logger.info(f"Fetched {url} in {response.elapsed.total_seconds():.2f}s")
+        return [html_to_page(response.url, response.text)]
+
+    def close(self):
+        self.session.close()
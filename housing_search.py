@@ -1,17 +1,35 @@
 import os
-from typing import Dict, List, Any, Optional
-from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Deque, Dict, Iterator, List, Any, NamedTuple, Optional, Set, Tuple, Union
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
 import logging
 import json
 from datetime import datetime
-import re
+from urllib.parse import urljoin
 
 from dotenv import load_dotenv
 from firecrawl import FirecrawlApp
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from swarm import Agent
 from swarm.repl import run_demo_loop
 
+from cache import CrawlCache, DiskCache, LRUCache, PageCollector, ResultCache, TieredCache, canonicalize_url
+from crawl_jobs import CrawlJob
+from extraction import PageExtractor
+from fetch_backends import CrawlScope, DirectHTTPBackend, FetchBackend, FirecrawlBackend
+from incremental import SeenStore, page_hash
+from listings import Listing, compile_predicate
+from query_parser import normalize_query, parse_query_rules
+from replay import (CRAWLS, Corpus, RecordingBackend, RecordingOpenAI, ReplayBackend, ReplayOpenAI,
+                    parse_latency)
+from sessions import DEFAULT_SESSION_ID, SearchSession, SessionStore
+from singleflight import SharedStream, SingleFlight
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -19,10 +37,83 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Queries per batched parse request, bounded by characters as well to stay
+# well inside the model's context window.
+BATCH_PARSE_SIZE = 40
+BATCH_PARSE_MAX_CHARS = 6000
+
+# Crawl settings shared by the blocking and asyncio search paths.
+CRAWL_PAGE_LIMIT = 15
+# Link depth a crawl may follow from the results page; see CrawlScope.
+CRAWL_MAX_DEPTH = 2
+CRAWL_TIMEOUT = 300
+DEFAULT_FETCH_BACKEND = "firecrawl"
+
+# A search for "N or more rooms" crawls one results URL per room count from
+# N up to this; homes with more rooms are rare enough to leave out.
+ROOM_FANOUT_MAX = 5
+# Results URLs crawled at once for one search. Each search has its own
+# workers, so concurrent searches don't queue behind each other's crawls;
+# a search over several locations crawls every location's URLs under this
+# same limit.
+CRAWL_FANOUT_WORKERS = 4
+# Streamed searches whose time to first result is kept for metrics().
+STREAM_TIMING_WINDOW = 200
+# Largest streamed crawl kept to be cached, in bytes of JSON; a larger one
+# would have to be held whole while it streams, so it isn't cached.
+STREAM_CACHE_MAX_BYTES = 8 * 1024 * 1024
+# Listings shown per response; the rest are kept for the session and shown
+# on request by show_more_results.
+RESULT_PAGE_SIZE = 10
+NO_STORED_RESULTS = "There are no search results to follow up on yet. What are you looking for?"
+
+# Criteria boligportal's search can filter on, mapped to the query parameter
+# and an encoder for the value. An encoder returns None for values the
+# portal can't filter on. Those values, and criteria missing from this
+# table, are applied client-side only. Location and rooms are path segments,
+# so they are always filtered server-side. Every criterion is also checked
+# client-side by the compiled predicate.
+PORTAL_FILTERS: Dict[str, Tuple[str, Callable[[Any], Optional[str]]]] = {
+    "max_price": ("max_monthly_rent", str),
+    "property_type": ("housing_type", lambda value: value if value != "all" else None),
+    "min_size_m2": ("min_size_m2", lambda value: str(value) if value else None),
+    "max_size_m2": ("max_size_m2", str),
+    "furnished": ("furnished", lambda value: "true" if value else None),
+    "pets_allowed": ("pets_allowed", lambda value: "true" if value else None),
+    "immediate_availability": ("available_immediately", lambda value: "true" if value else None),
+}
+
+QUERY_PARSE_PROMPT = """Extract housing search criteria from the query.
+Return a JSON object with:
+- location: city name, or a list of city names when the query asks for several
+- max_price: maximum price in DKK (number only)
+- min_bedrooms: number of rooms (number only)
+- property_type: apartment
+Only when the query states them, also include:
+- min_size_m2, max_size_m2: size bounds in square meters (numbers only)
+- furnished, pets_allowed, immediate_availability: true or false
+
+Example: "apartment in copenhagen 2 rooms under 19000dkk per month"
+Should return: {
+    "location": "copenhagen",
+    "max_price": 19000,
+    "min_bedrooms": 2,
+    "property_type": "apartment"
+}"""
+
+class PlannedCrawl(NamedTuple):
+    """One results URL a search crawls, with the location and room count it covers."""
+    url: str
+    location: str
+    rooms: int
+
 @dataclass
 class HousingCriteria:
-    """Housing search criteria."""
-    location: str
+    """Housing search criteria.
+
+    location is a city name, or a list of city names to search together.
+    """
+    location: Union[str, List[str]]
     max_price: int
     min_bedrooms: int
     property_type: str = "all"
@@ -32,6 +123,42 @@ class HousingCriteria:
     immediate_availability: Optional[bool] = None
     pets_allowed: Optional[bool] = None
 
+    def __post_init__(self):
+        if not self.locations():
+            raise ValueError("At least one location is required")
+
+    def locations(self) -> List[str]:
+        """Return the locations to search, in the order given, without repeats."""
+        if isinstance(self.location, str):
+            return [self.location] if self.location else []
+        return list(dict.fromkeys(location for location in self.location if location))
+
+    def room_counts(self) -> range:
+        """Return the room counts searched: min_bedrooms up to ROOM_FANOUT_MAX, or exactly min_bedrooms above it."""
+        return range(self.min_bedrooms, max(self.min_bedrooms, ROOM_FANOUT_MAX) + 1)
+
+    def covers(self, other: "HousingCriteria") -> bool:
+        """Return whether every listing other matches is among this search's results.
+
+        True when other searches a subset of the same locations and room
+        counts and is at least as strict on every other criterion, so its
+        results can be filtered from this search's without crawling. The
+        property type must be the same: listings take theirs from the search
+        URL, not the page.
+        """
+        def at_most(narrow: Optional[float], broad: Optional[float]) -> bool:
+            return broad is None or (narrow is not None and narrow <= broad)
+
+        return (set(other.locations()) <= set(self.locations())
+                and set(other.room_counts()) <= set(self.room_counts())
+                and other.max_price <= self.max_price
+                and self.property_type == other.property_type
+                and (other.min_size_m2 or 0) >= (self.min_size_m2 or 0)
+                and at_most(other.max_size_m2, self.max_size_m2)
+                and self.furnished in (None, other.furnished)
+                and (other.pets_allowed or not self.pets_allowed)
+                and (other.immediate_availability or not self.immediate_availability))
+
 class HousingSearchAgent:
     """Housing search agent specialized for boligportal.dk."""
     
@@ -39,26 +166,161 @@ class HousingSearchAgent:
         """Initialize the housing search agent."""
         load_dotenv()
         self._init_clients()
+        self.parse_cache = self._init_parse_cache()
+        self.crawl_cache = self._init_crawl_cache()
+        self.crawl_flights = SingleFlight()
+        self.crawl_streams = SharedStream()
+        self.stream_cache_max_bytes = int(os.getenv("STREAM_CACHE_MAX_BYTES", STREAM_CACHE_MAX_BYTES))
+        self.result_cache = ResultCache(HousingCriteria.covers, max_entries=int(os.getenv("RESULT_CACHE_SIZE", "128")),
+                                        ttl=float(os.getenv("RESULT_CACHE_TTL", "300")),
+                                        locations=HousingCriteria.locations)
+        self.seen_store = self._init_seen_store()
+        self.streamed_searches = 0
+        self.early_stops = 0
+        max_results = os.getenv("SEARCH_MAX_RESULTS")
+        self.max_results = int(max_results) if max_results else None
+        self.first_result_times: Deque[float] = deque(maxlen=STREAM_TIMING_WINDOW)
+        self.sessions = SessionStore(max_sessions=int(os.getenv("SESSION_MAX", "1024")),
+                                     ttl=float(os.getenv("SESSION_TTL", "3600")))
+        self.page_size = int(os.getenv("RESULT_PAGE_SIZE", RESULT_PAGE_SIZE))
+        self.extractor = PageExtractor()
+        self.fanout_workers = int(os.getenv("CRAWL_FANOUT_WORKERS", CRAWL_FANOUT_WORKERS))
         self.agents = self._init_agents()
         self.base_url = "https://www.boligportal.dk/en"
         self.last_criteria = None
         self.last_url = None
 
     def _init_clients(self):
-        """Initialize API clients."""
+        """Initialize API clients.
+
+        With REPLAY_CORPUS set, crawls and completions are served from a
+        recorded corpus (with latency injected per REPLAY_LATENCY) and no API
+        keys are needed. With RECORD_CORPUS set, live responses are recorded
+        to that corpus.
+        """
         try:
+            self.fetch_backends: Dict[str, FetchBackend] = {}
+            self.default_backend = os.getenv("FETCH_BACKEND", DEFAULT_FETCH_BACKEND)
+
+            replay_path = os.getenv("REPLAY_CORPUS")
+            if replay_path:
+                self._init_replay_clients(replay_path)
+                return
+
             api_key = self._get_env_var("FIRECRAWL_API_KEY")
             logger.info("Initializing FirecrawlApp...")
             self.firecrawl = FirecrawlApp(api_key=api_key)
             logger.info("FirecrawlApp initialized successfully")
+
+            self.register_fetch_backend(
+                FirecrawlBackend(self.firecrawl, page_limit=CRAWL_PAGE_LIMIT, timeout=CRAWL_TIMEOUT,
+                                 scope=self._crawl_scope())
+            )
+            self.register_fetch_backend(DirectHTTPBackend())
+            self._get_backend(self.default_backend)
             
-            self.openai = OpenAI(api_key=self._get_env_var("OPENAI_API_KEY"))
+            openai_api_key = self._get_env_var("OPENAI_API_KEY")
+            self.openai = OpenAI(api_key=openai_api_key)
+            self.async_openai = AsyncOpenAI(api_key=openai_api_key)
             logger.info("OpenAI client initialized successfully")
+
+            record_path = os.getenv("RECORD_CORPUS")
+            if record_path:
+                corpus = Corpus(record_path)
+                for backend in list(self.fetch_backends.values()):
+                    self.register_fetch_backend(RecordingBackend(backend, corpus))
+                self.openai = RecordingOpenAI(self.openai, corpus)
+                self.async_openai = RecordingOpenAI(self.async_openai, corpus, is_async=True)
+                logger.info(f"Recording crawls and completions to {record_path}")
             
         except Exception as e:
             logger.error(f"Failed to initialize API clients: {str(e)}")
             raise
 
+    def _init_replay_clients(self, path: str):
+        """Serve crawls and completions from the recorded corpus at path."""
+        corpus = Corpus(path)
+        latency = parse_latency(os.getenv("REPLAY_LATENCY"))
+        self.firecrawl = None
+        recorded = {key.split(":", 1)[0] for key in corpus.keys(CRAWLS)}
+        for name in recorded | {self.default_backend}:
+            self.register_fetch_backend(ReplayBackend(corpus, name=name, latency=latency))
+        self.openai = ReplayOpenAI(corpus, latency)
+        self.async_openai = ReplayOpenAI(corpus, latency, is_async=True)
+        logger.info(f"Replaying crawls and completions from {path}")
+
+    @staticmethod
+    def _crawl_scope() -> CrawlScope:
+        """Build the crawl scope from environment settings.
+
+        CRAWL_SCOPE=listings crawls only the listings linked from each
+        results page; the default also follows further results pages.
+        """
+        return CrawlScope(
+            max_depth=int(os.getenv("CRAWL_MAX_DEPTH", CRAWL_MAX_DEPTH)),
+            listings_only=os.getenv("CRAWL_SCOPE", "results") == "listings",
+        )
+
+    def _init_parse_cache(self) -> TieredCache:
+        """Initialize the cache of parsed queries.
+
+        PARSE_CACHE_SIZE and PARSE_CACHE_TTL (seconds) bound the cache;
+        PARSE_CACHE_PATH enables an on-disk tier that survives restarts.
+        """
+        max_entries = int(os.getenv("PARSE_CACHE_SIZE", "1024"))
+        ttl = float(os.getenv("PARSE_CACHE_TTL", str(7 * 24 * 3600)))
+        disk = None
+        path = os.getenv("PARSE_CACHE_PATH")
+        if path:
+            try:
+                disk = DiskCache(path, max_entries=max_entries * 10, ttl=ttl)
+                logger.info(f"Parse cache persisted to {path}")
+            except Exception as e:
+                logger.warning(f"Failed to open parse cache at {path}: {str(e)}")
+        return TieredCache(LRUCache(max_entries=max_entries, ttl=ttl), disk)
+
+    def _init_seen_store(self) -> SeenStore:
+        """Initialize the record of pages and listings seen by refresh_search.
+
+        SEEN_STORE_PATH persists it across restarts; otherwise it is kept
+        in memory.
+        """
+        path = os.getenv("SEEN_STORE_PATH")
+        if path:
+            try:
+                store = SeenStore(path)
+                logger.info(f"Seen listings persisted to {path}")
+                return store
+            except Exception as e:
+                logger.warning(f"Failed to open seen store at {path}: {str(e)}")
+        return SeenStore()
+
+    def _init_crawl_cache(self) -> CrawlCache:
+        """Initialize the cache of crawl results.
+
+        Results younger than CRAWL_CACHE_TTL seconds are served as is; up to
+        CRAWL_CACHE_STALE_TTL seconds older they are served while a refresh
+        runs in the background. CRAWL_CACHE_SIZE and CRAWL_CACHE_MEMORY_BYTES
+        bound the in-memory tier, as crawled pages with their raw HTML run
+        to megabytes; CRAWL_CACHE_PATH enables an on-disk tier bounded by
+        CRAWL_CACHE_MAX_BYTES.
+        """
+        max_entries = int(os.getenv("CRAWL_CACHE_SIZE", "256"))
+        ttl = float(os.getenv("CRAWL_CACHE_TTL", "300"))
+        stale_ttl = float(os.getenv("CRAWL_CACHE_STALE_TTL", "1800"))
+        disk = None
+        path = os.getenv("CRAWL_CACHE_PATH")
+        if path:
+            max_bytes = int(os.getenv("CRAWL_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+            try:
+                disk = DiskCache(path, max_entries=max_entries * 10, ttl=ttl + stale_ttl, max_bytes=max_bytes)
+                logger.info(f"Crawl cache persisted to {path}")
+            except Exception as e:
+                logger.warning(f"Failed to open crawl cache at {path}: {str(e)}")
+        memory_bytes = int(os.getenv("CRAWL_CACHE_MEMORY_BYTES", str(128 * 1024 * 1024)))
+        memory = LRUCache(max_entries=max_entries, ttl=ttl + stale_ttl, max_bytes=memory_bytes)
+        return CrawlCache(TieredCache(memory, disk), ttl=ttl, stale_ttl=stale_ttl)
+
     @staticmethod
     def _get_env_var(name: str) -> str:
         """Safely get environment variable."""
@@ -67,43 +329,327 @@ class HousingSearchAgent:
             raise ValueError(f"Missing environment variable: {name}")
         return value
 
-    def search_housing(self, query: str) -> str:
-        """Parse query and search for housing."""
+    def search_housing(self, query: str, max_results: int = 0, backend: str = "",
+                       context_variables: Optional[Dict[str, Any]] = None) -> str:
+        """Parse query and search for housing.
+
+        With max_results, or SEARCH_MAX_RESULTS set, the search stops
+        crawling once that many matching listings are found. backend
+        selects a fetch backend for this search only. The response shows
+        the first RESULT_PAGE_SIZE listings; all of them are kept for the
+        session named by context_variables["session_id"], for follow-ups
+        such as show_more_results to use without searching again.
+        """
+        search_url = None
         try:
             # Parse the natural language query into criteria
             criteria = self._parse_query(query)
             self.last_criteria = criteria
+            search_url = self.construct_search_url(criteria)
             
             # Perform the search
-            search_results = self._execute_search(criteria)
+            # Swarm passes tool arguments as the model wrote them, possibly as strings
+            search_results = self._execute_search(criteria, backend=backend or None,
+                                                  max_results=int(max_results or 0) or self.max_results)
             
-            # Format and return the results
-            return self._construct_response(search_results.get("listings", []))
+            # Keep the results for follow-ups and show the first page
+            return self._remember_results(self._session_id(context_variables), criteria, search_results, search_url)
             
         except Exception as e:
             logger.error(f"Error in search_housing: {str(e)}")
-            return f"Sorry, I encountered an error. You can try searching directly at: {self.last_url}"
+            return self._error_response(search_url)
+
+    async def asearch_housing(self, query: str, backend: Optional[str] = None,
+                              max_results: Optional[int] = None, session_id: str = DEFAULT_SESSION_ID) -> str:
+        """Parse query and search for housing on the running event loop.
+
+        Equivalent to search_housing, but parsing and crawling never block,
+        so one event loop can serve many searches concurrently. backend
+        selects a fetch backend for this search only.
+        """
+        search_url = None
+        try:
+            criteria = await self._aparse_query(query)
+            self.last_criteria = criteria
+            search_url = self.construct_search_url(criteria)
+
+            search_results = await self._aexecute_search(criteria, backend=backend,
+                                                         max_results=max_results or self.max_results)
+
+            return self._remember_results(session_id, criteria, search_results, search_url)
+
+        except Exception as e:
+            logger.error(f"Error in asearch_housing: {str(e)}")
+            return self._error_response(search_url)
+
+    def stream_housing(self, query: str, backend: Optional[str] = None,
+                       max_results: Optional[int] = None, session_id: str = DEFAULT_SESSION_ID) -> Iterator[str]:
+        """Parse query and yield the response piece by piece, each listing as soon as it is found.
+
+        The pieces read like search_housing's response, except that every
+        listing is shown and the number found comes last. The listings are
+        kept for session_id once the last piece is yielded.
+        """
+        search_url = None
+        try:
+            criteria = self._parse_query(query)
+            self.last_criteria = criteria
+            search_url = self.construct_search_url(criteria)
+            several_locations = len(criteria.locations()) > 1
+
+            found = []
+            for listing in self.stream_search(criteria, backend=backend, max_results=max_results or self.max_results):
+                found.append(listing)
+                yield self._render_listing(len(found), listing, several_locations)
+            self.sessions.put(session_id, SearchSession(criteria, found, search_url, shown=len(found)))
+            yield self._render_summary(len(found), search_url)
+
+        except Exception as e:
+            logger.error(f"Error in stream_housing: {str(e)}")
+            yield self._error_response(search_url)
+
+    async def astream_housing(self, query: str, backend: Optional[str] = None, max_results: Optional[int] = None,
+                              session_id: str = DEFAULT_SESSION_ID) -> AsyncIterator[str]:
+        """Async variant of stream_housing."""
+        search_url = None
+        try:
+            criteria = await self._aparse_query(query)
+            self.last_criteria = criteria
+            search_url = self.construct_search_url(criteria)
+            several_locations = len(criteria.locations()) > 1
+
+            found = []
+            listings = self.astream_search(criteria, backend=backend, max_results=max_results or self.max_results)
+            async for listing in listings:
+                found.append(listing)
+                yield self._render_listing(len(found), listing, several_locations)
+            self.sessions.put(session_id, SearchSession(criteria, found, search_url, shown=len(found)))
+            yield self._render_summary(len(found), search_url)
+
+        except Exception as e:
+            logger.error(f"Error in astream_housing: {str(e)}")
+            yield self._error_response(search_url)
+
+    def show_more_results(self, count: int = 0, context_variables: Optional[Dict[str, Any]] = None) -> str:
+        """Show the next listings found by the latest search, without searching again.
+
+        count is how many to show, by default as many as a search shows.
+        """
+        try:
+            count = int(count or 0)
+        except ValueError:
+            return f"count must be a number of listings, not {count!r}."
+        session = self.sessions.get(self._session_id(context_variables))
+        if session is None:
+            return NO_STORED_RESULTS
+        if session.listings and session.shown >= len(session.listings):
+            return f"All {len(session.listings)} matching properties have been shown."
+        return self._render_page(session, count if count > 0 else None)
+
+    def sort_results(self, by: str, descending: bool = False,
+                     context_variables: Optional[Dict[str, Any]] = None) -> str:
+        """Sort the listings found by the latest search and show them again from the first, without searching again.
+
+        by is one of price, size, rooms, price_per_m2, deposit or
+        available_from; listings that don't state it come last.
+        """
+        session = self.sessions.get(self._session_id(context_variables))
+        if session is None:
+            return NO_STORED_RESULTS
+        try:
+            session.sort(by, descending)
+        except ValueError as e:
+            return str(e)
+        return self._render_page(session)
+
+    def describe_listing(self, number: int, context_variables: Optional[Dict[str, Any]] = None) -> str:
+        """Show everything known about one listing found by the latest search, by its number in the results."""
+        try:
+            number = int(number)
+        except ValueError:
+            return f"number must be a listing number, not {number!r}."
+        session = self.sessions.get(self._session_id(context_variables))
+        if session is None:
+            return NO_STORED_RESULTS
+        if not 1 <= number <= len(session.listings):
+            return f"There is no listing number {number}; the latest search found {len(session.listings)}."
+        return self._render_details(number, session.listings[number - 1])
+
+    @staticmethod
+    def _session_id(context_variables: Optional[Dict[str, Any]]) -> str:
+        """Return the session a Swarm tool call belongs to."""
+        return (context_variables or {}).get("session_id", DEFAULT_SESSION_ID)
+
+    def _remember_results(self, session_id: str, criteria: HousingCriteria, search_results: Dict[str, Any],
+                          search_url: str) -> str:
+        """Keep a search's listings for session_id and render the first page of them."""
+        session = SearchSession(criteria, search_results.get("listings", []), search_url)
+        self.sessions.put(session_id, session)
+        return self._render_page(session)
+
+    def _render_page(self, session: SearchSession, size: Optional[int] = None) -> str:
+        """Render the session's next page of listings and count them as shown."""
+        start, page = session.next_page(size or self.page_size)
+        return self._construct_response(page, start, len(session.listings), session.search_url)
 
     def _parse_query(self, query: str) -> HousingCriteria:
         """Parse natural language query into housing criteria."""
         try:
-            system_prompt = """Extract housing search criteria from the query.
-            Return a JSON object with:
-            - location: city name
-            - max_price: maximum price in DKK (number only)
-            - min_bedrooms: number of rooms (number only)
-            - property_type: apartment
+            criteria = self._parse_query_locally(query)
+            if criteria is not None:
+                return criteria
+
+            response = self.openai.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=self._query_parse_messages(query)
+            )
+            return self._criteria_from_completion(query, response)
             
-            Example: "apartment in copenhagen 2 rooms under 19000dkk per month"
-            Should return: {
-                "location": "copenhagen",
-                "max_price": 19000,
-                "min_bedrooms": 2,
-                "property_type": "apartment"
-            }"""
+        except Exception as e:
+            logger.error(f"Error parsing query: {str(e)}")
+            raise ValueError("Please specify location, number of rooms, and maximum monthly rent.")
+
+    async def _aparse_query(self, query: str) -> HousingCriteria:
+        """Parse natural language query into housing criteria without blocking the event loop."""
+        try:
+            criteria = self._parse_query_locally(query)
+            if criteria is not None:
+                return criteria
+
+            response = await self.async_openai.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=self._query_parse_messages(query)
+            )
+            return self._criteria_from_completion(query, response)
+
+        except Exception as e:
+            logger.error(f"Error parsing query: {str(e)}")
+            raise ValueError("Please specify location, number of rooms, and maximum monthly rent.")
+
+    @staticmethod
+    def _query_parse_messages(query: str) -> List[Dict[str, str]]:
+        """Build the chat messages for parsing a single query."""
+        return [
+            {
+                "role": "system",
+                "content": QUERY_PARSE_PROMPT
+            },
+            {
+                "role": "user",
+                "content": query
+            }
+        ]
+
+    def _criteria_from_completion(self, query: str, response: Any) -> HousingCriteria:
+        """Build criteria from a parse completion and cache them."""
+        criteria_dict = json.loads(response.choices[0].message.content)
+        criteria = HousingCriteria(**criteria_dict)
+        self.parse_cache.set(normalize_query(query), asdict(criteria))
+        return criteria
+
+    def _parse_query_locally(self, query: str) -> Optional[HousingCriteria]:
+        """Parse query without an LLM call, using the rule-based parser or the parse cache."""
+        # Most queries follow a few templates; only ask the LLM when the
+        # rule-based parser can't fill the required fields.
+        criteria_dict = parse_query_rules(query)
+        if criteria_dict is not None:
+            logger.info("Parsed query with rule-based parser")
+            return HousingCriteria(**criteria_dict)
+
+        criteria_dict = self.parse_cache.get(normalize_query(query))
+        if criteria_dict is not None:
+            logger.info("Parsed query from cache")
+            return HousingCriteria(**criteria_dict)
+
+        return None
 
+    def parse_queries(self, queries: List[str]) -> List[Optional[HousingCriteria]]:
+        """Parse many queries, packing those that need the LLM into batched requests.
+
+        Results line up with queries by index. Queries that can't be parsed,
+        even by the per-query fallback, yield None.
+        """
+        results: List[Optional[HousingCriteria]] = [None] * len(queries)
+        pending: Dict[str, List[int]] = {}
+
+        for i, query in enumerate(queries):
+            results[i] = self._parse_query_locally(query)
+            if results[i] is None:
+                pending.setdefault(normalize_query(query), []).append(i)
+
+        if pending:
+            # Identical queries share one slot in the batch.
+            unique = [(key, queries[indices[0]]) for key, indices in pending.items()]
+            logger.info(f"Batch parsing {len(unique)} queries ({len(queries) - sum(map(len, pending.values()))} "
+                        f"resolved locally)")
+            parsed = {}
+            for chunk in self._chunk_queries(unique):
+                parsed.update(self._parse_query_batch(chunk))
+
+            for key, query in unique:
+                criteria = parsed.get(key)
+                if criteria is None:
+                    try:
+                        criteria = self._parse_query(query)
+                    except ValueError:
+                        logger.warning(f"Could not parse query: {query}")
+                        continue
+                else:
+                    self.parse_cache.set(key, asdict(criteria))
+                for i in pending[key]:
+                    results[i] = criteria
+
+        return results
+
+    @staticmethod
+    def _chunk_queries(queries: List[Any]) -> List[List[Any]]:
+        """Split (key, query) pairs into chunks that fit one batched request."""
+        chunks = []
+        chunk = []
+        chars = 0
+        for item in queries:
+            size = len(item[1])
+            if chunk and (len(chunk) >= BATCH_PARSE_SIZE or chars + size > BATCH_PARSE_MAX_CHARS):
+                chunks.append(chunk)
+                chunk = []
+                chars = 0
+            chunk.append(item)
+            chars += size
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _parse_query_batch(self, chunk: List[Any]) -> Dict[str, HousingCriteria]:
+        """Parse a chunk of (key, query) pairs with one LLM request.
+
+        Returns criteria keyed by cache key; items the model omitted or got
+        wrong are left out so the caller can fall back to per-query parsing.
+        """
+        system_prompt = """Extract housing search criteria from each numbered query.
+        Return a JSON object {"results": [...]} with one entry per query:
+        - index: the query's number
+        - location: city name, or a list of city names when the query asks for several
+        - max_price: maximum price in DKK (number only)
+        - min_bedrooms: number of rooms (number only)
+        - property_type: apartment
+        Only when the query states them, also include:
+        - min_size_m2, max_size_m2: size bounds in square meters (numbers only)
+        - furnished, pets_allowed, immediate_availability: true or false
+
+        Example input: 0: apartment in copenhagen 2 rooms under 19000dkk per month
+        Should return: {"results": [{
+            "index": 0,
+            "location": "copenhagen",
+            "max_price": 19000,
+            "min_bedrooms": 2,
+            "property_type": "apartment"
+        }]}"""
+
+        numbered = "\n".join(f"{i}: {' '.join(query.split())}" for i, (_, query) in enumerate(chunk))
+        try:
             response = self.openai.chat.completions.create(
                 model="gpt-3.5-turbo",
+                response_format={"type": "json_object"},
                 messages=[
                     {
                         "role": "system",
@@ -111,67 +657,475 @@ class HousingSearchAgent:
                     },
                     {
                         "role": "user",
-                        "content": query
+                        "content": numbered
                     }
                 ]
             )
-            
-            criteria_dict = json.loads(response.choices[0].message.content)
-            return HousingCriteria(**criteria_dict)
-            
+            items = json.loads(response.choices[0].message.content).get("results", [])
         except Exception as e:
-            logger.error(f"Error parsing query: {str(e)}")
-            raise ValueError("Please specify location, number of rooms, and maximum monthly rent.")
+            logger.error(f"Error batch parsing {len(chunk)} queries: {str(e)}")
+            return {}
+
+        parsed = {}
+        for item in items:
+            try:
+                index = int(item.pop("index"))
+                if not 0 <= index < len(chunk):
+                    continue
+                parsed[chunk[index][0]] = HousingCriteria(**item)
+            except Exception as e:
+                logger.warning(f"Discarding batch parse result {item}: {str(e)}")
+        return parsed
 
-    def _execute_search(self, criteria: HousingCriteria) -> Dict[str, Any]:
-        """Execute the housing search with given criteria."""
-        search_url = self.construct_search_url(criteria)
+    def _execute_search(self, criteria: HousingCriteria, backend: Optional[str] = None,
+                        max_results: Optional[int] = None) -> Dict[str, Any]:
+        """Execute the housing search with given criteria.
+
+        With max_results, the search streams and stops crawling once it has
+        that many listings.
+        """
+        plan = self.plan_searches(criteria)
+        search_urls = [crawl.url for crawl in plan]
+        search_url = search_urls[0]
         self.last_url = search_url
-        logger.info(f"Starting housing search: {search_url}")
+        logger.info(f"Starting housing search: {', '.join(search_urls)}")
 
         try:
-            # Crawl the search results
-            crawl_status = self._perform_crawl(search_url)
+            namespace = self._get_backend(backend).name
+            cached = self._cached_result(criteria, search_urls, namespace, max_results)
+            if cached is not None:
+                return cached
+
+            if max_results:
+                listings = list(self.stream_search(criteria, backend=backend, max_results=max_results))
+                return self._search_result(criteria, search_urls, listings)
+
+            # Crawl the search results, extracting and filtering each
+            # crawl's listings as soon as it completes
+            listings, failed_urls = self._perform_crawls(
+                search_urls, backend=backend,
+                process=lambda i, pages: self._process_housing_results(pages, criteria, plan[i].location)
+            )
             
-            # Process and analyze results
-            listings = self._process_housing_results(crawl_status, criteria)
+            # Crawls overlap, so the same listing can turn up more than once
+            listings = self._dedupe_listings(listings)
+            if not failed_urls:
+                self.result_cache.set(criteria, listings, namespace=namespace)
             
-            return {
-                "status": "success",
-                "criteria": vars(criteria),
-                "listings": listings,
-                "metadata": {
-                    "search_url": search_url,
-                    "listings_found": len(listings),
-                    "search_date": datetime.now().isoformat()
-                }
-            }
+            return self._search_result(criteria, search_urls, listings, failed_urls)
             
         except Exception as e:
             logger.error(f"Error during housing search: {str(e)}")
-            return {
-                "status": "error",
-                "error": str(e),
-                "criteria": vars(criteria),
-                "search_url": search_url
+            return self._search_error(criteria, search_url, e)
+
+    async def _aexecute_search(self, criteria: HousingCriteria, backend: Optional[str] = None,
+                               max_results: Optional[int] = None) -> Dict[str, Any]:
+        """Execute the housing search with given criteria without blocking the event loop."""
+        plan = self.plan_searches(criteria)
+        search_urls = [crawl.url for crawl in plan]
+        search_url = search_urls[0]
+        self.last_url = search_url
+        logger.info(f"Starting housing search: {', '.join(search_urls)}")
+
+        try:
+            namespace = self._get_backend(backend).name
+            cached = self._cached_result(criteria, search_urls, namespace, max_results)
+            if cached is not None:
+                return cached
+
+            if max_results:
+                listings = [listing async for listing in
+                            self.astream_search(criteria, backend=backend, max_results=max_results)]
+                return self._search_result(criteria, search_urls, listings)
+
+            listings, failed_urls = await self._aperform_crawls(
+                search_urls, backend=backend,
+                process=lambda i, pages: self._process_housing_results(pages, criteria, plan[i].location)
+            )
+            listings = self._dedupe_listings(listings)
+            if not failed_urls:
+                self.result_cache.set(criteria, listings, namespace=namespace)
+            return self._search_result(criteria, search_urls, listings, failed_urls)
+
+        except Exception as e:
+            logger.error(f"Error during housing search: {str(e)}")
+            return self._search_error(criteria, search_url, e)
+
+    def _cached_result(self, criteria: HousingCriteria, search_urls: List[str], namespace: str,
+                       max_results: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Answer criteria from the results of a recent search covering it, or return None.
+
+        The covering search's listings are filtered by criteria locally.
+        Filters the portal applied to the original crawl are checked here
+        the way the local filter checks them, so a listing that doesn't
+        state a value passes.
+        """
+        hit = self.result_cache.get(criteria, namespace=namespace)
+        if hit is None:
+            return None
+        cached_criteria, cached_listings = hit
+        matches = compile_predicate(criteria)
+        locations = set(criteria.locations())
+        listings = [listing for listing in cached_listings if listing.location in locations and matches(listing)]
+        if max_results:
+            listings = listings[:max_results]
+        logger.info(f"Answered search from {len(cached_listings)} cached results of {vars(cached_criteria)}")
+        result = self._search_result(criteria, search_urls, listings)
+        result["metadata"]["result_cache"] = "exact" if cached_criteria == criteria else "covering"
+        return result
+
+    def stream_search(self, criteria: HousingCriteria, backend: Optional[str] = None,
+                      max_results: Optional[int] = None) -> Iterator[Listing]:
+        """Yield the listings matching criteria as their pages arrive.
+
+        Every planned URL is crawled concurrently and each batch of pages is
+        extracted, filtered and dropped as it comes in, so listings arrive
+        in no particular order, each once. Closing the generator early, or
+        reaching max_results listings, cancels the crawls still running.
+        """
+        plan = self.plan_searches(criteria)
+        self.last_url = plan[0].url
+        fetch_backend = self._get_backend(backend)
+        started = time.perf_counter()
+        matches = compile_predicate(criteria)
+        seen: Set[Any] = set()
+        yielded = 0
+        self.streamed_searches += 1
+
+        crawls = self._stream_crawls(plan, fetch_backend)
+        try:
+            for crawl, pages in crawls:
+                for listing in self._new_matches(pages, criteria, crawl.location, matches, seen):
+                    if not yielded:
+                        self.first_result_times.append(time.perf_counter() - started)
+                    yield listing
+                    yielded += 1
+                    if max_results and yielded >= max_results:
+                        self._stop_early(criteria, max_results)
+                        return
+        finally:
+            crawls.close()
+
+    async def astream_search(self, criteria: HousingCriteria, backend: Optional[str] = None,
+                             max_results: Optional[int] = None) -> AsyncIterator[Listing]:
+        """Async variant of stream_search."""
+        plan = self.plan_searches(criteria)
+        self.last_url = plan[0].url
+        fetch_backend = self._get_backend(backend)
+        started = time.perf_counter()
+        matches = compile_predicate(criteria)
+        seen: Set[Any] = set()
+        yielded = 0
+        self.streamed_searches += 1
+
+        crawls = self._astream_crawls(plan, fetch_backend)
+        try:
+            async for crawl, pages in crawls:
+                for listing in self._new_matches(pages, criteria, crawl.location, matches, seen):
+                    if not yielded:
+                        self.first_result_times.append(time.perf_counter() - started)
+                    yield listing
+                    yielded += 1
+                    if max_results and yielded >= max_results:
+                        self._stop_early(criteria, max_results)
+                        return
+        finally:
+            await crawls.aclose()
+
+    def _stop_early(self, criteria: HousingCriteria, max_results: int):
+        """Count a streamed search stopped at max_results before its crawls finished."""
+        self.early_stops += 1
+        logger.info(f"Found {max_results} listings for {criteria.locations()}; cancelling remaining crawls")
+
+    def _new_matches(self, pages: List[Dict], criteria: HousingCriteria, location: str,
+                     matches: Callable[[Listing], bool], seen: Set[Any]) -> List[Listing]:
+        """Return the matching listings on pages that aren't in seen, adding them to it."""
+        new = []
+        for listing in self._extract_listings(pages, criteria, location):
+            key = self._dedupe_key(listing)
+            if key not in seen and matches(listing):
+                seen.add(key)
+                new.append(listing)
+        return new
+
+    def _stream_crawls(self, plan: List[PlannedCrawl],
+                       backend: FetchBackend) -> Iterator[Tuple[PlannedCrawl, List[Dict]]]:
+        """Yield (crawl, pages) batches for every planned crawl as they arrive.
+
+        Fresh crawl-cache entries are served first. The rest are crawled
+        concurrently, at most fanout_workers at a time for this search, each
+        joining an identical crawl streaming for another search; see
+        _stream_crawl. A single crawl runs on the caller's thread. Failed
+        crawls are skipped; raises only if every crawl failed.
+        """
+        live = []
+        for crawl in plan:
+            pages = self.crawl_cache.peek(crawl.url, namespace=f"{backend.name}:")
+            if pages is None:
+                live.append(crawl)
+            else:
+                yield crawl, pages
+        if not live:
+            return
+        if len(live) == 1:
+            yield from self._stream_one(live[0], backend, raise_errors=len(plan) == 1)
+            return
+
+        batches: queue.Queue = queue.Queue()
+        stop = threading.Event()
+
+        def crawl_into_queue(crawl: PlannedCrawl):
+            try:
+                # Crawls still waiting for a worker when the search stops
+                # never start.
+                if stop.is_set():
+                    return
+                # Iterate to the end even once stopped: the crawl may be
+                # streaming for other searches too.
+                for pages in self._stream_crawl(crawl.url, backend, stop):
+                    batches.put((crawl, pages))
+            except Exception as e:
+                if not stop.is_set():
+                    logger.error(f"Error during streamed crawl: {str(e)}")
+                    batches.put((crawl, e))
+            finally:
+                batches.put((crawl, None))
+
+        workers = ThreadPoolExecutor(max_workers=min(self.fanout_workers, len(live)),
+                                     thread_name_prefix="crawl-fanout")
+        for crawl in live:
+            workers.submit(crawl_into_queue, crawl)
+        try:
+            running, failed, error = len(live), 0, None
+            while running:
+                crawl, item = batches.get()
+                if item is None:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    failed, error = failed + 1, item
+                else:
+                    yield crawl, item
+            if failed == len(plan):
+                raise error
+        finally:
+            stop.set()
+            # Running crawls finish on their own; queued ones see stop and return.
+            workers.shutdown(wait=False)
+
+    def _stream_one(self, crawl: PlannedCrawl, backend: FetchBackend,
+                    raise_errors: bool) -> Iterator[Tuple[PlannedCrawl, List[Dict]]]:
+        """Stream a single crawl on the caller's thread for _stream_crawls, raising its error if raise_errors.
+
+        If the search stops early while other searches still share the
+        crawl, the rest of it is handed to a background thread to carry on
+        for them.
+        """
+        stop = threading.Event()
+        pages_stream = self._stream_crawl(crawl.url, backend, stop)
+        finished = False
+        try:
+            for pages in pages_stream:
+                yield crawl, pages
+            finished = True
+        except Exception as e:
+            finished = True
+            logger.error(f"Error during streamed crawl: {str(e)}")
+            if raise_errors:
+                raise
+        finally:
+            if not finished:
+                stop.set()
+                threading.Thread(target=deque, args=(pages_stream, 0), daemon=True,
+                                 name="crawl-fanout-drain").start()
+
+    async def _astream_crawls(self, plan: List[PlannedCrawl],
+                              backend: FetchBackend) -> AsyncIterator[Tuple[PlannedCrawl, List[Dict]]]:
+        """Async variant of _stream_crawls, crawling at most fanout_workers URLs at a time."""
+        live = []
+        for crawl in plan:
+            pages = self.crawl_cache.peek(crawl.url, namespace=f"{backend.name}:")
+            if pages is None:
+                live.append(crawl)
+            else:
+                yield crawl, pages
+        if not live:
+            return
+
+        batches: asyncio.Queue = asyncio.Queue()
+        limit = asyncio.Semaphore(self.fanout_workers)
+
+        async def crawl_into_queue(crawl: PlannedCrawl):
+            try:
+                async with limit:
+                    async for pages in self._astream_crawl(crawl.url, backend):
+                        batches.put_nowait((crawl, pages))
+            except Exception as e:
+                logger.error(f"Error during streamed crawl: {str(e)}")
+                batches.put_nowait((crawl, e))
+            finally:
+                batches.put_nowait((crawl, None))
+
+        tasks = [asyncio.create_task(crawl_into_queue(crawl)) for crawl in live]
+        try:
+            running, failed, error = len(live), 0, None
+            while running:
+                crawl, item = await batches.get()
+                if item is None:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    failed, error = failed + 1, item
+                else:
+                    yield crawl, item
+            if failed == len(plan):
+                raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _stream_crawl(self, url: str, backend: FetchBackend, stop: threading.Event) -> Iterator[List[Dict]]:
+        """Stream url's pages in batches, joining an identical crawl streaming for another search.
+
+        The crawl stops once every search streaming it has set its stop. A
+        crawl streamed to completion is cached like a fetched one if its
+        pages total at most stream_cache_max_bytes; larger ones aren't, so
+        their pages needn't be held while streaming. One stopped early is
+        incomplete and isn't cached either, so repeating a search that
+        stopped at max_results crawls again.
+        """
+        namespace = f"{backend.name}:"
+
+        def produce(shared_stop) -> Iterator[List[Dict]]:
+            # The crawl may have completed for another search while this
+            # one waited for a worker.
+            pages = self.crawl_cache.peek(url, namespace=namespace)
+            if pages is not None:
+                yield pages
+                return
+            collected = PageCollector(self.stream_cache_max_bytes)
+            for batch in backend.stream(url, shared_stop):
+                collected.add(batch)
+                yield batch
+            if collected.pages is not None:
+                self.crawl_cache.put(url, collected.pages, namespace=namespace)
+
+        return self.crawl_streams.stream(namespace + canonicalize_url(url), produce, stop)
+
+    async def _astream_crawl(self, url: str, backend: FetchBackend) -> AsyncIterator[List[Dict]]:
+        """Async variant of _stream_crawl; the crawl stops once every search streaming it is cancelled."""
+        namespace = f"{backend.name}:"
+
+        async def produce() -> AsyncIterator[List[Dict]]:
+            pages = self.crawl_cache.peek(url, namespace=namespace)
+            if pages is not None:
+                yield pages
+                return
+            collected = PageCollector(self.stream_cache_max_bytes)
+            async for batch in backend.astream(url):
+                collected.add(batch)
+                yield batch
+            if collected.pages is not None:
+                self.crawl_cache.put(url, collected.pages, namespace=namespace)
+
+        async for batch in self.crawl_streams.astream(namespace + canonicalize_url(url), produce):
+            yield batch
+
+    def refresh_search(self, criteria: HousingCriteria, backend: Optional[str] = None) -> Dict[str, Any]:
+        """Re-crawl a saved search, fetching and extracting only what wasn't seen before.
+
+        Listing pages seen on earlier refreshes are left out of the crawl,
+        and pages whose content hasn't changed aren't extracted again. The
+        result lists only the matching listings that are new or changed,
+        and metadata["cursor"] can be passed to search_delta later.
+        """
+        plan = self.plan_searches(criteria)
+        search_urls = [crawl.url for crawl in plan]
+        self.last_url = search_urls[0]
+        logger.info(f"Refreshing housing search: {', '.join(search_urls)}")
+
+        try:
+            fetch_backend = self._get_backend(backend)
+            listings, failed_urls = self._perform_crawls(
+                search_urls, backend=backend,
+                fetch=lambda url: self._crawl_new(url, fetch_backend),
+                process=lambda i, pages: self._process_new_pages(pages, criteria, plan[i])
+            )
+            result = self._search_result(criteria, search_urls, self._dedupe_listings(listings), failed_urls)
+            result["metadata"]["cursor"] = self.seen_store.cursor()
+            return self._plain_result(result)
+
+        except Exception as e:
+            logger.error(f"Error during housing search refresh: {str(e)}")
+            return self._search_error(criteria, search_urls[0], e)
+
+    def search_delta(self, criteria: HousingCriteria, cursor: int = 0) -> Dict[str, Any]:
+        """Return the matching listings that refreshes of criteria found new or changed after cursor.
+
+        Nothing is crawled; metadata["cursor"] is the cursor to pass next time.
+        """
+        search_urls = self.plan_search_urls(criteria)
+        listings, latest = self.seen_store.delta(search_urls, cursor)
+        matches = compile_predicate(criteria)
+        # Later versions of a listing found under several URLs come last.
+        listings = self._dedupe_listings([listing for listing in reversed(listings) if matches(listing)])
+        result = self._search_result(criteria, search_urls, listings[::-1])
+        result["metadata"]["cursor"] = latest
+        return self._plain_result(result)
+
+    @staticmethod
+    def _search_result(criteria: HousingCriteria, search_urls: List[str], listings: List[Listing],
+                       failed_urls: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Build the result of a successful search, holding Listing objects; see _plain_result."""
+        return {
+            "status": "success",
+            "criteria": vars(criteria),
+            "listings": listings,
+            "metadata": {
+                "search_url": search_urls[0],
+                "search_urls": search_urls,
+                "locations": criteria.locations(),
+                "failed_urls": failed_urls or [],
+                "filters": HousingSearchAgent.filter_placement(criteria),
+                "listings_found": len(listings),
+                "search_date": datetime.now().isoformat()
             }
+        }
+
+    @staticmethod
+    def _plain_result(result: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert a search result's listings to plain dicts, for results returned to callers."""
+        return {**result, "listings": [listing.to_dict() for listing in result["listings"]]}
+
+    @staticmethod
+    def _search_error(criteria: HousingCriteria, search_url: str, error: Exception) -> Dict[str, Any]:
+        """Build the result of a failed search."""
+        return {
+            "status": "error",
+            "error": str(error),
+            "criteria": vars(criteria),
+            "search_url": search_url
+        }
+
+    def construct_search_url(self, criteria: HousingCriteria, rooms: Optional[int] = None,
+                             location: Optional[str] = None) -> str:
+        """Construct the search URL based on criteria, for listings with exactly rooms rooms in location.
 
-    def construct_search_url(self, criteria: HousingCriteria) -> str:
-        """Construct the search URL based on criteria."""
+        rooms defaults to criteria.min_bedrooms and location to the first of
+        criteria's locations.
+        """
         # Convert location to URL format
-        location = criteria.location.lower().replace(" ", "-")
+        location = (location or criteria.locations()[0]).lower().replace(" ", "-")
         
         # Build the base search URL
         url = f"{self.base_url}/rental-properties/{location}"
-        url += f"/{criteria.min_bedrooms}-rooms"
+        url += f"/{rooms if rooms is not None else criteria.min_bedrooms}-rooms"
         
-        # Add parameters
+        # Add parameters for every filter the portal can apply itself
         params = []
-        params.append(f"max_monthly_rent={criteria.max_price}")
-        if criteria.property_type != "all":
-            params.append(f"housing_type={criteria.property_type}")
-        if criteria.min_size_m2:
-            params.append(f"min_size_m2={criteria.min_size_m2}")
+        for field, (param, encode) in PORTAL_FILTERS.items():
+            value = getattr(criteria, field)
+            encoded = encode(value) if value is not None else None
+            if encoded is not None:
+                params.append(f"{param}={encoded}")
         
         # Combine URL with parameters
         if params:
@@ -179,76 +1133,251 @@ class HousingSearchAgent:
             
         return url
 
-    def _perform_crawl(self, url: str) -> Dict[str, Any]:
-        """Perform the web crawl."""
+    def plan_searches(self, criteria: HousingCriteria) -> List[PlannedCrawl]:
+        """Return the crawls covering criteria, by location in the order given, fewest rooms first.
+
+        The portal filters on a single location and an exact room count, so
+        each location gets its own URLs, and "min_bedrooms or more" takes
+        one URL per room count up to ROOM_FANOUT_MAX.
+        """
+        return [PlannedCrawl(self.construct_search_url(criteria, rooms, location), location, rooms)
+                for location in criteria.locations()
+                for rooms in criteria.room_counts()]
+
+    def plan_search_urls(self, criteria: HousingCriteria) -> List[str]:
+        """Return the results URLs covering criteria; see plan_searches."""
+        return [crawl.url for crawl in self.plan_searches(criteria)]
+
+    @staticmethod
+    def filter_placement(criteria: HousingCriteria) -> Dict[str, str]:
+        """Return where each criterion set in criteria is applied: "server" or "client".
+
+        Server-side filters are sent in the search URL (see PORTAL_FILTERS),
+        so the portal doesn't return pages that fail them; client-side
+        filters only run on the crawled listings.
+        """
+        placement = {"location": "server", "min_bedrooms": "server"}
+        for field, value in vars(criteria).items():
+            if field in placement or value is None or (field == "property_type" and value == "all"):
+                continue
+            portal_filter = PORTAL_FILTERS.get(field)
+            placement[field] = "server" if portal_filter and portal_filter[1](value) is not None else "client"
+        return placement
+
+    def register_fetch_backend(self, backend: FetchBackend):
+        """Make backend selectable by its name."""
+        self.fetch_backends[backend.name] = backend
+
+    def _get_backend(self, name: Optional[str] = None) -> FetchBackend:
+        """Return the named fetch backend, or the deployment default."""
+        name = name or self.default_backend
         try:
-            crawl_response = self.firecrawl.crawl_url(
-                url,
-                params={
-                    'limit': 15,
-                    'scrapeOptions': {
-                        'formats': ['text', 'links']
-                    }
-                },
-                poll_interval=5
+            return self.fetch_backends[name]
+        except KeyError:
+            raise ValueError(f"Unknown fetch backend: {name}. "
+                             f"Available: {', '.join(sorted(self.fetch_backends))}")
+
+    def submit_crawl(self, url: str) -> CrawlJob:
+        """Submit a Firecrawl crawl of url and return a handle to wait on or cancel."""
+        backend = self.fetch_backends.get("firecrawl")
+        if backend is None or not backend.runs_jobs:
+            raise ValueError("Crawl jobs require the live Firecrawl backend")
+        return backend.submit(url)
+
+    def _perform_crawl(self, url: str, backend: Optional[str] = None) -> Dict[str, Any]:
+        """Perform the web crawl, serving recent results from the crawl cache."""
+        try:
+            fetch_backend = self._get_backend(backend)
+            crawl_data = self.crawl_cache.get(
+                url, lambda u: self._crawl(u, fetch_backend), namespace=f"{fetch_backend.name}:"
             )
             
             logger.info(f"Crawl completed for URL: {url}")
-            return crawl_response.get('data', [])
+            return crawl_data
             
         except Exception as e:
             logger.error(f"Error during crawl: {str(e)}")
             raise
 
+    async def _aperform_crawl(self, url: str, backend: Optional[str] = None) -> List[Dict]:
+        """Perform the web crawl without blocking the event loop."""
+        try:
+            fetch_backend = self._get_backend(backend)
+            crawl_data = await self.crawl_cache.aget(
+                url, lambda u: self._acrawl(u, fetch_backend), namespace=f"{fetch_backend.name}:"
+            )
+            logger.info(f"Crawl completed for URL: {url}")
+            return crawl_data
+
+        except Exception as e:
+            logger.error(f"Error during crawl: {str(e)}")
+            raise
+
+    def _perform_crawls(self, urls: List[str], backend: Optional[str] = None,
+                        process: Optional[Callable[[int, List[Dict]], List[Any]]] = None,
+                        fetch: Optional[Callable[[str], List[Dict]]] = None) -> Tuple[List[Any], List[str]]:
+        """Crawl urls, at most fanout_workers at a time, and merge their pages, in url order.
+
+        process, when given, is called with each url's index and pages as
+        soon as that crawl completes, while the others are still running,
+        and its results are merged instead of the pages. fetch replaces the
+        cached crawl of each url. Returns the merged results and the urls
+        whose crawl failed; raises only if every crawl failed.
+        """
+        fetch = fetch or (lambda url: self._perform_crawl(url, backend=backend))
+        if len(urls) == 1:
+            pages = fetch(urls[0])
+            return (process(0, pages) if process else pages), []
+
+        def crawl(i: int, url: str) -> List[Any]:
+            pages = fetch(url)
+            return process(i, pages) if process else pages
+
+        # Workers of this search's own, so its crawls never wait for another search's.
+        with ThreadPoolExecutor(max_workers=min(self.fanout_workers, len(urls)),
+                                thread_name_prefix="crawl-fanout") as workers:
+            futures = [workers.submit(crawl, i, url) for i, url in enumerate(urls)]
+            results = []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append(e)
+        return self._merge_crawls(urls, results)
+
+    async def _aperform_crawls(self, urls: List[str], backend: Optional[str] = None,
+                               process: Optional[Callable[[int, List[Dict]], List[Any]]] = None
+                               ) -> Tuple[List[Any], List[str]]:
+        """Crawl urls concurrently, at most fanout_workers at a time, and merge their pages.
+
+        process is applied to each crawl as it completes; see _perform_crawls.
+        """
+        if len(urls) == 1:
+            pages = await self._aperform_crawl(urls[0], backend=backend)
+            return (process(0, pages) if process else pages), []
+
+        limit = asyncio.Semaphore(self.fanout_workers)
+
+        async def crawl(i: int, url: str) -> List[Any]:
+            async with limit:
+                pages = await self._aperform_crawl(url, backend=backend)
+            return process(i, pages) if process else pages
+
+        results = await asyncio.gather(*(crawl(i, url) for i, url in enumerate(urls)), return_exceptions=True)
+        return self._merge_crawls(urls, results)
+
+    @staticmethod
+    def _merge_crawls(urls: List[str], results: List[Any]) -> Tuple[List[Dict], List[str]]:
+        """Concatenate the results of successful crawls and collect the urls that failed."""
+        pages, failed_urls = [], []
+        for url, result in zip(urls, results):
+            if isinstance(result, BaseException):
+                failed_urls.append(url)
+            else:
+                pages.extend(result)
+        if len(failed_urls) == len(urls):
+            raise results[0]
+        return pages, failed_urls
+
+    def _crawl(self, url: str, backend: FetchBackend) -> List[Dict]:
+        """Fetch url, bypassing the crawl cache but joining an identical fetch in flight."""
+        key = f"{backend.name}:{canonicalize_url(url)}"
+        return self.crawl_flights.do(key, lambda: backend.fetch(url))
+
+    async def _acrawl(self, url: str, backend: FetchBackend) -> List[Dict]:
+        """Fetch url on the running event loop, joining an identical fetch in flight."""
+        key = f"{backend.name}:{canonicalize_url(url)}"
+        return await self.crawl_flights.ado(key, lambda: backend.afetch(url))
+
+    def _crawl_new(self, url: str, backend: FetchBackend) -> List[Dict]:
+        """Fetch url bypassing the crawl cache, skipping the pages already seen for it."""
+        try:
+            known = self.seen_store.known_pages(url)
+            pages = backend.fetch_new(url, known)
+            logger.info(f"Refresh crawl completed for URL: {url} ({len(pages)} pages, {len(known)} known skipped)")
+            return pages
+
+        except Exception as e:
+            logger.error(f"Error during refresh crawl: {str(e)}")
+            raise
+
+    def _process_new_pages(self, crawl_data: List[Dict], criteria: HousingCriteria,
+                           crawl: PlannedCrawl) -> List[Listing]:
+        """Extract the pages of crawl that are new or changed and return their matching new or changed listings."""
+        matches = compile_predicate(criteria)
+        changed = []
+        for item in crawl_data:
+            page_url = item.get('url') or item.get('metadata', {}).get('sourceURL') or crawl.url
+            if not self.seen_store.update_page(crawl.url, page_url, page_hash(item)):
+                continue
+            listings = self._extract_listings([item], criteria, crawl.location)
+            changed.extend(self.seen_store.update_listings(crawl.url, listings, page_url))
+        # A listing read from its card and then its own page is reported once, as last read.
+        return self._dedupe_listings([listing for listing in reversed(changed) if matches(listing)])[::-1]
+
     def _process_housing_results(self, crawl_data: List[Dict], 
-                               criteria: HousingCriteria) -> List[Dict]:
-        """Process and filter housing listings."""
+                               criteria: HousingCriteria, location: Optional[str] = None) -> List[Listing]:
+        """Process and filter housing listings crawled for location."""
+        matches = compile_predicate(criteria)
+        listings = [listing for listing in self._extract_listings(crawl_data, criteria, location) if matches(listing)]
+        return self._dedupe_listings(listings)
+
+    @staticmethod
+    def _dedupe_key(listing: Listing) -> Any:
+        """Identify a listing for de-duplication: its URL, or title, price and size without one."""
+        return listing.listing_url or (listing.title, listing.price_dkk, listing.size_m2)
+
+    @classmethod
+    def _dedupe_listings(cls, listings: List[Listing]) -> List[Listing]:
+        """Drop repeated listings, which overlapping crawls and pages both produce, keeping the first."""
+        seen = set()
+        unique = []
+        for listing in listings:
+            key = cls._dedupe_key(listing)
+            if key not in seen:
+                seen.add(key)
+                unique.append(listing)
+        return unique
+
+    def _extract_listings(self, crawl_data: List[Dict], criteria: HousingCriteria,
+                          location: Optional[str] = None) -> List[Listing]:
+        """Extract one listing per card on each crawled page, without filtering them.
+
+        location is the location the pages were crawled for, by default the
+        first of criteria's locations.
+        """
+        location = location or criteria.locations()[0]
         listings = []
         
         for item in crawl_data:
             try:
-                # Extract basic info from text and links
-                text_content = item.get('text', '')
-                links = item.get('links', [])
-                
-                if not text_content:
+                if not item.get('text') and not item.get('rawHtml'):
                     continue
                 
-                # Look for price and room info in text
-                price_match = re.search(r'(\d+(?:,\d{3})*(?:\.\d{2})?)\s*(?:DKK|kr\.)', text_content)
-                room_match = re.search(r'(\d+)\s*(?:room|rm|bedroom|værelser)', text_content, re.IGNORECASE)
-                size_match = re.search(r'(\d+)\s*m²', text_content)
-                
-                # Clean and convert values
-                price = None
-                if price_match:
-                    price_str = price_match.group(1).replace(',', '').replace('.', '')
-                    try:
-                        price = float(price_str)
-                    except ValueError:
-                        pass
-                
-                rooms = int(room_match.group(1)) if room_match else None
-                size = float(size_match.group(1)) if size_match else None
-                
-                # Find listing URL
-                listing_url = next((link for link in links if '/rental-properties/' in link), None)
-                
-                listing = {
-                    "title": text_content.split('\n')[0],
-                    "price_dkk": price,
-                    "location": criteria.location,
-                    "size_m2": size,
-                    "bedrooms": rooms,
-                    "property_type": "apartment",
-                    "listing_url": listing_url
-                }
-                
-                if listing_url and not listing_url.startswith('http'):
-                    listing_url = f"{self.base_url}{listing_url}"
-                
-                if self._matches_criteria(listing, criteria):
-                    listings.append(listing)
+                # A results page holds many listing cards; extract each one
+                # separately rather than the first figures on the page.
+                for card in self.extractor.extract(item):
+                    fields = card.fields
+                    
+                    listing_url = card.url
+                    if listing_url and not listing_url.startswith('http'):
+                        listing_url = urljoin(self.base_url, listing_url)
+                    
+                    listings.append(Listing(
+                        title=card.text.split('\n')[0],
+                        price_dkk=fields.get("price_dkk"),
+                        location=location,
+                        size_m2=fields.get("size_m2"),
+                        bedrooms=fields.get("bedrooms"),
+                        # The search URL already filters on a chosen housing type.
+                        property_type=criteria.property_type if criteria.property_type != "all" else "apartment",
+                        listing_url=listing_url,
+                        deposit_dkk=fields.get("deposit_dkk"),
+                        floor=fields.get("floor"),
+                        available_from=fields.get("available_from"),
+                        furnished=fields.get("furnished"),
+                        pets_allowed=fields.get("pets_allowed")
+                    ))
                     
             except Exception as e:
                 logger.error(f"Error processing listing: {str(e)}")
@@ -256,47 +1385,123 @@ class HousingSearchAgent:
         
         return listings
 
-    def _matches_criteria(self, listing: Dict[str, Any], criteria: HousingCriteria) -> bool:
-        """Check if listing matches search criteria."""
-        try:
-            price = listing.get('price_dkk')
-            bedrooms = listing.get('bedrooms')
-            location = listing.get('location')
-
-            if not all([price, bedrooms, location]):
-                return False
+    def _matches_criteria(self, listing: Listing, criteria: HousingCriteria) -> bool:
+        """Check if listing matches search criteria.
 
-            if price > criteria.max_price:
-                return False
-            if bedrooms < criteria.min_bedrooms:
-                return False
-                
-            return True
+        Compiles criteria for a single check; to check many listings, compile
+        once with compile_predicate instead.
+        """
+        try:
+            return compile_predicate(criteria)(listing)
         except Exception as e:
             logger.warning(f"Error matching criteria: {str(e)}")
             return False
 
-    def _construct_response(self, listings: List[Dict]) -> str:
-        """Construct a user-friendly response from the listings."""
-        if not listings:
+    def _construct_response(self, listings: List[Listing], start: int = 1, total: Optional[int] = None,
+                            search_url: Optional[str] = None) -> str:
+        """Construct a user-friendly response from the listings.
+
+        listings may be one page of total listings found, numbered from start.
+        search_url is where to look for new listings when none were found.
+        """
+        total = len(listings) if total is None else total
+        if not total:
             return (f"No available properties found matching your criteria. "
-                    f"You can check for new listings at:\n{self.last_url}")
+                    f"You can check for new listings at:\n{search_url or self.base_url}")
         
-        response = f"Found {len(listings)} matching properties:\n\n"
-        for i, listing in enumerate(listings, 1):
-            response += f"{i}. {listing.get('title', 'Unlisted Property')}\n"
-            if listing.get('price_dkk'):
-                response += f"   Price: {listing['price_dkk']:,.0f} DKK/month\n"
-            if listing.get('size_m2'):
-                response += f"   Size: {listing['size_m2']} m²\n"
-            if listing.get('bedrooms'):
-                response += f"   Rooms: {listing['bedrooms']}\n"
-            if listing.get('listing_url'):
-                response += f"   Link: {listing['listing_url']}\n"
-            response += "\n"
+        end = start + len(listings) - 1
+        if start > 1:
+            response = f"Properties {start}-{end} of {total}:\n\n"
+        elif end < total:
+            response = f"Found {total} matching properties, showing the first {len(listings)}:\n\n"
+        else:
+            response = f"Found {total} matching properties:\n\n"
+        # Name each listing's location when a search covered several
+        several_locations = len({listing.location for listing in listings}) > 1
+        for i, listing in enumerate(listings, start):
+            response += self._render_listing(i, listing, several_locations)
+        if end < total:
+            response += f"{total - end} more not shown yet.\n"
         
         return response
 
+    @staticmethod
+    def _render_listing(number: int, listing: Listing, show_location: bool = False) -> str:
+        """Render one numbered listing of a response."""
+        text = f"{number}. {listing.title or 'Unlisted Property'}\n"
+        if show_location and listing.location:
+            text += f"   Location: {listing.location.title()}\n"
+        if listing.price_dkk:
+            text += f"   Price: {listing.price_dkk:,.0f} DKK/month\n"
+        if listing.size_m2:
+            text += f"   Size: {listing.size_m2} m²\n"
+        if listing.bedrooms:
+            text += f"   Rooms: {listing.bedrooms}\n"
+        if listing.listing_url:
+            text += f"   Link: {listing.listing_url}\n"
+        return text + "\n"
+
+    @staticmethod
+    def _render_details(number: int, listing: Listing) -> str:
+        """Render every known field of one numbered listing."""
+        details = [
+            ("Location", listing.location.title() if listing.location else None),
+            ("Type", listing.property_type),
+            ("Price", f"{listing.price_dkk:,.0f} DKK/month" if listing.price_dkk else None),
+            ("Deposit", f"{listing.deposit_dkk:,.0f} DKK" if listing.deposit_dkk else None),
+            ("Size", f"{listing.size_m2} m²" if listing.size_m2 else None),
+            ("Rooms", listing.bedrooms or None),
+            ("Floor", listing.floor),
+            ("Available from", listing.available_from),
+            ("Furnished", None if listing.furnished is None else ("yes" if listing.furnished else "no")),
+            ("Pets allowed", None if listing.pets_allowed is None else ("yes" if listing.pets_allowed else "no")),
+            ("Link", listing.listing_url),
+        ]
+        text = f"{number}. {listing.title or 'Unlisted Property'}\n"
+        for label, value in details:
+            if value is not None:
+                text += f"   {label}: {value}\n"
+        return text
+
+    def _error_response(self, search_url: Optional[str]) -> str:
+        """Render the response to a search that failed, pointing at search_url when known."""
+        return f"Sorry, I encountered an error. You can try searching directly at: {search_url or self.base_url}"
+
+    def _render_summary(self, count: int, search_url: Optional[str] = None) -> str:
+        """Render the closing line of a streamed response."""
+        if not count:
+            return self._construct_response([], search_url=search_url)
+        return f"Found {count} matching properties.\n"
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return cache, coalescing, extraction and crawl timing counters."""
+        metrics = {
+            "parse_cache": self.parse_cache.stats(),
+            "crawl_cache": self.crawl_cache.stats(),
+            "crawl_coalescing": self.crawl_flights.stats(),
+            "stream_coalescing": self.crawl_streams.stats(),
+            "result_cache": self.result_cache.stats(),
+            "extraction": self.extractor.stats(),
+            "seen_store": self.seen_store.stats(),
+            "streaming": self._streaming_stats(),
+            "sessions": self.sessions.stats(),
+        }
+        firecrawl_backend = self.fetch_backends.get("firecrawl")
+        completion_times = firecrawl_backend.completion_times() if firecrawl_backend else None
+        if completion_times is not None:
+            metrics["crawl_completion_times"] = completion_times
+        return metrics
+
+    def _streaming_stats(self) -> Dict[str, Any]:
+        """Return counts of streamed searches and early stops, and time to first result in seconds."""
+        times = sorted(self.first_result_times)
+        stats: Dict[str, Any] = {"searches": self.streamed_searches, "early_stops": self.early_stops,
+                                 "samples": len(times)}
+        if times:
+            stats["first_result_median"] = times[len(times) // 2]
+            stats["first_result_p95"] = times[min(len(times) - 1, int(len(times) * 0.95))]
+        return stats
+
     def _init_agents(self) -> Dict[str, Agent]:
         """Initialize the agent system."""
         agents = {
@@ -312,8 +1517,11 @@ class HousingSearchAgent:
             "searcher": Agent(
                 name="Housing Search Agent",
                 instructions="""Search and analyze housing listings based on user criteria.
-                Present results clearly with pricing, location, and features.""",
-                functions=[self.search_housing]
+                Present results clearly with pricing, location, and features.
+                For follow-ups about listings already found, such as showing more, sorting them or
+                details of one, use show_more_results, sort_results or describe_listing instead of
+                searching again.""",
+                functions=[self.search_housing, self.show_more_results, self.sort_results, self.describe_listing]
             )
         }
         return agents
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from cache import canonicalize_url
+from listings import Listing
+
+logger = logging.getLogger(__name__)
+
+# Known pages a refresh asks the crawler to skip, most recently changed
+# first; each becomes an exclude pattern in the crawl request.
+MAX_SKIPPED_PAGES = 200
+
+# Fields whose change makes a listing count as changed. Titles and the like
+# depend on which page a listing was read from: its card on the results
+# page or its own page.
+CHANGE_FIELDS = ("price_dkk", "deposit_dkk", "size_m2", "bedrooms", "floor", "available_from", "furnished",
+                 "pets_allowed")
+
+
+def page_hash(page: Dict) -> str:
+    """Hash the content of a crawled page that listings are extracted from.
+
+    Text and links only: raw HTML carries per-request tokens that would make
+    every fetch look changed.
+    """
+    content = json.dumps([page.get('text', ''), page.get('links', [])], ensure_ascii=False)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def listing_key(listing: Listing) -> str:
+    """Identify a listing across crawls: its URL, or title, price and size without one."""
+    if listing.listing_url:
+        return listing.listing_url
+    return json.dumps([listing.title, listing.price_dkk, listing.size_m2], ensure_ascii=False)
+
+
+def listing_hash(listing: Listing) -> str:
+    """Hash the fields of a listing that tell when it changed."""
+    content = json.dumps([getattr(listing, name) for name in CHANGE_FIELDS], ensure_ascii=False)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def _fill_missing(listing: Listing, previous: Listing) -> Listing:
+    """Return listing with the fields it lacks taken from previous."""
+    values = listing.to_dict()
+    for name, value in previous.to_dict().items():
+        if values[name] is None:
+            values[name] = value
+    return Listing.from_dict(values)
+
+
+class SeenStore:
+    """SQLite record of the pages and listings each search URL has yielded.
+
+    Lets a refresh skip pages it has already seen unchanged and report only
+    the listings that are new or changed. Every change is stamped with an
+    increasing sequence number; a cursor is the last sequence number a
+    caller has seen, and delta returns what changed after it.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self.pages_changed = 0
+        self.pages_unchanged = 0
+        self.listings_changed = 0
+        self.listings_unchanged = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "search_url TEXT NOT NULL, page_url TEXT NOT NULL, content_hash TEXT NOT NULL, "
+            "seq INTEGER NOT NULL, PRIMARY KEY (search_url, page_url))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS listings ("
+            "search_url TEXT NOT NULL, listing_key TEXT NOT NULL, content_hash TEXT NOT NULL, "
+            "listing TEXT NOT NULL, seq INTEGER NOT NULL, PRIMARY KEY (search_url, listing_key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS listings_seq ON listings (search_url, seq)")
+        self._conn.commit()
+        self._seq = self._conn.execute(
+            "SELECT MAX(seq) FROM (SELECT MAX(seq) AS seq FROM pages UNION ALL SELECT MAX(seq) FROM listings)"
+        ).fetchone()[0] or 0
+
+    def cursor(self) -> int:
+        """Return the sequence number of the latest change."""
+        with self._lock:
+            return self._seq
+
+    def known_pages(self, search_url: str, limit: int = MAX_SKIPPED_PAGES) -> List[str]:
+        """Return the pages seen for search_url other than the results page itself, latest first."""
+        key = canonicalize_url(search_url)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page_url FROM pages WHERE search_url = ? AND page_url != ? ORDER BY seq DESC LIMIT ?",
+                (key, key, limit),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def update_page(self, search_url: str, page_url: str, content_hash: str) -> bool:
+        """Record a page's content hash; return whether the page is new or changed."""
+        key = canonicalize_url(search_url)
+        page_key = canonicalize_url(page_url)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash FROM pages WHERE search_url = ? AND page_url = ?", (key, page_key)
+            ).fetchone()
+            if row is not None and row[0] == content_hash:
+                self.pages_unchanged += 1
+                return False
+            self._seq += 1
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (search_url, page_url, content_hash, seq) VALUES (?, ?, ?, ?)",
+                (key, page_key, content_hash, self._seq),
+            )
+            self._conn.commit()
+            self.pages_changed += 1
+            return True
+
+    def update_listings(self, search_url: str, listings: Sequence[Listing],
+                        page_url: Optional[str] = None) -> List[Listing]:
+        """Record listings found for search_url on page_url; return those that are new or changed.
+
+        Fields a listing's page doesn't state keep the value last seen
+        elsewhere, such as a deposit only shown on the listing's own page.
+        A changed listing's own page is forgotten unless it is page_url, so
+        the next refresh fetches it again instead of skipping it.
+        """
+        key = canonicalize_url(search_url)
+        page_key = canonicalize_url(page_url) if page_url else None
+        changed = []
+        with self._lock:
+            for listing in listings:
+                item_key = listing_key(listing)
+                content_hash = listing_hash(listing)
+                row = self._conn.execute(
+                    "SELECT content_hash, listing FROM listings WHERE search_url = ? AND listing_key = ?",
+                    (key, item_key),
+                ).fetchone()
+                if row is not None:
+                    listing = _fill_missing(listing, Listing.from_dict(json.loads(row[1])))
+                    content_hash = listing_hash(listing)
+                    if row[0] == content_hash:
+                        self.listings_unchanged += 1
+                        continue
+                self._seq += 1
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO listings (search_url, listing_key, content_hash, listing, seq) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, item_key, content_hash, json.dumps(listing.to_dict(), ensure_ascii=False), self._seq),
+                )
+                if row is not None and listing.listing_url and canonicalize_url(listing.listing_url) != page_key:
+                    self._conn.execute("DELETE FROM pages WHERE search_url = ? AND page_url = ?",
+                                       (key, canonicalize_url(listing.listing_url)))
+                self.listings_changed += 1
+                changed.append(listing)
+            self._conn.commit()
+        return changed
+
+    def delta(self, search_urls: Sequence[str], cursor: int = 0) -> Tuple[List[Listing], int]:
+        """Return the listings of search_urls new or changed after cursor, and the new cursor.
+
+        Listings come oldest change first, each in its latest version.
+        """
+        keys = [canonicalize_url(url) for url in search_urls]
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT listing FROM listings WHERE search_url IN ({', '.join('?' * len(keys))}) AND seq > ? "
+                "ORDER BY seq",
+                (*keys, cursor),
+            ).fetchall() if keys else []
+            latest = self._seq
+        return [Listing.from_dict(json.loads(row[0])) for row in rows], latest
+
+    def stats(self) -> Dict[str, int]:
+        """Return counts of changed and unchanged pages and listings seen by refreshes."""
+        return {
+            "cursor": self.cursor(),
+            "pages_changed": self.pages_changed,
+            "pages_unchanged": self.pages_unchanged,
+            "listings_changed": self.listings_changed,
+            "listings_unchanged": self.listings_unchanged,
+        }
@@ -0,0 +1,290 @@
+import sys
+from dataclasses import dataclass, fields
+from datetime import date, timedelta
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from housing_search import HousingCriteria
+
+
+@dataclass(slots=True)
+class Listing:
+    """One rental listing found by a search.
+
+    Slotted, so the many listings held by caches and watchers cost no
+    per-instance dict. Strings that repeat across listings (location,
+    property type, availability date) are interned to one shared copy.
+    """
+    title: str = ""
+    price_dkk: Optional[float] = None
+    location: Optional[str] = None
+    size_m2: Optional[float] = None
+    bedrooms: Optional[int] = None
+    property_type: str = "apartment"
+    listing_url: Optional[str] = None
+    deposit_dkk: Optional[float] = None
+    floor: Optional[int] = None
+    available_from: Optional[str] = None
+    furnished: Optional[bool] = None
+    pets_allowed: Optional[bool] = None
+
+    def __post_init__(self):
+        if self.location is not None:
+            self.location = sys.intern(self.location)
+        if self.property_type is not None:
+            self.property_type = sys.intern(self.property_type)
+        if self.available_from is not None:
+            self.available_from = sys.intern(self.available_from)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the listing as a plain dict."""
+        return {name: getattr(self, name) for name in LISTING_FIELDS}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Listing":
+        """Build a listing from a dict, ignoring keys that aren't listing fields."""
+        return cls(**{name: value for name, value in data.items() if name in LISTING_FIELDS})
+
+
+LISTING_FIELDS = tuple(field.name for field in fields(Listing))
+
+
+# Listings available up to this many days from today count as available
+# immediately.
+IMMEDIATE_AVAILABILITY_DAYS = 14
+
+# Share of listings each criteria check typically rejects, most selective
+# first; orders the checks when no sample of listings is given to measure.
+DEFAULT_SELECTIVITY = {
+    "price": 0.5, "bedrooms": 0.4, "min_size": 0.3, "immediate_availability": 0.3, "max_size": 0.2,
+    "furnished": 0.2, "pets_allowed": 0.2, "property_type": 0.1, "location": 0.0,
+}
+
+Predicate = Callable[[Listing], bool]
+
+
+def available_by(today: Optional[date] = None) -> date:
+    """Return the latest availability date that counts as immediate."""
+    return (today or date.today()) + timedelta(days=IMMEDIATE_AVAILABILITY_DAYS)
+
+
+def _criteria_checks(criteria: Any, today: date) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """Return the checks criteria imposes on a listing as (name, expression, constants).
+
+    Price, bedrooms and location are required, as in _matches_criteria.
+    Optional criteria only reject listings known not to satisfy them, so a
+    listing that doesn't state its size or whether pets are allowed passes.
+    """
+    checks = [
+        ("price", "listing.price_dkk is not None and listing.price_dkk != 0 and listing.price_dkk <= max_price",
+         {"max_price": criteria.max_price}),
+        ("bedrooms", "listing.bedrooms is not None and listing.bedrooms != 0 and listing.bedrooms >= min_bedrooms",
+         {"min_bedrooms": criteria.min_bedrooms}),
+        ("location", "listing.location is not None and listing.location != ''", {}),
+    ]
+    if criteria.min_size_m2:
+        checks.append(("min_size", "listing.size_m2 is None or listing.size_m2 >= min_size_m2",
+                       {"min_size_m2": criteria.min_size_m2}))
+    if criteria.max_size_m2 is not None:
+        checks.append(("max_size", "listing.size_m2 is None or listing.size_m2 <= max_size_m2",
+                       {"max_size_m2": criteria.max_size_m2}))
+    if criteria.furnished is not None:
+        checks.append(("furnished", "listing.furnished is None or listing.furnished == furnished",
+                       {"furnished": criteria.furnished}))
+    if criteria.pets_allowed:
+        # Only a searcher with pets needs them allowed; pets_allowed=False
+        # doesn't rule out listings that happen to allow them.
+        checks.append(("pets_allowed", "listing.pets_allowed is not False", {}))
+    if criteria.immediate_availability:
+        checks.append(("immediate_availability",
+                       "listing.available_from is None or listing.available_from <= available_by",
+                       {"available_by": available_by(today).isoformat()}))
+    if criteria.property_type not in (None, "all"):
+        checks.append(("property_type", "listing.property_type is None or listing.property_type == property_type",
+                       {"property_type": criteria.property_type}))
+    return checks
+
+
+def _never(listing: Listing) -> bool:
+    return False
+
+
+# Criteria fields that shape a compiled predicate.
+_CRITERIA_FIELDS = ("max_price", "min_bedrooms", "property_type", "min_size_m2", "max_size_m2", "furnished",
+                    "immediate_availability", "pets_allowed")
+
+
+def compile_predicate(criteria: "HousingCriteria", sample: Optional[Sequence[Listing]] = None) -> Predicate:
+    """Compile criteria into one function that tells whether a listing matches.
+
+    The checks are joined into a single expression that short-circuits on
+    the most selective check first: measured on sample when given,
+    otherwise by DEFAULT_SELECTIVITY. Compile once per search and reuse
+    the predicate for every listing; predicates compiled without a sample
+    are cached, so repeated searches reuse them too.
+    """
+    values = tuple((name, getattr(criteria, name)) for name in _CRITERIA_FIELDS)
+    if sample:
+        return _compile_predicate(values, date.today(), sample)
+    try:
+        return _cached_predicate(values, date.today())
+    except TypeError:
+        # Unhashable criteria values can't be cached.
+        return _compile_predicate(values, date.today())
+
+
+def _compile_predicate(values: Tuple[Tuple[str, Any], ...], today: date,
+                       sample: Optional[Sequence[Listing]] = None) -> Predicate:
+    criteria = SimpleNamespace(**dict(values))
+    bounds = (criteria.max_price, criteria.min_bedrooms)
+    if not all(isinstance(bound, (int, float)) and not isinstance(bound, bool) for bound in bounds):
+        # _matches_criteria has always rejected everything for criteria it
+        # can't compare prices or rooms against.
+        return _never
+
+    checks = _criteria_checks(criteria, today)
+    namespace: Dict[str, Any] = {}
+    for _, _, constants in checks:
+        namespace.update(constants)
+
+    if sample:
+        def rejection_rate(expression: str) -> float:
+            check = eval(f"lambda listing: {expression}", dict(namespace))
+            return sum(1 for listing in sample if not check(listing)) / len(sample)
+        rates = {name: rejection_rate(expression) for name, expression, _ in checks}
+    else:
+        rates = DEFAULT_SELECTIVITY
+    checks.sort(key=lambda check: -rates.get(check[0], 0.0))
+
+    source = "lambda listing: " + " and ".join(f"({expression})" for _, expression, _ in checks)
+    predicate = eval(compile(source, "<criteria predicate>", "eval"), namespace)
+    predicate.checks = [name for name, _, _ in checks]
+    return predicate
+
+
+_cached_predicate = lru_cache(maxsize=256)(_compile_predicate)
+
+
+# Numeric listing fields, stored as float64 columns with NaN for missing
+# values; yes/no fields are stored the same way as 1.0/0.0/NaN, the
+# availability date as datetime64 (NaT where missing), and the rest as
+# object columns.
+NUMERIC_FIELDS = ("price_dkk", "size_m2", "bedrooms", "deposit_dkk", "floor", "furnished", "pets_allowed")
+INTEGER_FIELDS = ("bedrooms", "floor")
+FLAG_FIELDS = ("furnished", "pets_allowed")
+DATE_FIELDS = ("available_from",)
+
+
+class ListingBatch:
+    """Listings stored column-wise, for filtering many at once with NumPy.
+
+    Numeric fields are float64 arrays (NaN where missing); string fields
+    are object arrays.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], has_location: Optional[np.ndarray] = None):
+        self.columns = columns
+        if has_location is None:
+            has_location = np.fromiter((bool(location) for location in columns["location"]),
+                                       dtype=bool, count=len(columns["location"]))
+        self._has_location = has_location
+
+    @classmethod
+    def from_listings(cls, listings: Sequence[Listing]) -> "ListingBatch":
+        """Build a batch from listings."""
+        count = len(listings)
+        columns = {}
+        for name in LISTING_FIELDS:
+            values = (getattr(listing, name) for listing in listings)
+            if name in NUMERIC_FIELDS:
+                columns[name] = np.fromiter((np.nan if value is None else value for value in values),
+                                            dtype=np.float64, count=count)
+            elif name in DATE_FIELDS:
+                columns[name] = np.array(["NaT" if value is None else value for value in values],
+                                         dtype="datetime64[D]")
+            else:
+                column = np.empty(count, dtype=object)
+                column[:] = list(values)
+                columns[name] = column
+        return cls(columns)
+
+    @classmethod
+    def concat(cls, batches: Sequence["ListingBatch"]) -> "ListingBatch":
+        """Join batches into one, in order."""
+        if not batches:
+            return cls.from_listings([])
+        return cls({name: np.concatenate([batch.columns[name] for batch in batches]) for name in LISTING_FIELDS},
+                   np.concatenate([batch._has_location for batch in batches]))
+
+    def __len__(self) -> int:
+        return len(self.columns["price_dkk"])
+
+    def take(self, rows: Union[np.ndarray, Sequence[int]]) -> "ListingBatch":
+        """Return the batch of the given rows, by index array or boolean mask."""
+        return ListingBatch({name: column[rows] for name, column in self.columns.items()}, self._has_location[rows])
+
+    def criteria_mask(self, criteria: "HousingCriteria") -> np.ndarray:
+        """Return a boolean mask of the listings matching criteria.
+
+        Matches compile_predicate exactly: price, bedrooms and location must
+        be present and non-zero, price within max_price and bedrooms at
+        least min_bedrooms; optional criteria reject only listings known
+        not to satisfy them. NaN and NaT compare false, so missing required
+        values never match.
+        """
+        columns = self.columns
+        price = columns["price_dkk"]
+        bedrooms = columns["bedrooms"]
+        try:
+            mask = ((price != 0) & (price <= criteria.max_price)
+                    & (bedrooms != 0) & (bedrooms >= criteria.min_bedrooms)
+                    & self._has_location)
+        except TypeError:
+            # Criteria without a price or room bound match nothing, as in
+            # _matches_criteria.
+            return np.zeros(len(self), dtype=bool)
+
+        size = columns["size_m2"]
+        if criteria.min_size_m2:
+            mask &= np.isnan(size) | (size >= criteria.min_size_m2)
+        if criteria.max_size_m2 is not None:
+            mask &= np.isnan(size) | (size <= criteria.max_size_m2)
+        if criteria.furnished is not None:
+            furnished = columns["furnished"]
+            mask &= np.isnan(furnished) | (furnished == float(criteria.furnished))
+        if criteria.pets_allowed:
+            mask &= columns["pets_allowed"] != 0
+        if criteria.immediate_availability:
+            available = columns["available_from"]
+            mask &= np.isnat(available) | (available <= np.datetime64(available_by(), "D"))
+        if criteria.property_type not in (None, "all"):
+            property_type = columns["property_type"]
+            mask &= (property_type == criteria.property_type) | np.equal(property_type, None)
+        return mask
+
+    def filter(self, criteria: "HousingCriteria") -> "ListingBatch":
+        """Return the listings matching criteria as a new batch."""
+        return self.take(self.criteria_mask(criteria))
+
+    def to_listings(self) -> List[Listing]:
+        """Convert the batch back to Listing records."""
+        rows = []
+        for name in LISTING_FIELDS:
+            column = self.columns[name]
+            if name in NUMERIC_FIELDS:
+                values = column.tolist()
+                if name in INTEGER_FIELDS:
+                    rows.append([None if value != value else int(value) for value in values])
+                elif name in FLAG_FIELDS:
+                    rows.append([None if value != value else bool(value) for value in values])
+                else:
+                    rows.append([None if value != value else value for value in values])
+            elif name in DATE_FIELDS:
+                rows.append([None if value is None else value.isoformat() for value in column.tolist()])
+            else:
+                rows.append(column.tolist())
+        return [Listing(*values) for values in zip(*rows)]
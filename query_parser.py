@@ -0,0 +1,382 @@
+import re
+from typing import Any, Dict, Iterator, List, Match, Optional, Tuple
+
+# Canonical location names keyed by the spellings users type. The canonical
+# value is what ends up in HousingCriteria.location and the search URLs.
+KNOWN_LOCATIONS = {
+    "copenhagen": "copenhagen",
+    "københavn": "copenhagen",
+    "kobenhavn": "copenhagen",
+    "koebenhavn": "copenhagen",
+    "kbh": "copenhagen",
+    "cph": "copenhagen",
+    "frederiksberg": "frederiksberg",
+    "aarhus": "aarhus",
+    "århus": "aarhus",
+    "odense": "odense",
+    "aalborg": "aalborg",
+    "ålborg": "aalborg",
+    "esbjerg": "esbjerg",
+    "randers": "randers",
+    "kolding": "kolding",
+    "horsens": "horsens",
+    "vejle": "vejle",
+    "roskilde": "roskilde",
+    "herning": "herning",
+    "silkeborg": "silkeborg",
+    "hørsholm": "hørsholm",
+    "lyngby": "lyngby",
+    "valby": "valby",
+    "vanløse": "vanløse",
+    "hellerup": "hellerup",
+    "amager": "amager",
+}
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "en": 1, "et": 1, "to": 2, "tre": 3, "fire": 4, "fem": 5, "seks": 6,
+}
+
+PROPERTY_TYPES = {
+    "apartment": "apartment",
+    "apartments": "apartment",
+    "flat": "apartment",
+    "lejlighed": "apartment",
+    "lejligheder": "apartment",
+    "house": "house",
+    "hus": "house",
+    "villa": "house",
+    "townhouse": "townhouse",
+    "rækkehus": "townhouse",
+}
+
+# A number as users write it: "19000", "19.000", "19,000" or "19.5" (the
+# latter only meaningful with a "k" suffix).
+_NUMBER = r"\d{1,3}(?:[.,]\d{3})+|\d+(?:[.,]\d+)?"
+_CURRENCY = r"(?:dkk|kr\.?|kroner|,-)"
+_SIZE_UNIT = r"(?:m2|m²|kvm|sqm|square\s+met(?:er|re)s?)"
+_ROOM_UNIT = (r"(?:rooms?|rm|bedrooms?|bed|værelser|værelses|værelse|vær\.?|"
+              r"vaerelser|vaerelses)")
+
+_PRICE_KEYWORDS = (r"(?:under|below|max(?:imum)?|maks(?:imalt|\.)?|up\s+to|"
+                   r"less\s+than|at\s+most|højst|op\s+til|budget(?:\s+of)?|<=?)")
+_MIN_KEYWORDS = r"(?:at\s+least|min(?:imum|\.)?|mindst|over|from|fra|>=?)"
+_MAX_KEYWORDS = r"(?:at\s+most|max(?:imum|\.)?|maks(?:imalt|\.)?|under|below|up\s+to|højst|op\s+til|<=?)"
+
+_NOT_A_PRICE = rf"(?!\s*(?:{_SIZE_UNIT}|{_ROOM_UNIT}|[+-]?\s*{_ROOM_UNIT}))"
+
+_PRICE_WITH_KEYWORD_RE = re.compile(
+    rf"\b{_PRICE_KEYWORDS}\s*:?\s*(?P<number>{_NUMBER})\s*(?P<k>k\b)?"
+    rf"\s*(?P<currency>{_CURRENCY})?{_NOT_A_PRICE}",
+    re.IGNORECASE,
+)
+_PRICE_WITH_CURRENCY_RE = re.compile(
+    rf"(?P<number>{_NUMBER})\s*(?P<k>k\b)?\s*{_CURRENCY}",
+    re.IGNORECASE,
+)
+# A minimum rent, as in "over 10000 kr"; the fast path only knows maximums.
+_MIN_PRICE_RE = re.compile(
+    rf"\b{_MIN_KEYWORDS}\s*:?\s*(?P<number>{_NUMBER})\s*(?P<k>k\b)?"
+    rf"\s*(?P<currency>{_CURRENCY})?{_NOT_A_PRICE}",
+    re.IGNORECASE,
+)
+_ROOMS_RE = re.compile(
+    rf"\b(?P<number>\d+|{'|'.join(NUMBER_WORDS)})\s*\+?\s*-?\s*{_ROOM_UNIT}(?!\w)",
+    re.IGNORECASE,
+)
+# A range of room counts, as in "2-3 rooms" or "2 to 3 rooms".
+_ROOM_RANGE_RE = re.compile(
+    rf"\b(?:\d+|{'|'.join(NUMBER_WORDS)})\s*(?:-|–|to|til|or|eller)\s*"
+    rf"(?:\d+|{'|'.join(NUMBER_WORDS)})\s*{_ROOM_UNIT}(?!\w)",
+    re.IGNORECASE,
+)
+# An upper bound on rooms, as in "up to 3 rooms"; the fast path only knows minimums.
+_MAX_ROOMS_RE = re.compile(
+    rf"\b(?:{_MAX_KEYWORDS}|less\s+than|fewer\s+than|no\s+more\s+than)\s*"
+    rf"(?:\d+|{'|'.join(NUMBER_WORDS)})\s*{_ROOM_UNIT}(?!\w)",
+    re.IGNORECASE,
+)
+_SIZE_RANGE_RE = re.compile(
+    rf"\b(?P<low>\d+)\s*(?:-|–|to|til)\s*(?P<high>\d+)\s*{_SIZE_UNIT}",
+    re.IGNORECASE,
+)
+_MIN_SIZE_RE = re.compile(
+    rf"(?:\b{_MIN_KEYWORDS}\s*(?P<a>\d+)\s*{_SIZE_UNIT}|\b(?P<b>\d+)\s*\+\s*{_SIZE_UNIT})",
+    re.IGNORECASE,
+)
+_MAX_SIZE_RE = re.compile(
+    rf"\b{_MAX_KEYWORDS}\s*(?P<number>\d+)\s*{_SIZE_UNIT}",
+    re.IGNORECASE,
+)
+_WORD_RE = re.compile(r"[\wæøå]+", re.IGNORECASE)
+# What may separate the locations of a list like "Copenhagen, Frederiksberg
+# or Aarhus".
+_LOCATION_SEPARATOR_RE = re.compile(r"\s*[,/&]?\s*(?:\b(?:or|and|eller|og)\b)?\s*", re.IGNORECASE)
+_TOKEN_RE = re.compile(rf"(?P<number>{_NUMBER})(?P<k>k\b)?|[\wæøå]+", re.IGNORECASE)
+
+# Filler words that don't change what a query asks for. They are dropped
+# when building cache keys so rephrasings map to the same entry.
+STOP_WORDS = {
+    "a", "an", "the", "in", "at", "for", "with", "and", "of", "per", "month",
+    "monthly", "please", "i", "im", "want", "need", "looking", "find", "me",
+    "search", "show", "some", "something", "is", "am", "rent", "rental",
+    "en", "et", "på", "til", "og", "med", "om", "måneden", "md", "mdr",
+    "jeg", "søger", "leder", "efter", "gerne", "vis",
+}
+
+_UNFURNISHED_RE = re.compile(r"\b(?:unfurnished|not\s+furnished|umøbleret|ikke\s+møbleret)\b", re.IGNORECASE)
+_FURNISHED_RE = re.compile(r"\b(?:furnished|møbleret)\b", re.IGNORECASE)
+_NO_PETS_RE = re.compile(r"\b(?:no\s+pets|pets\s+not\s+allowed|husdyr\s+ikke\s+tilladt|ingen\s+husdyr)\b",
+                         re.IGNORECASE)
+_PETS_RE = re.compile(r"\b(?:pets?\s+(?:allowed|ok|welcome)|pet[\s-]friendly|with\s+(?:a\s+)?(?:dog|cat|pets?)|"
+                      r"husdyr\s+tilladt|må\s+have\s+husdyr)\b", re.IGNORECASE)
+_IMMEDIATE_RE = re.compile(r"\b(?:available\s+(?:now|immediately)|immediately|asap|move\s+in\s+now|"
+                           r"ledig\s+nu|straks|hurtigst\s+muligt)\b", re.IGNORECASE)
+# Words after which a location or property type is excluded, not searched.
+_NEGATION_WORDS = {"not", "no", "never", "except", "excluding", "without", "ikke", "ingen", "undtagen", "uden"}
+# Flags stated outright as negatives, which the fast path understands.
+_NEGATIVE_FLAGS_RE = re.compile(rf"{_UNFURNISHED_RE.pattern}|{_NO_PETS_RE.pattern}", re.IGNORECASE)
+# Words that can turn a flag around or make it optional: negations (with
+# or without their apostrophe), alternatives and indifference, as in
+# "furnished is not required", "furnished or unfurnished" or "doesnt
+# matter whether it is furnished".
+_HEDGE_RE = re.compile(
+    r"\b(?:not|no|never|ikke|ingen|\w+n[’']t|(?:do|does|did|is|are|was|were|has|have|need|must|should)nt|"
+    r"dont|cant|wont|or|eller|either|whether|required|requirement|necessary|optional|matters?|"
+    r"krav|nødvendig(?:t)?|ligegyldigt|lige\s+meget)\b",
+    re.IGNORECASE,
+)
+
+
+def parse_number(number: str, thousands: bool = False) -> Optional[float]:
+    """Convert an English or Danish formatted number to a float."""
+    if re.fullmatch(r"\d{1,3}(?:[.,]\d{3})+", number) and not thousands:
+        return float(re.sub(r"[.,]", "", number))
+    try:
+        value = float(number.replace(",", "."))
+    except ValueError:
+        return None
+    return value * 1000 if thousands else value
+
+
+def _unique(values: List[Any]) -> Optional[Any]:
+    """Return the single distinct value in values, or None if there are zero or several."""
+    distinct = set(values)
+    if len(distinct) != 1:
+        return None
+    return distinct.pop()
+
+
+def _find_locations(query: str) -> List[str]:
+    """Find known locations mentioned in the query, in order of appearance."""
+    found = []
+    for word in _WORD_RE.findall(query.lower()):
+        location = KNOWN_LOCATIONS.get(word)
+        if location and location not in found:
+            found.append(location)
+    return found
+
+
+def _find_location_list(query: str) -> Optional[List[str]]:
+    """Find the locations the query asks for, in order of appearance.
+
+    Several locations count only when they are written as one list, such
+    as "Copenhagen or Aarhus"; distinct locations mentioned apart, as in
+    "in Valby close to Copenhagen", are ambiguous and yield None, as does
+    a query with no known location.
+    """
+    text = query.lower()
+    mentions = [match for match in _WORD_RE.finditer(text) if match.group(0) in KNOWN_LOCATIONS]
+    for previous, match in zip(mentions, mentions[1:]):
+        if not _LOCATION_SEPARATOR_RE.fullmatch(text, previous.end(), match.start()):
+            location = _unique(_find_locations(query))
+            return [location] if location else None
+    return list(dict.fromkeys(KNOWN_LOCATIONS[match.group(0)] for match in mentions)) or None
+
+
+def _iter_prices(query: str) -> Iterator[Tuple[int, int, int]]:
+    """Yield (start, end, rent) for candidate maximum monthly rents in the query."""
+    for pattern in (_PRICE_WITH_KEYWORD_RE, _PRICE_WITH_CURRENCY_RE):
+        for match in pattern.finditer(query):
+            thousands = bool(match.group("k"))
+            value = parse_number(match.group("number"), thousands=thousands)
+            if value is None:
+                continue
+            has_currency = pattern is _PRICE_WITH_CURRENCY_RE or bool(match.groupdict().get("currency"))
+            # Bare small numbers after "under"/"max" are more likely distances
+            # or sizes than rents.
+            if value < 1000 and not (has_currency or thousands):
+                continue
+            yield match.start(), match.end(), int(round(value))
+
+
+def _has_min_price(query: str) -> bool:
+    """Return whether the query asks for a minimum rent, as in "over 10000 kr"."""
+    for match in _MIN_PRICE_RE.finditer(query):
+        thousands = bool(match.group("k"))
+        value = parse_number(match.group("number"), thousands=thousands)
+        # As in _iter_prices, bare small numbers aren't rents: "from 1 March".
+        if value is not None and (value >= 1000 or thousands or match.group("currency")):
+            return True
+    return False
+
+
+def _find_prices(query: str) -> List[int]:
+    """Find candidate maximum monthly rents in the query."""
+    return [value for _, _, value in _iter_prices(query)]
+
+
+def _room_count(match: Match) -> int:
+    """Convert a _ROOMS_RE match to a room count."""
+    number = match.group("number").lower()
+    return NUMBER_WORDS[number] if number in NUMBER_WORDS else int(number)
+
+
+def _find_rooms(query: str) -> List[int]:
+    """Find requested room counts in the query."""
+    return [_room_count(match) for match in _ROOMS_RE.finditer(query)]
+
+
+def _has_hedged_flags(query: str) -> bool:
+    """Return whether the query mentions furnishing, pets or availability in words that may negate or soften it.
+
+    "not furnished" and "no pets" are understood; "furnished is not
+    required" or "furnished or unfurnished" aren't.
+    """
+    if not any(pattern.search(query) for pattern in (_FURNISHED_RE, _PETS_RE, _NO_PETS_RE, _IMMEDIATE_RE)):
+        return False
+    return bool(_HEDGE_RE.search(_NEGATIVE_FLAGS_RE.sub(" ", query)))
+
+
+def _find_property_type(query: str) -> Optional[str]:
+    """Find the requested property type, if exactly one is mentioned."""
+    types = [PROPERTY_TYPES[word] for word in _WORD_RE.findall(query.lower()) if word in PROPERTY_TYPES]
+    return _unique(types)
+
+
+def _find_sizes(query: str) -> Dict[str, int]:
+    """Find size limits in square meters."""
+    sizes = {}
+    range_match = _SIZE_RANGE_RE.search(query)
+    if range_match:
+        sizes["min_size_m2"] = int(range_match.group("low"))
+        sizes["max_size_m2"] = int(range_match.group("high"))
+        return sizes
+    min_match = _MIN_SIZE_RE.search(query)
+    if min_match:
+        sizes["min_size_m2"] = int(min_match.group("a") or min_match.group("b"))
+    max_match = _MAX_SIZE_RE.search(query)
+    if max_match:
+        sizes["max_size_m2"] = int(max_match.group("number"))
+    return sizes
+
+
+def parse_query_rules(query: str) -> Optional[Dict[str, Any]]:
+    """Parse common English and Danish query templates without an LLM.
+
+    Returns keyword arguments for HousingCriteria, with a list of locations
+    when the query lists several, or None when location, max_price and
+    min_bedrooms cannot all be determined unambiguously. Minimum rents,
+    ranges or upper bounds of room counts and flags that may be negated or
+    optional, which the rules here would read wrongly, also yield None,
+    leaving the query to the LLM.
+    """
+    if _has_min_price(query) or _ROOM_RANGE_RE.search(query) or _MAX_ROOMS_RE.search(query):
+        return None
+    if _has_hedged_flags(query):
+        return None
+    locations = _find_location_list(query)
+    max_price = _unique(_find_prices(query))
+    min_bedrooms = _unique(_find_rooms(query))
+    if locations is None or max_price is None or min_bedrooms is None:
+        return None
+
+    criteria = {
+        "location": locations[0] if len(locations) == 1 else locations,
+        "max_price": max_price,
+        "min_bedrooms": min_bedrooms,
+    }
+
+    property_type = _find_property_type(query)
+    if property_type:
+        criteria["property_type"] = property_type
+
+    criteria.update(_find_sizes(query))
+
+    if _UNFURNISHED_RE.search(query):
+        criteria["furnished"] = False
+    elif _FURNISHED_RE.search(query):
+        criteria["furnished"] = True
+
+    if _NO_PETS_RE.search(query):
+        criteria["pets_allowed"] = False
+    elif _PETS_RE.search(query):
+        criteria["pets_allowed"] = True
+
+    if _IMMEDIATE_RE.search(query):
+        criteria["immediate_availability"] = True
+
+    return criteria
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query into a cache key.
+
+    Case, whitespace and number formats are normalized, and rents, room
+    counts, sizes, known locations and property types are folded into
+    canonical tokens. Those tokens are sorted, so "2 rooms in Copenhagen
+    under 19.000 kr" and "københavn under 19k 2 rooms" produce the same key.
+    The remaining words keep their order, as does a location or property
+    type right after a negation: "copenhagen, not valby" and "valby, not
+    copenhagen" are different searches.
+    """
+    text = " ".join(query.lower().split())
+
+    spans = []
+    range_match = _SIZE_RANGE_RE.search(text)
+    if range_match:
+        spans.append((range_match.start(), range_match.end(),
+                      f"size:{range_match.group('low')}-{range_match.group('high')}"))
+    for match in _MIN_SIZE_RE.finditer(text):
+        spans.append((match.start(), match.end(), f"size>={match.group('a') or match.group('b')}"))
+    for match in _MAX_SIZE_RE.finditer(text):
+        spans.append((match.start(), match.end(), f"size<={match.group('number')}"))
+    for start, end, value in _iter_prices(text):
+        spans.append((start, end, f"price:{value}"))
+    for match in _ROOMS_RE.finditer(text):
+        spans.append((match.start(), match.end(), f"rooms:{_room_count(match)}"))
+
+    tokens = []
+    words: List[str] = []
+    position = 0
+    # Keep the earliest and, on ties, the longest of overlapping spans.
+    for start, end, token in sorted(spans, key=lambda span: (span[0], span[0] - span[1])):
+        if start < position:
+            continue
+        _normalize_words(text[position:start], tokens, words)
+        tokens.append(token)
+        position = end
+    _normalize_words(text[position:], tokens, words)
+
+    return " ".join(sorted(tokens) + words)
+
+
+def _normalize_words(text: str, tokens: List[str], words: List[str]):
+    """Canonicalize the free-text words between recognized tokens.
+
+    Known locations and property types are added to tokens, unless they
+    follow a negation; everything else is added to words, in order.
+    """
+    for match in _TOKEN_RE.finditer(text):
+        if match.group("number"):
+            value = parse_number(match.group("number"), thousands=bool(match.group("k")))
+            words.append(f"{value:g}" if value is not None else match.group(0))
+            continue
+        word = match.group(0)
+        if word in STOP_WORDS:
+            continue
+        canonical = KNOWN_LOCATIONS.get(word) or PROPERTY_TYPES.get(word)
+        if canonical is None or (words and words[-1] in _NEGATION_WORDS):
+            words.append(canonical or word)
+        else:
+            tokens.append(f"location:{canonical}" if word in KNOWN_LOCATIONS else f"type:{canonical}")
@@ -0,0 +1,320 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence
+
+from cache import canonicalize_url
+from crawl_jobs import CrawlJob
+from fetch_backends import FetchBackend
+
+logger = logging.getLogger(__name__)
+
+CRAWLS = "crawls"
+COMPLETIONS = "completions"
+
+# Maps the latency observed while recording to the delay to inject on replay.
+LatencyModel = Callable[[float], float]
+
+
+class ReplayMissError(LookupError):
+    """Raised when a replayed request was never recorded."""
+
+
+class Corpus:
+    """Compact on-disk store of recorded crawl responses and LLM completions.
+
+    Each kind of record lives in its own gzip-compressed JSON-lines file in
+    the corpus directory, one {"key", "value", "elapsed"} object per line.
+    Later records for a key replace earlier ones.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._records: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def _file(self, kind: str) -> str:
+        return os.path.join(self.path, f"{kind}.jsonl.gz")
+
+    def _load(self, kind: str) -> Dict[str, Dict[str, Any]]:
+        if kind not in self._records:
+            records = {}
+            if os.path.exists(self._file(kind)):
+                with gzip.open(self._file(kind), "rt", encoding="utf-8") as f:
+                    for line in f:
+                        record = json.loads(line)
+                        records[record["key"]] = record
+            self._records[kind] = records
+        return self._records[kind]
+
+    def get(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        """Return the record for key, or None."""
+        with self._lock:
+            return self._load(kind).get(key)
+
+    def keys(self, kind: str) -> List[str]:
+        """Return the recorded keys of one kind."""
+        with self._lock:
+            return list(self._load(kind))
+
+    def append(self, kind: str, key: str, value: Any, elapsed: float):
+        """Record value under key, along with how long producing it took."""
+        record = {"key": key, "value": value, "elapsed": round(elapsed, 4)}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._load(kind)[key] = record
+            # Appending a new gzip member keeps the file a valid gzip stream.
+            with gzip.open(self._file(kind), "at", encoding="utf-8") as f:
+                f.write(line)
+
+
+def completion_key(kwargs: Dict[str, Any]) -> str:
+    """Key a chat completion request by its model, messages and response format."""
+    request = {name: kwargs.get(name) for name in ("model", "messages", "response_format")}
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def crawl_key(backend: str, url: str, skip_urls: Sequence[str] = ()) -> str:
+    """Key a crawl by backend and canonical URL, and the known pages it skipped, if any."""
+    key = f"{backend}:{canonicalize_url(url)}"
+    if skip_urls:
+        skipped = json.dumps(sorted(canonicalize_url(skip_url) for skip_url in skip_urls))
+        key += f"|skip:{hashlib.sha256(skipped.encode('utf-8')).hexdigest()[:16]}"
+    return key
+
+
+def recorded_latency(scale: float = 1.0) -> LatencyModel:
+    """Replay the recorded latency, optionally scaled."""
+    return lambda elapsed: elapsed * scale
+
+
+def fixed_latency(seconds: float) -> LatencyModel:
+    """Inject the same delay for every request."""
+    return lambda elapsed: seconds
+
+
+def uniform_latency(low: float, high: float, seed: Optional[int] = None) -> LatencyModel:
+    """Inject delays drawn uniformly from [low, high]."""
+    rng = random.Random(seed)
+    return lambda elapsed: rng.uniform(low, high)
+
+
+def lognormal_latency(median: float, sigma: float, seed: Optional[int] = None) -> LatencyModel:
+    """Inject long-tailed delays from a lognormal distribution with the given median."""
+    rng = random.Random(seed)
+    mu = math.log(median)
+    return lambda elapsed: rng.lognormvariate(mu, sigma)
+
+
+def parse_latency(spec: Optional[str]) -> Optional[LatencyModel]:
+    """Build a latency model from a spec string.
+
+    Accepted forms: "none", "recorded", "recorded:<scale>", "fixed:<s>",
+    "uniform:<low>,<high>" and "lognormal:<median>,<sigma>".
+    """
+    if not spec or spec == "none":
+        return None
+    name, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(",") if value]
+    if name == "recorded":
+        return recorded_latency(*values)
+    if name == "fixed":
+        return fixed_latency(*values)
+    if name == "uniform":
+        return uniform_latency(*values)
+    if name == "lognormal":
+        return lognormal_latency(*values)
+    raise ValueError(f"Unknown latency model: {spec}")
+
+
+class RecordingBackend(FetchBackend):
+    """Wraps a fetch backend and records every response to a corpus.
+
+    Streamed crawls are recorded after each batch with the pages so far,
+    so the record of a finished stream is the whole crawl, as a fetch
+    would return it. Crawls that skip known pages are recorded under keys
+    of their own.
+    """
+
+    def __init__(self, inner: FetchBackend, corpus: Corpus):
+        self.inner = inner
+        self.corpus = corpus
+        self.name = inner.name
+
+    @property
+    def runs_jobs(self) -> bool:
+        return self.inner.runs_jobs
+
+    def _record(self, key: str, pages: List[Dict], start: float):
+        self.corpus.append(CRAWLS, key, pages, time.perf_counter() - start)
+
+    def fetch(self, url: str) -> List[Dict]:
+        start = time.perf_counter()
+        pages = self.inner.fetch(url)
+        self._record(crawl_key(self.name, url), pages, start)
+        return pages
+
+    async def afetch(self, url: str) -> List[Dict]:
+        start = time.perf_counter()
+        pages = await self.inner.afetch(url)
+        self._record(crawl_key(self.name, url), pages, start)
+        return pages
+
+    def stream(self, url: str, stop: Optional[threading.Event] = None) -> Iterator[List[Dict]]:
+        start = time.perf_counter()
+        pages: List[Dict] = []
+        for batch in self.inner.stream(url, stop):
+            pages += batch
+            self._record(crawl_key(self.name, url), pages, start)
+            yield batch
+
+    async def astream(self, url: str) -> AsyncIterator[List[Dict]]:
+        start = time.perf_counter()
+        pages: List[Dict] = []
+        async for batch in self.inner.astream(url):
+            pages += batch
+            self._record(crawl_key(self.name, url), pages, start)
+            yield batch
+
+    def fetch_new(self, url: str, skip_urls: Sequence[str]) -> List[Dict]:
+        start = time.perf_counter()
+        pages = self.inner.fetch_new(url, skip_urls)
+        self._record(crawl_key(self.name, url, skip_urls), pages, start)
+        return pages
+
+    def submit(self, url: str) -> CrawlJob:
+        start = time.perf_counter()
+        job = self.inner.submit(url)
+
+        def record(job: CrawlJob):
+            try:
+                self._record(crawl_key(self.name, url), job.result(), start)
+            except Exception as e:
+                logger.warning(f"Not recording failed crawl of {url}: {str(e)}")
+
+        job.add_done_callback(record)
+        return job
+
+    def completion_times(self) -> Optional[Dict[str, Dict[str, float]]]:
+        return self.inner.completion_times()
+
+    def close(self):
+        self.inner.close()
+
+
+class ReplayBackend(FetchBackend):
+    """Serves recorded crawl responses, with optional injected latency."""
+
+    def __init__(self, corpus: Corpus, name: str = "firecrawl", latency: Optional[LatencyModel] = None):
+        self.corpus = corpus
+        self.name = name
+        self.latency = latency
+
+    def _lookup(self, key: str):
+        record = self.corpus.get(CRAWLS, key)
+        if record is None:
+            raise ReplayMissError(f"No recorded crawl for {key}")
+        delay = self.latency(record["elapsed"]) if self.latency else 0.0
+        return record["value"], delay
+
+    def _replay(self, key: str) -> List[Dict]:
+        pages, delay = self._lookup(key)
+        if delay:
+            time.sleep(delay)
+        return pages
+
+    def fetch(self, url: str) -> List[Dict]:
+        return self._replay(crawl_key(self.name, url))
+
+    async def afetch(self, url: str) -> List[Dict]:
+        pages, delay = self._lookup(crawl_key(self.name, url))
+        if delay:
+            await asyncio.sleep(delay)
+        return pages
+
+    def fetch_new(self, url: str, skip_urls: Sequence[str]) -> List[Dict]:
+        # Without a recording that skipped these pages, the whole crawl
+        # stands in for it, as for backends that can't skip pages.
+        key = crawl_key(self.name, url, skip_urls)
+        return self._replay(key if self.corpus.get(CRAWLS, key) is not None else crawl_key(self.name, url))
+
+
+def _completion(content: str) -> Any:
+    """Build an object shaped like an OpenAI chat completion."""
+    message = SimpleNamespace(role="assistant", content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")])
+
+
+class _RecordingCompletions:
+    def __init__(self, inner: Any, corpus: Corpus):
+        self.inner = inner
+        self.corpus = corpus
+
+    def create(self, **kwargs):
+        start = time.perf_counter()
+        response = self.inner.create(**kwargs)
+        self.corpus.append(COMPLETIONS, completion_key(kwargs), response.choices[0].message.content,
+                           time.perf_counter() - start)
+        return response
+
+
+class _AsyncRecordingCompletions(_RecordingCompletions):
+    async def create(self, **kwargs):
+        start = time.perf_counter()
+        response = await self.inner.create(**kwargs)
+        self.corpus.append(COMPLETIONS, completion_key(kwargs), response.choices[0].message.content,
+                           time.perf_counter() - start)
+        return response
+
+
+class _ReplayCompletions:
+    def __init__(self, corpus: Corpus, latency: Optional[LatencyModel]):
+        self.corpus = corpus
+        self.latency = latency
+
+    def _lookup(self, kwargs: Dict[str, Any]):
+        record = self.corpus.get(COMPLETIONS, completion_key(kwargs))
+        if record is None:
+            last_message = (kwargs.get("messages") or [{}])[-1].get("content")
+            raise ReplayMissError(f"No recorded completion for {last_message!r}")
+        delay = self.latency(record["elapsed"]) if self.latency else 0.0
+        return _completion(record["value"]), delay
+
+    def create(self, **kwargs):
+        response, delay = self._lookup(kwargs)
+        if delay:
+            time.sleep(delay)
+        return response
+
+
+class _AsyncReplayCompletions(_ReplayCompletions):
+    async def create(self, **kwargs):
+        response, delay = self._lookup(kwargs)
+        if delay:
+            await asyncio.sleep(delay)
+        return response
+
+
+class RecordingOpenAI:
+    """Wraps an OpenAI or AsyncOpenAI client and records chat completions."""
+
+    def __init__(self, inner: Any, corpus: Corpus, is_async: bool = False):
+        completions_class = _AsyncRecordingCompletions if is_async else _RecordingCompletions
+        self.chat = SimpleNamespace(completions=completions_class(inner.chat.completions, corpus))
+
+
+class ReplayOpenAI:
+    """Stands in for an OpenAI or AsyncOpenAI client, serving recorded chat completions."""
+
+    def __init__(self, corpus: Corpus, latency: Optional[LatencyModel] = None, is_async: bool = False):
+        completions_class = _AsyncReplayCompletions if is_async else _ReplayCompletions
+        self.chat = SimpleNamespace(completions=completions_class(corpus, latency))
@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from listings import Listing
+
+# Session used by callers that don't name one, such as the single-user REPL.
+DEFAULT_SESSION_ID = "default"
+
+
+def _price_per_m2(listing: Listing) -> Optional[float]:
+    if listing.price_dkk and listing.size_m2:
+        return listing.price_dkk / listing.size_m2
+    return None
+
+
+# Orders stored results can be sorted in, by the name a follow-up uses.
+SORT_KEYS: Dict[str, Callable[[Listing], Any]] = {
+    "price": lambda listing: listing.price_dkk,
+    "size": lambda listing: listing.size_m2,
+    "rooms": lambda listing: listing.bedrooms,
+    "price_per_m2": _price_per_m2,
+    "deposit": lambda listing: listing.deposit_dkk,
+    "available_from": lambda listing: listing.available_from,
+}
+
+
+def sort_listings(listings: List[Listing], by: str, descending: bool = False) -> List[Listing]:
+    """Return listings sorted by one of SORT_KEYS; listings without that value come last.
+
+    Ties keep their previous order.
+    """
+    key = SORT_KEYS.get(by.strip().lower().replace(" ", "_"))
+    if key is None:
+        raise ValueError(f"Unknown sort order: {by}. Available: {', '.join(SORT_KEYS)}")
+    known = [listing for listing in listings if key(listing) is not None]
+    unknown = [listing for listing in listings if key(listing) is None]
+    return sorted(known, key=key, reverse=descending) + unknown
+
+
+@dataclass
+class SearchSession:
+    """The listings of a session's latest search, and how many of them have been shown."""
+    criteria: Any
+    listings: List[Listing]
+    search_url: Optional[str] = None
+    shown: int = 0
+
+    def next_page(self, size: int) -> Tuple[int, List[Listing]]:
+        """Return the number of the first listing not shown yet and up to size listings from it.
+
+        The returned listings count as shown.
+        """
+        start = self.shown
+        page = self.listings[start:start + size]
+        self.shown = start + len(page)
+        return start + 1, page
+
+    def sort(self, by: str, descending: bool = False):
+        """Re-order the listings by one of SORT_KEYS and show them again from the first."""
+        self.listings = sort_listings(self.listings, by, descending)
+        self.shown = 0
+
+
+class SessionStore:
+    """The latest search results of each session, for follow-ups to page and sort without searching again.
+
+    Holds up to max_sessions sessions, evicting the least recently used;
+    sessions unused for ttl seconds expire.
+    """
+
+    def __init__(self, max_sessions: int = 1024, ttl: float = 3600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, Tuple[SearchSession, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session_id: str) -> Optional[SearchSession]:
+        """Return the session's latest search, or None if it has none."""
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or now - entry[1] > self.ttl:
+                self._sessions.pop(session_id, None)
+                self.misses += 1
+                return None
+            self._sessions[session_id] = (entry[0], now)
+            self._sessions.move_to_end(session_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, session_id: str, session: SearchSession):
+        """Store a session's latest search, replacing its previous one."""
+        with self._lock:
+            self._sessions[session_id] = (session, time.time())
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def drop(self, session_id: str):
+        """Forget a session's search."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of sessions held, lookups that found one and missed, and evictions."""
+        return {
+            "sessions": len(self._sessions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,346 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one execution.
+
+    The first caller for a key runs the work; callers arriving while it is
+    in flight wait for and share its result or exception.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, Future] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Run fn for key, or wait for the call already in flight."""
+        with self._lock:
+            self.calls += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            logger.info(f"Joining in-flight call for {key}")
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Async variant of do; also joins a blocking call for key already in flight."""
+        with self._lock:
+            self.calls += 1
+            future = self._calls.get(key)
+            task = self._tasks.get(key)
+            if future is not None or task is not None:
+                self.coalesced += 1
+            else:
+                self.executions += 1
+                task = asyncio.ensure_future(fn())
+                self._tasks[key] = task
+                task.add_done_callback(lambda _: self._forget_task(key, task))
+
+        if future is not None:
+            logger.info(f"Joining in-flight call for {key}")
+            return await asyncio.wrap_future(future)
+        # Shield the shared task so one cancelled caller doesn't cancel it
+        # for everyone else waiting on it.
+        return await asyncio.shield(task)
+
+    def _forget_task(self, key: str, task: asyncio.Task):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Return call counters; coalesced is the number of executions saved."""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + len(self._tasks),
+            }
+
+
+class _Consumer:
+    """One consumer of a shared stream: how far it has read, and whether it has stopped."""
+
+    def __init__(self, stop: Optional[threading.Event] = None):
+        self.stop = stop or threading.Event()
+        self.left = threading.Event()
+        self.position = 0
+
+    def active(self) -> bool:
+        return not (self.stop.is_set() or self.left.is_set())
+
+
+class _Flight:
+    """One shared stream: the items not yet read by every consumer, and how it ended.
+
+    items[0] is the stream's item number base; earlier ones have been read
+    by every consumer and dropped.
+    """
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.base = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = threading.Condition()
+        self.consumers: List[_Consumer] = []
+        # Async streams only.
+        self.task: Optional[asyncio.Task] = None
+        self.updated: Optional[asyncio.Event] = None
+
+    def end(self) -> int:
+        return self.base + len(self.items)
+
+    def join(self, consumer: _Consumer) -> bool:
+        """Add consumer from the stream's first item; False once that item has been dropped."""
+        with self.changed:
+            if self.base:
+                return False
+            self.consumers.append(consumer)
+            return True
+
+    def trim(self):
+        """Drop the items every active consumer has read. Call holding changed."""
+        low = min((consumer.position for consumer in self.consumers if consumer.active()), default=self.end())
+        if low > self.base:
+            del self.items[:low - self.base]
+            self.base = low
+
+
+class _AllStopped:
+    """Stop signal of a shared stream, set once every consumer has stopped.
+
+    Offers the is_set and wait of threading.Event, so it can be passed
+    wherever a stream takes one.
+    """
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, flight: _Flight):
+        self._flight = flight
+
+    def is_set(self) -> bool:
+        with self._flight.changed:
+            return not any(consumer.active() for consumer in self._flight.consumers)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.is_set():
+            remaining = self.POLL_INTERVAL if deadline is None else deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(remaining, self.POLL_INTERVAL))
+        return True
+
+
+class SharedStream:
+    """Shares one in-flight stream per key among concurrent consumers.
+
+    The first consumer for a key starts the stream; consumers arriving
+    while it runs get the items produced so far, then each new one as it
+    comes. The stream stops once every consumer has.
+
+    Items are held only until every consumer has read them, so a stream
+    never keeps all it has produced. A consumer arriving after the first
+    items were dropped can't be given them, and runs produce on its own
+    instead.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._aflights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self.streams = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    def stream(self, key: str, produce: Callable[[Any], Iterable[Any]],
+               stop: threading.Event) -> Iterator[Any]:
+        """Yield the items of the stream for key, starting it with produce(stop) or joining it.
+
+        The stop passed to produce is set once every consumer's stop is.
+        Keep iterating after setting stop until this returns: the first
+        consumer runs the stream, and carries on for the others without
+        yielding.
+        """
+        consumer = _Consumer(stop)
+        with self._lock:
+            self.streams += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                flight.join(consumer)
+                self._flights[key] = flight
+                self.executions += 1
+            elif flight.join(consumer):
+                self.coalesced += 1
+            else:
+                self.executions += 1
+                flight = None
+
+        try:
+            if flight is None:
+                logger.info(f"Stream for {key} is past its start; running it separately")
+                yield from produce(stop)
+            elif leader:
+                yield from self._lead(key, flight, produce, consumer)
+            else:
+                logger.info(f"Joining in-flight stream for {key}")
+                yield from self._follow(flight, consumer)
+        finally:
+            consumer.left.set()
+            if flight is not None:
+                with flight.changed:
+                    flight.trim()
+
+    def _lead(self, key: str, flight: _Flight, produce: Callable[[Any], Iterable[Any]],
+              consumer: _Consumer) -> Iterator[Any]:
+        try:
+            for item in produce(_AllStopped(flight)):
+                with flight.changed:
+                    # Every earlier item has been yielded by now.
+                    consumer.position = flight.end()
+                    flight.items.append(item)
+                    flight.trim()
+                    flight.changed.notify_all()
+                if consumer.active():
+                    yield item
+        except BaseException as e:
+            flight.error = e
+            if consumer.active():
+                raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            with flight.changed:
+                consumer.position = flight.end()
+                flight.done = True
+                flight.trim()
+                flight.changed.notify_all()
+
+    @staticmethod
+    def _follow(flight: _Flight, consumer: _Consumer) -> Iterator[Any]:
+        while consumer.active():
+            with flight.changed:
+                while consumer.position == flight.end() and not flight.done and consumer.active():
+                    flight.changed.wait(_AllStopped.POLL_INTERVAL)
+                items = flight.items[consumer.position - flight.base:]
+                done, error = flight.done, flight.error
+            for item in items:
+                yield item
+                consumer.position += 1
+            with flight.changed:
+                flight.trim()
+            if done and consumer.position == flight.end():
+                if error is not None:
+                    raise error if isinstance(error, Exception) else RuntimeError(f"Shared stream ended: {error!r}")
+                return
+
+    async def astream(self, key: str, produce: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Async variant of stream; the stream runs as a task, cancelled once every consumer has left."""
+        consumer = _Consumer()
+        with self._lock:
+            self.streams += 1
+            flight = self._aflights.get(key)
+            if flight is None:
+                flight = _Flight()
+                flight.join(consumer)
+                flight.updated = asyncio.Event()
+                flight.task = asyncio.ensure_future(self._aproduce(key, flight, produce))
+                self._aflights[key] = flight
+                self.executions += 1
+            elif flight.join(consumer):
+                logger.info(f"Joining in-flight stream for {key}")
+                self.coalesced += 1
+            else:
+                self.executions += 1
+                flight = None
+
+        if flight is None:
+            logger.info(f"Stream for {key} is past its start; running it separately")
+            async for item in produce():
+                yield item
+            return
+
+        try:
+            while True:
+                while consumer.position < flight.end():
+                    item = flight.items[consumer.position - flight.base]
+                    yield item
+                    consumer.position += 1
+                    with flight.changed:
+                        flight.trim()
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.updated.wait()
+        finally:
+            consumer.left.set()
+            with flight.changed:
+                flight.trim()
+                listening = any(other.active() for other in flight.consumers)
+            if not listening and not flight.done:
+                flight.task.cancel()
+
+    async def _aproduce(self, key: str, flight: _Flight, produce: Callable[[], AsyncIterator[Any]]):
+        try:
+            async for item in produce():
+                with flight.changed:
+                    flight.items.append(item)
+                self._notify(flight)
+        except Exception as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                if self._aflights.get(key) is flight:
+                    del self._aflights[key]
+            flight.done = True
+            self._notify(flight)
+
+    @staticmethod
+    def _notify(flight: _Flight):
+        updated, flight.updated = flight.updated, asyncio.Event()
+        updated.set()
+
+    def stats(self) -> Dict[str, int]:
+        """Return stream counters; coalesced is the number of streams that joined one in flight."""
+        with self._lock:
+            return {
+                "streams": self.streams,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._flights) + len(self._aflights),
+            }
@@ -0,0 +1,57 @@
+import asyncio
+import os
+import sys
+from typing import Dict, List
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The agent reads API keys at startup; tests never call the real services.
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("FIRECRAWL_API_KEY", "fc-test")
+
+from fetch_backends import FetchBackend  # noqa: E402
+
+
+def results_page(url: str, cards: int = 18) -> Dict:
+    """Return a results page for url listing cards matching listings."""
+    rooms = int(url.split("-rooms")[0].rsplit("/", 1)[1])
+    base = url.split("?")[0].rstrip("/")
+    text = "\n\n".join(f"Flat {rooms}-{i}\n{rooms} rooms {50 + i} m² {9000 + i * 100}.00 kr." for i in range(cards))
+    links = [f"{base}/apartment-id-{rooms}{i:02d}" for i in range(cards)]
+    return {"url": url, "text": text, "links": links}
+
+
+class FakeBackend(FetchBackend):
+    """Serves one results page per URL, counting fetches."""
+
+    name = "fake"
+
+    def __init__(self, cards: int = 18):
+        self.cards = cards
+        self.fetched: List[str] = []
+
+    def fetch(self, url: str) -> List[Dict]:
+        self.fetched.append(url)
+        return [results_page(url, self.cards)]
+
+    async def afetch(self, url: str) -> List[Dict]:
+        await asyncio.sleep(0)
+        return self.fetch(url)
+
+
+@pytest.fixture
+def backend():
+    return FakeBackend()
+
+
+@pytest.fixture
+def agent(backend, monkeypatch):
+    monkeypatch.setenv("RESULT_CACHE_SIZE", "0")
+    import housing_search
+
+    agent = housing_search.HousingSearchAgent()
+    agent.register_fetch_backend(backend)
+    agent.default_backend = backend.name
+    return agent
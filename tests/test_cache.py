@@ -0,0 +1,200 @@
+import asyncio
+import json
+import threading
+import time
+
+from cache import CrawlCache, LRUCache, ResultCache, TieredCache, canonicalize_url
+from conftest import FakeBackend
+from housing_search import HousingCriteria
+
+
+def pages(size):
+    return [{"url": "https://www.boligportal.dk/", "rawHtml": "x" * size}]
+
+
+def test_memory_tier_is_bounded_by_bytes():
+    page_bytes = len(json.dumps(pages(1000)))
+    cache = LRUCache(max_entries=100, max_bytes=3 * page_bytes)
+    for i in range(10):
+        cache.set(str(i), pages(1000))
+
+    assert len(cache) == 3
+    assert cache.stats()["bytes"] == 3 * page_bytes
+    assert cache.get("0") is None
+    assert cache.get("9") == pages(1000)
+
+
+def test_least_recently_used_values_are_evicted_first():
+    page_bytes = len(json.dumps(pages(1000)))
+    cache = LRUCache(max_entries=100, max_bytes=2 * page_bytes)
+    cache.set("a", pages(1000))
+    cache.set("b", pages(1000))
+    cache.get("a")
+    cache.set("c", pages(1000))
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+
+
+def test_values_larger_than_the_bound_are_not_kept():
+    cache = LRUCache(max_entries=100, max_bytes=500)
+    cache.set("small", pages(10))
+    cache.set("large", pages(1000))
+
+    assert cache.get("large") is None
+    assert cache.get("small") == pages(10)
+
+
+def test_replacing_and_deleting_values_frees_their_bytes():
+    cache = LRUCache(max_entries=100, max_bytes=10 ** 6)
+    cache.set("a", pages(1000))
+    cache.set("a", pages(10))
+    assert cache.stats()["bytes"] == len(json.dumps(pages(10)))
+    cache.delete("a")
+    assert cache.stats()["bytes"] == 0
+
+
+SEARCH_URL = "https://www.boligportal.dk/en/rental-properties/copenhagen/3-rooms/?max_monthly_rent=15000"
+
+
+class SlowBackend(FakeBackend):
+    """Waits for release before each fetch returns."""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def fetch(self, url):
+        self.release.wait(5)
+        return super().fetch(url)
+
+
+def crawl_cache(age, backend=None):
+    """A crawl cache, fresh for 10s and stale for a minute after, holding a crawl of SEARCH_URL made age seconds ago."""
+    cache = CrawlCache(TieredCache(LRUCache()), ttl=10, stale_ttl=60)
+    cache.cache.set(canonicalize_url(SEARCH_URL), [{"url": SEARCH_URL, "text": "old"}], stored_at=time.time() - age)
+    return cache
+
+
+def test_crawl_cache_serves_fresh_entries_under_their_canonical_url():
+    backend = FakeBackend()
+    cache = crawl_cache(age=5)
+
+    pages = cache.get("HTTPS://www.boligportal.dk/en/rental-properties/copenhagen/3-rooms?max_monthly_rent=15000#map",
+                      backend.fetch)
+
+    assert pages[0]["text"] == "old"
+    assert backend.fetched == []
+    assert cache.stats()["fresh_hits"] == 1
+
+
+def test_stale_crawls_are_served_while_a_single_refresh_replaces_them():
+    backend = SlowBackend()
+    cache = crawl_cache(age=30)
+
+    served = [cache.get(SEARCH_URL, backend.fetch)[0]["text"] for _ in range(5)]
+    backend.release.set()
+    cache._executor.shutdown(wait=True)
+
+    assert served == ["old"] * 5
+    assert backend.fetched == [SEARCH_URL]
+    assert cache.stats()["stale_hits"] == 5 and cache.stats()["refreshes"] == 1
+    assert cache.get(SEARCH_URL, backend.fetch)[0]["text"] != "old"
+    assert cache.stats()["fresh_hits"] == 1
+
+
+def test_async_stale_crawls_are_refreshed_once_on_the_running_loop():
+    backend = FakeBackend()
+    cache = crawl_cache(age=30)
+
+    async def run():
+        served = [(await cache.aget(SEARCH_URL, backend.afetch))[0]["text"] for _ in range(3)]
+        await asyncio.gather(*cache._tasks)
+        return served
+
+    assert asyncio.run(run()) == ["old"] * 3
+    assert backend.fetched == [SEARCH_URL]
+    assert cache.stats()["refreshes"] == 1
+
+
+def test_crawls_past_the_stale_window_are_fetched_again():
+    backend = FakeBackend()
+    cache = crawl_cache(age=100)
+
+    assert cache.get(SEARCH_URL, backend.fetch)[0]["text"] != "old"
+    assert backend.fetched == [SEARCH_URL]
+    assert cache.stats()["misses"] == 1
+
+
+def criteria(location="copenhagen", **values):
+    return HousingCriteria(**{"location": location, "max_price": 15000, "min_bedrooms": 2, **values})
+
+
+def test_searches_cover_narrower_price_room_and_size_bounds():
+    broad = criteria(max_size_m2=100)
+
+    assert broad.covers(criteria(max_price=12000, min_bedrooms=3, min_size_m2=40, max_size_m2=80))
+    assert not broad.covers(criteria(max_price=16000))
+    assert not broad.covers(criteria(min_bedrooms=1))
+    assert not broad.covers(criteria(max_size_m2=None))
+    # Room counts above the fan-out are searched exactly, so 5 rooms doesn't cover 6.
+    assert not criteria(min_bedrooms=5).covers(criteria(min_bedrooms=6))
+
+
+def test_unset_flags_cover_set_ones_but_not_the_reverse():
+    for flag in ("furnished", "pets_allowed", "immediate_availability"):
+        assert criteria().covers(criteria(**{flag: True}))
+        assert not criteria(**{flag: True}).covers(criteria())
+    assert criteria().covers(criteria(furnished=False))
+    assert not criteria(furnished=True).covers(criteria(furnished=False))
+
+
+def test_location_lists_cover_each_of_their_locations():
+    both = criteria(["copenhagen", "aarhus"])
+
+    assert both.covers(criteria("aarhus"))
+    assert both.covers(criteria(["aarhus", "copenhagen"]))
+    assert not criteria("copenhagen").covers(both)
+    assert not both.covers(criteria(["aarhus", "odense"]))
+
+
+def test_result_cache_answers_narrower_searches_from_the_latest_covering_one():
+    cache = ResultCache(HousingCriteria.covers, locations=HousingCriteria.locations)
+    cache.set(criteria(["copenhagen", "aarhus"]), ["both"])
+    cache.set(criteria("aarhus", max_price=20000), ["aarhus"])
+
+    assert cache.get(criteria("aarhus", max_price=12000)) == (criteria("aarhus", max_price=20000), ["aarhus"])
+    assert cache.get(criteria("copenhagen", furnished=True))[1] == ["both"]
+    assert cache.get(criteria("copenhagen", max_price=20000)) is None
+    assert cache.get(criteria("aarhus"), namespace="other") is None
+    assert cache.stats() == {"entries": 2, "exact_hits": 0, "covering_hits": 2, "misses": 2}
+
+
+def test_result_cache_checks_only_entries_for_the_searched_location():
+    checked = []
+
+    def covers(cached, narrower):
+        checked.append(cached.locations())
+        return cached.covers(narrower)
+
+    cache = ResultCache(covers, locations=HousingCriteria.locations)
+    for price in range(8000, 9000, 10):
+        cache.set(criteria("odense", max_price=price), [])
+    cache.set(criteria(["copenhagen", "aarhus"]), ["both"])
+
+    assert cache.get(criteria(["aarhus", "copenhagen"], max_price=9000))[1] == ["both"]
+    assert cache.get(criteria("aalborg")) is None
+    assert checked == [["copenhagen", "aarhus"]]
+
+
+def test_result_cache_drops_expired_and_evicted_entries_from_its_index():
+    cache = ResultCache(HousingCriteria.covers, max_entries=2, ttl=-1, locations=HousingCriteria.locations)
+    cache.set(criteria("odense"), [])
+    cache.set(criteria("aarhus"), [])
+    cache.set(criteria("copenhagen"), [])
+
+    assert cache.stats()["entries"] == 2
+    assert cache.get(criteria("copenhagen")) is None
+    assert cache.get(criteria("aarhus", max_price=9000)) is None
+    assert cache.stats()["entries"] == 0
+    assert cache._by_location == {}
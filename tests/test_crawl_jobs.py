@@ -0,0 +1,89 @@
+import itertools
+from typing import Dict, List
+
+import pytest
+
+import crawl_jobs
+from crawl_jobs import CompletionHistory, CrawlFailedError, CrawlJobManager, poll_delays
+
+
+class FakeFirecrawl:
+    """A crawl API whose jobs complete after a number of status checks, or never."""
+
+    def __init__(self, polls_to_complete=None):
+        self.polls_to_complete = polls_to_complete
+        self.checks = 0
+        self.cancelled: List[str] = []
+
+    def async_crawl_url(self, url: str, params: Dict) -> Dict:
+        return {"id": "job-1"}
+
+    def check_crawl_status(self, job_id: str) -> Dict:
+        self.checks += 1
+        if self.polls_to_complete is not None and self.checks >= self.polls_to_complete:
+            return {"status": "completed", "data": [{"url": "page"}]}
+        return {"status": "scraping", "data": []}
+
+    def cancel_crawl(self, job_id: str):
+        self.cancelled.append(job_id)
+
+
+@pytest.fixture
+def fast_polls(monkeypatch):
+    monkeypatch.setattr(crawl_jobs, "poll_delays", lambda expected=None: itertools.repeat(0.01))
+
+
+def test_polls_back_off_exponentially_up_to_the_maximum():
+    delays = list(itertools.islice(poll_delays(min_interval=1, max_interval=4, backoff=2), 5))
+
+    assert delays == [1, 2, 4, 4, 4]
+
+
+def test_first_poll_waits_until_just_before_the_expected_completion():
+    delays = list(itertools.islice(poll_delays(expected=10, min_interval=1, max_interval=4, backoff=2), 3))
+
+    assert delays == [9.0, 1, 2]
+    # An expected time shorter than the first interval changes nothing.
+    assert next(poll_delays(expected=0.5, min_interval=1)) == 1
+
+
+def test_history_estimates_the_lower_quartile_per_url_pattern():
+    history = CompletionHistory()
+    for seconds in (40, 10, 30, 20):
+        history.record("https://www.boligportal.dk/en/rental-properties/copenhagen/3-rooms/", seconds)
+
+    assert history.estimate("https://www.boligportal.dk/en/rental-properties/copenhagen/4-rooms/") == 20
+    assert history.estimate("https://www.boligportal.dk/en/rental-properties/aarhus/4-rooms/") is None
+
+
+def test_job_resolves_once_the_crawl_completes(fast_polls):
+    firecrawl = FakeFirecrawl(polls_to_complete=3)
+    manager = CrawlJobManager(firecrawl)
+    job = manager.submit("https://www.boligportal.dk/en/rental-properties/copenhagen/", {})
+
+    assert job.result(5) == [{"url": "page"}]
+    assert job.polls == 3
+    assert manager.history.estimate(job.url) is not None
+    manager.shutdown()
+
+
+def test_jobs_that_time_out_are_cancelled(fast_polls):
+    firecrawl = FakeFirecrawl()
+    manager = CrawlJobManager(firecrawl, timeout=0.05)
+    job = manager.submit("https://www.boligportal.dk/en/rental-properties/copenhagen/", {})
+
+    with pytest.raises(CrawlFailedError, match="did not finish"):
+        job.result(5)
+    assert firecrawl.cancelled == ["job-1"]
+    manager.shutdown()
+
+
+def test_stream_cancels_the_job_when_closed_early(fast_polls):
+    firecrawl = FakeFirecrawl()
+    manager = CrawlJobManager(firecrawl)
+    firecrawl.check_crawl_status = lambda job_id: {"status": "scraping", "data": [{"url": "page"}]}
+    stream = manager.stream("https://www.boligportal.dk/en/rental-properties/copenhagen/", {})
+
+    assert next(stream) == [{"url": "page"}]
+    stream.close()
+    assert firecrawl.cancelled == ["job-1"]
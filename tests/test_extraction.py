@@ -0,0 +1,119 @@
+import json
+from datetime import date
+
+from extraction import PageExtractor, PageScan, extract_page, extract_text_cards
+
+
+def test_scan_reads_every_field_regardless_of_case():
+    fields = PageScan("RENT 12.500,00 KR.\nDeposit: 37.500 kr\n3 ROOMS · 80 M2 · Floor: st\n"
+                      "Available from 1 December\nUnfurnished").fields()
+
+    assert fields["price_dkk"] == 12500.0
+    assert fields["deposit_dkk"] == 37500.0
+    assert fields["bedrooms"] == 3
+    assert fields["size_m2"] == 80.0
+    assert fields["floor"] == 0
+    assert fields["available_from"].endswith("-12-01")
+    assert fields["furnished"] is False
+
+
+def test_scan_reads_danish_fields():
+    text = "Forudbetalt leje 24.000 DKK\nHusleje 8.000,-\n4 værelser, 3. sal\nLedig nu, husdyr tilladt"
+    fields = PageScan(text).fields()
+
+    assert fields == {"deposit_dkk": 24000.0, "price_dkk": 8000.0, "bedrooms": 4, "floor": 3,
+                      "available_from": date.today().isoformat(), "pets_allowed": True}
+
+
+def test_scan_skips_number_tails_and_words_inside_other_words():
+    fields = PageScan("3.5 rooms, 19.5 m²\nrefurnished, petsitter wanted").fields()
+
+    assert fields == {"size_m2": 19.5}
+
+
+def test_scan_keeps_positions_when_lower_casing_changes_length():
+    fields = PageScan("İstanbul Street, 4 rooms, furnished, 9.000 kr").fields()
+
+    assert fields == {"bedrooms": 4, "furnished": True, "price_dkk": 9000.0}
+
+
+def structured_page(results, text, links):
+    state = json.dumps({"props": {"pageProps": {"results": results}}})
+    return {
+        "url": "https://www.boligportal.dk/en/rental-properties/copenhagen/3-rooms/",
+        "text": text,
+        "links": links,
+        "rawHtml": f'<html><script id="__NEXT_DATA__" type="application/json">{state}</script></html>',
+    }
+
+
+def listing_path(number):
+    return f"/en/rental-properties/copenhagen/3-rooms/apartment-id-{number}"
+
+
+def test_structured_listings_are_merged_with_the_text_cards():
+    results = [{"title": f"Flat {n}", "url": listing_path(n), "monthly_rent": 9000 + n, "rooms": 3, "size_m2": 70}
+               for n in (1, 2)]
+    text = "\n".join(f"Flat {n}\n3 rooms · 70 m² · Furnished\n{9000 + n} kr" for n in (1, 2, 3))
+    links = [f"https://www.boligportal.dk{listing_path(n)}" for n in (1, 2, 3)]
+    cards = extract_page(structured_page(results, text, links))
+
+    assert [card.url for card in cards] == [listing_path(1), listing_path(2), links[2]]
+    assert [card.fields["price_dkk"] for card in cards] == [9001.0, 9002.0, 9003.0]
+    # Fields only the text has are kept for the structured listings too.
+    assert all(card.fields["furnished"] is True for card in cards)
+
+
+def test_unlinked_text_cards_match_structured_listings_by_their_figures():
+    results = [{"title": f"Flat {n}", "url": listing_path(n), "monthly_rent": 9000 + n, "rooms": 3, "size_m2": 70}
+               for n in (1, 2)]
+    text = "\n".join(f"Flat {n}\n3 rooms · 70 m²\n{9000 + n} kr" for n in (1, 2, 3))
+    # Too few listing links to pair with the text cards.
+    cards = extract_page(structured_page(results, text, []))
+
+    assert [(card.url, card.fields["price_dkk"]) for card in cards] == [
+        (listing_path(1), 9001.0), (listing_path(2), 9002.0), (None, 9003.0),
+    ]
+
+
+def test_pages_without_structured_listings_use_the_text_cards():
+    page = structured_page([], "Flat 1\n3 rooms · 70 m²\n9001 kr\nFlat 2\n3 rooms · 72 m²\n9002 kr", [])
+    extractor = PageExtractor()
+    cards = extractor.extract(page)
+
+    assert [card.fields["size_m2"] for card in cards] == [70.0, 72.0]
+    assert extractor.stats()["text_pages"] == 1
+    assert extractor.stats()["structured_pages"] == 0
+
+
+def card_summaries(text):
+    return [(card.text.split("\n")[0], card.fields.get("price_dkk"), card.fields.get("bedrooms"),
+             card.fields.get("size_m2")) for card in PageScan(text).cards()]
+
+
+def test_cards_with_rooms_and_size_after_the_rent():
+    text = "\n".join(["12 results"] + [f"Flat {n}\n{9000 + n} kr\n{n} rooms · {50 + n} m²" for n in (1, 2, 3)])
+
+    assert card_summaries(text) == [("Flat 1", 9001.0, 1, 51.0), ("Flat 2", 9002.0, 2, 52.0),
+                                    ("Flat 3", 9003.0, 3, 53.0)]
+
+
+def test_cards_with_details_before_the_rent_and_a_trailing_line():
+    text = "\n".join(f"Flat {n}\n{n} rooms · {50 + n} m²\nRent {9000 + n} kr\nShow on map" for n in (1, 2, 3))
+
+    assert card_summaries(text) == [("Flat 1", 9001.0, 1, 51.0), ("Flat 2", 9002.0, 2, 52.0),
+                                    ("Flat 3", 9003.0, 3, 53.0)]
+
+
+def test_cards_are_cut_at_listing_links_in_the_text():
+    urls = [f"https://www.boligportal.dk{listing_path(n)}" for n in (1, 2, 3)]
+    text = "\n".join(["# 3 room apartments"] + [
+        f"[![photo]({url}/photo.jpg)]({url})\n{n} rooms · {50 + n} m²\n[Flat {n}]({url})\n{9000 + n} kr"
+        for n, url in zip((1, 2, 3), urls)
+    ])
+    cards = extract_text_cards({"url": "https://www.boligportal.dk/en/rental-properties/", "text": text, "links": []})
+
+    assert [card.url for card in cards] == urls
+    assert [(card.fields["price_dkk"], card.fields["size_m2"]) for card in cards] == [
+        (9001.0, 51.0), (9002.0, 52.0), (9003.0, 53.0),
+    ]
@@ -0,0 +1,125 @@
+import re
+from typing import List
+
+import pytest
+import requests
+
+from fetch_backends import CrawlScope, DirectHTTPBackend, FirecrawlBackend, html_to_page
+from housing_search import HousingCriteria
+
+RESULTS_HTML = """<html><head><title>Rentals</title><style>p { color: red }</style>
+<script>window.__STATE__ = {"results": []}</script></head>
+<body><h1>5 room apartments</h1>
+<ul>
+  <li><a href="apartment-id-501">Flat <b>1</b></a><p>5 rooms &middot; 80 m&sup2;</p><p>9.001 kr.</p></li>
+  <li><a href="/en/rental-properties/copenhagen/5-rooms/apartment-id-502">Flat 2</a>
+      <p>5 rooms &middot; 82 m&sup2;</p><p>9.002 kr.</p></li>
+</ul>
+<a href="#top">Top</a> <a href="mailto:help@example.com">Mail</a> <a href="apartment-id-501">Again</a>
+</body></html>"""
+
+SEARCH_URL = "https://www.boligportal.dk/en/rental-properties/copenhagen/5-rooms/"
+
+
+class FakeResponse:
+    def __init__(self, url: str, text: str, status: int = 200):
+        self.url = url
+        self.text = text
+        self.status_code = status
+        self.elapsed = requests.Response().elapsed
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error for {self.url}")
+
+
+class FakeSession(requests.Session):
+    """Answers every GET with RESULTS_HTML, or with status if it's an error."""
+
+    def __init__(self, status: int = 200):
+        super().__init__()
+        self.status = status
+        self.requests: List[tuple] = []
+
+    def get(self, url, **kwargs):
+        self.requests.append((url, kwargs))
+        return FakeResponse(url, RESULTS_HTML, self.status)
+
+
+def test_html_to_page_keeps_visible_text_and_resolves_links():
+    page = html_to_page(SEARCH_URL, RESULTS_HTML)
+
+    assert page["text"].split("\n") == [
+        "Rentals", "5 room apartments", "Flat 1", "5 rooms · 80 m²", "9.001 kr.",
+        "Flat 2", "5 rooms · 82 m²", "9.002 kr.", "Top", "Mail", "Again",
+    ]
+    assert page["links"] == [SEARCH_URL + "apartment-id-501", SEARCH_URL + "apartment-id-502"]
+    assert page["rawHtml"] == RESULTS_HTML
+
+
+def test_direct_backend_fetches_the_results_page_over_its_session():
+    session = FakeSession()
+    backend = DirectHTTPBackend(timeout=3, session=session)
+    pages = backend.fetch(SEARCH_URL)
+
+    assert [page["url"] for page in pages] == [SEARCH_URL]
+    assert session.requests == [(SEARCH_URL, {"timeout": 3})]
+    assert session.headers["User-Agent"].startswith("Mozilla/5.0")
+    assert session.get_adapter(SEARCH_URL).max_retries.total == 2
+
+
+def test_direct_backend_raises_http_errors():
+    with pytest.raises(requests.HTTPError):
+        DirectHTTPBackend(session=FakeSession(status=503)).fetch(SEARCH_URL)
+
+
+def test_searches_can_use_the_direct_backend(agent):
+    agent.register_fetch_backend(DirectHTTPBackend(session=FakeSession()))
+    criteria = HousingCriteria(location="copenhagen", max_price=20000, min_bedrooms=5)
+    listings = list(agent.stream_search(criteria, backend="http"))
+
+    assert sorted(listing.price_dkk for listing in listings) == [9001.0, 9002.0]
+    assert {listing.listing_url for listing in listings} == {SEARCH_URL + "apartment-id-501",
+                                                             SEARCH_URL + "apartment-id-502"}
+
+
+def matches(patterns, path):
+    return any(re.search(pattern, path) for pattern in patterns)
+
+
+def test_scope_includes_the_results_page_and_listings_under_the_listings_root():
+    includes = CrawlScope().include_patterns(SEARCH_URL + "?max_monthly_rent=9000")
+
+    assert matches(includes, "/en/rental-properties/copenhagen/5-rooms/")
+    assert matches(includes, "/en/rental-properties/copenhagen/5-rooms")
+    assert matches(includes, "/en/rental-properties/copenhagen/5-rooms/apartment-id-501")
+    assert matches(includes, "/en/rental-properties/frederiksberg/apartment-id-502")
+    assert not matches(includes, "/en/rental-properties/aarhus/5-rooms/")
+    assert not matches(includes, "/en/landlord/create-listing")
+
+
+def test_listings_only_scopes_leave_out_further_results_pages():
+    includes = CrawlScope(listings_only=True, include_paths=[r"^/en/map/"]).include_patterns(SEARCH_URL)
+
+    assert not matches(includes, "/en/rental-properties/copenhagen/5-rooms/")
+    assert matches(includes, "/en/rental-properties/copenhagen/5-rooms/apartment-id-501")
+    assert matches(includes, "/en/map/copenhagen")
+
+
+def test_default_excludes_cover_account_help_and_marketing_pages():
+    excludes = CrawlScope().exclude_paths
+
+    for path in ("/en/login", "/en/user/favourites", "/help/faq", "/en/terms", "/en/landlord/pricing"):
+        assert matches(excludes, path), path
+    for path in ("/en/rental-properties/copenhagen/5-rooms/", "/en/rental-properties/copenhagen/apartment-id-501"):
+        assert not matches(excludes, path), path
+
+
+def test_firecrawl_crawls_are_restricted_to_the_scope():
+    scope = CrawlScope(max_depth=1, exclude_paths=[r"/print/"])
+    params = FirecrawlBackend(firecrawl=None, page_limit=5, scope=scope).crawl_params(
+        SEARCH_URL, skip_urls=[SEARCH_URL + "apartment-id-501"])
+
+    assert params["limit"] == 5 and params["maxDepth"] == 1 and params["ignoreSitemap"] is True
+    assert params["includePaths"] == scope.include_patterns(SEARCH_URL)
+    assert params["excludePaths"] == [r"/print/", r"^/en/rental\-properties/copenhagen/5\-rooms/apartment\-id\-501/?$"]
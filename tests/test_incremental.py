@@ -0,0 +1,93 @@
+import json
+import re
+from typing import Dict, List, Sequence
+from urllib.parse import urlsplit
+
+from fetch_backends import CrawlScope, FetchBackend
+from housing_search import HousingCriteria
+
+
+def criteria():
+    return HousingCriteria(location="copenhagen", max_price=20000, min_bedrooms=5)
+
+
+class Site(FetchBackend):
+    """A crawlable site of two results pages and the listings they link to.
+
+    Crawls honour CrawlScope's excludePaths as Firecrawl does, matching
+    each pattern against a page's path (with and without its query).
+    """
+
+    name = "site"
+
+    def __init__(self, search_url: str):
+        self.search_url = search_url
+        self.listings: List[int] = list(range(1, 5))
+        self.crawled: List[List[str]] = []
+
+    def _listing_url(self, number: int) -> str:
+        return f"https://www.boligportal.dk/en/rental-properties/copenhagen/5-rooms/apartment-id-{number}"
+
+    def pages(self) -> List[Dict]:
+        pages = []
+        halves = [self.listings[:2], self.listings[2:]]
+        for offset, numbers in zip((0, 2), halves):
+            url = self.search_url if not offset else f"{self.search_url}&offset={offset}"
+            text = "\n\n".join(f"Flat {n}\n5 rooms 80 m²\n{9000 + n}.00 kr." for n in numbers)
+            pages.append({"url": url, "text": text, "links": [self._listing_url(n) for n in numbers]})
+        for number in self.listings:
+            text = f"Flat {number}\n5 rooms 80 m²\n{9000 + number}.00 kr."
+            pages.append({"url": self._listing_url(number), "text": text, "links": []})
+        return pages
+
+    def fetch(self, url: str) -> List[Dict]:
+        return self.fetch_new(url, ())
+
+    def fetch_new(self, url: str, skip_urls: Sequence[str]) -> List[Dict]:
+        excludes = CrawlScope().params(url, skip_urls)["excludePaths"]
+        pages = []
+        for page in self.pages():
+            parts = urlsplit(page["url"])
+            targets = [parts.path, f"{parts.path}?{parts.query}" if parts.query else parts.path]
+            if not any(re.search(pattern, target) for pattern in excludes for target in targets):
+                pages.append(page)
+        self.crawled.append([page["url"] for page in pages])
+        return pages
+
+
+def test_refresh_finds_listings_added_after_the_first_crawl(agent):
+    site = Site(agent.plan_search_urls(criteria())[0])
+    agent.register_fetch_backend(site)
+
+    first = agent.refresh_search(criteria(), backend="site")
+    assert len(first["listings"]) == 4
+
+    site.listings.append(5)
+    second = agent.refresh_search(criteria(), backend="site")
+    assert [listing["listing_url"] for listing in second["listings"]] == [site._listing_url(5)]
+
+    site.listings.append(6)
+    third = agent.refresh_search(criteria(), backend="site")
+    assert [listing["listing_url"] for listing in third["listings"]] == [site._listing_url(6)]
+    # Both results pages were crawled every time; known listing pages were skipped.
+    assert site.search_url in site.crawled[2] and f"{site.search_url}&offset=2" in site.crawled[2]
+    assert site._listing_url(1) not in site.crawled[2]
+
+    # Results leave the agent as plain data; the delta since the first refresh holds both new listings.
+    delta = agent.search_delta(criteria(), cursor=first["metadata"]["cursor"])
+    assert json.loads(json.dumps(delta["listings"])) == delta["listings"]
+    assert [listing["listing_url"] for listing in delta["listings"]] == [site._listing_url(5), site._listing_url(6)]
+
+
+def test_skip_patterns_cover_only_listing_pages():
+    search_url = "https://www.boligportal.dk/en/rental-properties/copenhagen/5-rooms/"
+    patterns = CrawlScope.skip_patterns(search_url, [
+        search_url + "?offset=18",
+        search_url + "apartment-id-12",
+        search_url + "apartment-id-13?ref=list",
+    ])
+
+    assert patterns == [
+        r"^/en/rental\-properties/copenhagen/5\-rooms/apartment\-id\-12/?$",
+        r"^/en/rental\-properties/copenhagen/5\-rooms/apartment\-id\-13/?\?ref=list$",
+    ]
@@ -0,0 +1,63 @@
+import itertools
+import random
+from datetime import date, timedelta
+
+import numpy as np
+
+from housing_search import HousingCriteria
+from listings import Listing, ListingBatch, available_by, compile_predicate
+
+CRITERIA_OPTIONS = {
+    "max_price": [8000, 15000],
+    "min_bedrooms": [1, 3],
+    "property_type": ["all", "apartment", "house"],
+    "min_size_m2": [None, 0, 60],
+    "max_size_m2": [None, 90],
+    "furnished": [None, True, False],
+    "immediate_availability": [None, True, False],
+    "pets_allowed": [None, True, False],
+}
+
+
+def random_listing(rng):
+    """A listing whose fields are often missing, zero or exactly on a criterion's bound."""
+    boundary = available_by()
+    available_dates = [None, date.today().isoformat(), boundary.isoformat(),
+                       (boundary + timedelta(days=1)).isoformat(), (boundary + timedelta(days=60)).isoformat()]
+    return Listing(
+        title="Listing",
+        price_dkk=rng.choice([None, 0, 5000, 8000, 8000.5, 12000, 15000, 20000]),
+        location=rng.choice([None, "", "copenhagen", "aarhus"]),
+        size_m2=rng.choice([None, 0, 45.5, 60, 75, 90, 120]),
+        bedrooms=rng.choice([None, 0, 1, 2, 3, 5]),
+        property_type=rng.choice([None, "apartment", "house", "room"]),
+        furnished=rng.choice([None, True, False]),
+        pets_allowed=rng.choice([None, True, False]),
+        available_from=rng.choice(available_dates),
+    )
+
+
+def test_predicate_and_batch_mask_agree_on_every_criteria_combination():
+    rng = random.Random(16)
+    listings = [random_listing(rng) for _ in range(400)]
+    batch = ListingBatch.from_listings(listings)
+
+    combinations = list(itertools.product(*CRITERIA_OPTIONS.values()))
+    for values in combinations:
+        criteria = HousingCriteria(location="copenhagen", **dict(zip(CRITERIA_OPTIONS, values)))
+        matches = compile_predicate(criteria)
+        expected = np.array([matches(listing) for listing in listings])
+        mismatches = np.flatnonzero(batch.criteria_mask(criteria) != expected)
+        assert not mismatches.size, f"{criteria}: mask disagrees on {[listings[i] for i in mismatches[:3]]}"
+
+
+def test_filtered_batch_holds_the_listings_the_predicate_matches():
+    rng = random.Random(61)
+    listings = [random_listing(rng) for _ in range(200)]
+    criteria = HousingCriteria(location="copenhagen", max_price=15000, min_bedrooms=2, min_size_m2=60,
+                               furnished=True, immediate_availability=True)
+
+    matches = compile_predicate(criteria)
+    assert ListingBatch.from_listings(listings).filter(criteria).to_listings() == [
+        listing for listing in listings if matches(listing)
+    ]
@@ -0,0 +1,95 @@
+import pytest
+
+from query_parser import normalize_query, parse_query_rules
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("2 rooms in Copenhagen under 19000 kr",
+     {"location": "copenhagen", "max_price": 19000, "min_bedrooms": 2}),
+    ("3 værelser i Århus max 12.000 kr",
+     {"location": "aarhus", "max_price": 12000, "min_bedrooms": 3}),
+    ("to værelser i Odense under 8000 kr",
+     {"location": "odense", "max_price": 8000, "min_bedrooms": 2}),
+    ("2 rooms in Copenhagen under 19k from 1 March",
+     {"location": "copenhagen", "max_price": 19000, "min_bedrooms": 2}),
+    ("2 rooms in Copenhagen or Aarhus under 15000 kr",
+     {"location": ["copenhagen", "aarhus"], "max_price": 15000, "min_bedrooms": 2}),
+    ("2 rooms in Aarhus under 9000 kr, over 50 m2",
+     {"location": "aarhus", "max_price": 9000, "min_bedrooms": 2, "min_size_m2": 50}),
+])
+def test_parses_common_templates(query, expected):
+    assert parse_query_rules(query) == expected
+
+
+@pytest.mark.parametrize("query", [
+    "2 rooms in Copenhagen over 10000 kr",
+    "2 rooms in Copenhagen at least 10000 kr",
+    "2 rooms in Copenhagen min 10000 kr",
+    "2 rooms in Aarhus from 8000 kr",
+    "2 rooms in Aarhus fra 8.000 kr",
+])
+def test_minimum_rents_fall_back_to_the_llm(query):
+    assert parse_query_rules(query) is None
+
+
+@pytest.mark.parametrize("query", [
+    "2-3 rooms in Aarhus under 9000 kr",
+    "2 to 3 rooms in Aarhus under 9000 kr",
+    "2 or 3 rooms in Aarhus under 9000 kr",
+    "2-3 værelser i Aarhus under 9000 kr",
+    "up to 3 rooms in Aarhus under 9000 kr",
+    "max 2 rooms in Aarhus under 9000 kr",
+    "at most 2 rooms in Aarhus under 9000 kr",
+    "højst 2 værelser i Aarhus under 9000 kr",
+    "no more than 3 rooms in Aarhus under 9000 kr",
+])
+def test_room_ranges_fall_back_to_the_llm(query):
+    assert parse_query_rules(query) is None
+
+
+# Expected when the rules leave a query to the LLM rather than risk reading a flag wrongly.
+LLM = "llm"
+
+
+@pytest.mark.parametrize("query, flag, expected", [
+    ("2 rooms in Aarhus under 9000 kr available immediately", "immediate_availability", True),
+    ("2 rooms in Aarhus under 9000 kr, not immediately", "immediate_availability", LLM),
+    ("2 rooms in Aarhus under 9000 kr, doesn't need to be available immediately", "immediate_availability", LLM),
+    ("2 rooms in Aarhus under 9000 kr furnished", "furnished", True),
+    ("2 rooms in Aarhus under 9000 kr, not furnished", "furnished", False),
+    ("2 rooms in Aarhus under 9000 kr, unfurnished", "furnished", False),
+    ("2 værelser i Aarhus under 9000 kr, ikke møbleret", "furnished", False),
+    ("2 rooms in Aarhus under 9000 kr, doesn't have to be furnished", "furnished", LLM),
+    ("2 rooms in Aarhus under 9000 kr, doesnt need to be furnished", "furnished", LLM),
+    ("2 rooms in Aarhus under 9000 kr, furnished is not required", "furnished", LLM),
+    ("2 rooms in Aarhus under 9000 kr, it does not matter whether it is furnished", "furnished", LLM),
+    ("2 rooms in Aarhus under 9000 kr, furnished or unfurnished", "furnished", LLM),
+    ("2 rooms in Aarhus under 9000 kr, pets allowed", "pets_allowed", True),
+    ("2 rooms in Aarhus under 9000 kr, no pets", "pets_allowed", False),
+    ("2 rooms in Aarhus under 9000 kr, pets allowed is optional", "pets_allowed", LLM),
+])
+def test_flags_honour_negations(query, flag, expected):
+    criteria = parse_query_rules(query)
+    if expected == LLM:
+        assert criteria is None
+    else:
+        assert criteria.get(flag) == expected
+
+
+def test_minimum_and_maximum_rents_get_different_cache_keys():
+    assert normalize_query("2 rooms in Copenhagen over 10000 kr") != normalize_query(
+        "2 rooms in Copenhagen under 10000 kr")
+
+
+def test_equivalent_queries_share_a_cache_key():
+    assert normalize_query("2 rooms in Copenhagen under 19.000 kr") == normalize_query("københavn under 19k 2 rooms")
+
+
+def test_opposite_exclusions_get_different_cache_keys():
+    assert normalize_query("2 rooms in copenhagen, not valby, max 15000 kr") != normalize_query(
+        "2 rooms in valby, not copenhagen, max 15000 kr")
+
+
+def test_free_words_keep_their_order_in_cache_keys():
+    assert normalize_query("near the metro, far from the motorway, 2 rooms in copenhagen") != normalize_query(
+        "near the motorway, far from the metro, 2 rooms in copenhagen")
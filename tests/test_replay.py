@@ -0,0 +1,147 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import FakeBackend
+from crawl_jobs import CrawlJob
+from replay import (Corpus, RecordingBackend, RecordingOpenAI, ReplayBackend, ReplayMissError, ReplayOpenAI,
+                    fixed_latency, parse_latency)
+
+SEARCH_URL = "https://www.boligportal.dk/en/rental-properties/copenhagen/3-rooms/?max_monthly_rent=15000"
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.requests = []
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        message = SimpleNamespace(content=f"answer to {kwargs['messages'][-1]['content']}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def test_recorded_crawls_replay_from_a_reopened_corpus(tmp_path):
+    backend = FakeBackend()
+    recorder = RecordingBackend(backend, Corpus(str(tmp_path)))
+    recorded = recorder.fetch(SEARCH_URL)
+    asyncio.run(recorder.afetch(SEARCH_URL.replace("3-rooms", "4-rooms")))
+
+    replay = ReplayBackend(Corpus(str(tmp_path)), name=backend.name)
+    # Replays are looked up by canonical URL.
+    assert replay.fetch(SEARCH_URL.replace("https://www.", "HTTPS://WWW.") + "#map") == recorded
+    assert asyncio.run(replay.afetch(SEARCH_URL.replace("3-rooms", "4-rooms")))[0]["url"].endswith(
+        "4-rooms/?max_monthly_rent=15000")
+    assert backend.fetched == [SEARCH_URL, SEARCH_URL.replace("3-rooms", "4-rooms")]
+    with pytest.raises(ReplayMissError):
+        replay.fetch(SEARCH_URL.replace("3-rooms", "5-rooms"))
+
+
+class StreamingBackend(FakeBackend):
+    """Streams each crawl in two batches and runs crawls as jobs, like Firecrawl."""
+
+    name = "firecrawl"
+    runs_jobs = True
+
+    def stream(self, url, stop=None):
+        pages = self.fetch(url)
+        yield pages[:1]
+        yield [{**pages[0], "url": f"{url}#second"}]
+
+    async def astream(self, url):
+        for batch in self.stream(url):
+            yield batch
+
+    def fetch_new(self, url, skip_urls):
+        return [] if skip_urls else self.fetch(url)
+
+    def submit(self, url):
+        job = CrawlJob(url, manager=None)
+        job._future.set_result(self.fetch(url))
+        return job
+
+    def completion_times(self):
+        return {"boligportal": {"samples": 1, "median": 2.0}}
+
+
+def test_streamed_crawls_are_recorded_whole(tmp_path):
+    recorder = RecordingBackend(StreamingBackend(), Corpus(str(tmp_path)))
+    streamed = list(recorder.stream(SEARCH_URL))
+
+    async def astream():
+        return [batch async for batch in recorder.astream(SEARCH_URL.replace("3-rooms", "4-rooms"))]
+
+    astreamed = asyncio.run(astream())
+    replay = ReplayBackend(Corpus(str(tmp_path)))
+    assert len(streamed) == 2
+    assert replay.fetch(SEARCH_URL) == streamed[0] + streamed[1]
+    assert replay.fetch(SEARCH_URL.replace("3-rooms", "4-rooms")) == astreamed[0] + astreamed[1]
+
+
+def test_crawls_skipping_known_pages_replay_under_their_own_key(tmp_path):
+    recorder = RecordingBackend(StreamingBackend(), Corpus(str(tmp_path)))
+    recorder.fetch(SEARCH_URL)
+    known = [SEARCH_URL + "apartment-id-1"]
+    assert recorder.fetch_new(SEARCH_URL, known) == []
+
+    replay = ReplayBackend(Corpus(str(tmp_path)))
+    assert replay.fetch_new(SEARCH_URL, known) == []
+    assert replay.fetch(SEARCH_URL) != []
+    # Crawls skipping pages that weren't recorded fall back to the whole crawl.
+    assert replay.fetch_new(SEARCH_URL, [SEARCH_URL + "apartment-id-2"]) == replay.fetch(SEARCH_URL)
+
+
+def test_recording_keeps_the_wrapped_backends_crawl_jobs_and_timings(agent, tmp_path):
+    corpus = Corpus(str(tmp_path))
+    agent.register_fetch_backend(RecordingBackend(StreamingBackend(), corpus))
+
+    pages = agent.submit_crawl(SEARCH_URL).result()
+    assert ReplayBackend(corpus).fetch(SEARCH_URL) == pages
+    assert agent.metrics()["crawl_completion_times"] == {"boligportal": {"samples": 1, "median": 2.0}}
+
+    agent.register_fetch_backend(ReplayBackend(corpus))
+    with pytest.raises(ValueError):
+        agent.submit_crawl(SEARCH_URL)
+    assert "crawl_completion_times" not in agent.metrics()
+
+
+def test_later_recordings_replace_earlier_ones(tmp_path):
+    corpus = Corpus(str(tmp_path))
+    corpus.append("crawls", "fake:url", ["first"], 1.0)
+    corpus.append("crawls", "fake:url", ["second"], 2.0)
+
+    reopened = Corpus(str(tmp_path))
+    assert reopened.keys("crawls") == ["fake:url"]
+    assert reopened.get("crawls", "fake:url") == {"key": "fake:url", "value": ["second"], "elapsed": 2.0}
+
+
+def test_replays_inject_the_latency_model_delay(tmp_path, monkeypatch):
+    corpus = Corpus(str(tmp_path))
+    RecordingBackend(FakeBackend(), corpus).fetch(SEARCH_URL)
+    delays = []
+    monkeypatch.setattr("replay.time.sleep", delays.append)
+
+    ReplayBackend(corpus, name="fake", latency=fixed_latency(0.25)).fetch(SEARCH_URL)
+    assert delays == [0.25]
+
+
+def test_recorded_completions_replay_by_request(tmp_path):
+    completions = FakeCompletions()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    request = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "2 rooms in aarhus"}]}
+    recorded = RecordingOpenAI(client, Corpus(str(tmp_path))).chat.completions.create(**request)
+
+    replay = ReplayOpenAI(Corpus(str(tmp_path)))
+    assert replay.chat.completions.create(**request).choices[0].message.content == recorded.choices[0].message.content
+    with pytest.raises(ReplayMissError, match="3 rooms"):
+        replay.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": "3 rooms"}])
+    assert len(completions.requests) == 1
+
+
+def test_latency_specs():
+    assert parse_latency("none") is None
+    assert parse_latency("recorded:2")(1.5) == 3.0
+    assert parse_latency("fixed:0.1")(5) == 0.1
+    assert 1 <= parse_latency("uniform:1,2")(0) <= 2
+    with pytest.raises(ValueError):
+        parse_latency("gaussian:1")
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from conftest import FakeBackend, results_page
+from housing_search import PORTAL_FILTERS, HousingCriteria
+
+RESULTS_URL = "https://www.boligportal.dk/en/rental-properties/copenhagen/2-rooms"
+
+FILTER_PARAMS = [
+    ("max_price", 12000, "max_monthly_rent=12000"),
+    ("property_type", "house", "housing_type=house"),
+    ("min_size_m2", 40, "min_size_m2=40"),
+    ("max_size_m2", 90, "max_size_m2=90"),
+    ("furnished", True, "furnished=true"),
+    ("pets_allowed", True, "pets_allowed=true"),
+    ("immediate_availability", True, "available_immediately=true"),
+]
+
+
+class EmptyAalborg(FakeBackend):
+    """Finds nothing in Aalborg, after a while everywhere."""
+
+    async def afetch(self, url):
+        await asyncio.sleep(0.1)
+        return [] if "/aalborg/" in url else self.fetch(url)
+
+
+def test_concurrent_searches_point_at_their_own_search_url(agent, monkeypatch):
+    agent.register_fetch_backend(EmptyAalborg())
+
+    async def parse(query):
+        return HousingCriteria(location=query, max_price=20000, min_bedrooms=5)
+
+    monkeypatch.setattr(agent, "_aparse_query", parse)
+
+    async def search_concurrently():
+        return await asyncio.gather(agent.asearch_housing("aalborg", session_id="a"),
+                                    agent.asearch_housing("odense", session_id="b"))
+
+    aalborg, odense = asyncio.run(search_concurrently())
+    assert aalborg.startswith("No available properties found")
+    assert "/rental-properties/aalborg/5-rooms" in aalborg
+    assert odense.startswith("Found 18 matching properties")
+
+
+def test_sync_searches_can_pick_their_fetch_backend(agent, backend):
+    other = SharedListings()
+    other.name = "other"
+    agent.register_fetch_backend(other)
+
+    assert agent.search_housing("5 rooms in Aarhus under 20000 kr", backend="other").startswith("Found 18")
+    assert agent.search_housing("5 rooms in Aarhus under 20000 kr", max_results=5, backend="other").startswith(
+        "Found 5")
+    assert len(other.fetched) == 1 and backend.fetched == []
+
+
+def test_every_portal_filter_has_a_push_down_case():
+    assert [field for field, _, _ in FILTER_PARAMS] == list(PORTAL_FILTERS)
+
+
+@pytest.mark.parametrize("field, value, param", FILTER_PARAMS)
+def test_filters_are_pushed_into_the_search_url(agent, field, value, param):
+    criteria = HousingCriteria(**{"location": "copenhagen", "max_price": 12000, "min_bedrooms": 2, field: value})
+    url, _, query = agent.construct_search_url(criteria).partition("/?")
+
+    assert url == RESULTS_URL
+    assert set(query.split("&")) == {"max_monthly_rent=12000", param}
+    assert agent.filter_placement(criteria)[field] == "server"
+
+
+@pytest.mark.parametrize("field, value", [
+    ("property_type", "all"),
+    ("min_size_m2", 0),
+    ("furnished", False),
+    ("pets_allowed", False),
+    ("immediate_availability", False),
+])
+def test_filters_the_portal_cant_apply_stay_out_of_the_url(agent, field, value):
+    criteria = HousingCriteria(location="copenhagen", max_price=12000, min_bedrooms=2, **{field: value})
+
+    assert agent.construct_search_url(criteria) == f"{RESULTS_URL}/?max_monthly_rent=12000"
+    assert agent.filter_placement(criteria).get(field, "client") == "client"
+
+
+class SharedListings(FakeBackend):
+    """Lists the same listings, filed under the site's listings root, for every location."""
+
+    def fetch(self, url):
+        page = results_page(url, self.cards)
+        page["links"] = [f"https://www.boligportal.dk/en/rental-properties/apartment-id-{i}" for i in range(self.cards)]
+        self.fetched.append(url)
+        return [page]
+
+
+def test_listings_found_in_several_locations_are_merged_once(agent):
+    backend = SharedListings()
+    agent.register_fetch_backend(backend)
+    agent.default_backend = backend.name
+    criteria = HousingCriteria(location=["copenhagen", "aarhus"], max_price=20000, min_bedrooms=5)
+    result = agent._execute_search(criteria)
+
+    assert sorted(url.split("/")[-3] for url in backend.fetched) == ["aarhus", "copenhagen"]
+    urls = [listing.listing_url for listing in result["listings"]]
+    assert len(urls) == len(set(urls)) == 18
+    # The first location's crawl is kept.
+    assert {listing.location for listing in result["listings"]} == {"copenhagen"}
+
+
+def test_multi_location_queries_report_the_merged_listings(agent):
+    backend = SharedListings()
+    agent.register_fetch_backend(backend)
+    agent.default_backend = backend.name
+
+    response = agent.search_housing("5 rooms in Copenhagen or Aarhus under 20000 kr")
+    assert response.startswith("Found 18 matching properties")
+    async_response = asyncio.run(agent.asearch_housing("5 rooms in Copenhagen or Aarhus under 20000 kr"))
+    assert async_response.startswith("Found 18 matching properties")
@@ -0,0 +1,63 @@
+import inspect
+
+import pytest
+
+from housing_search import HousingCriteria
+from listings import Listing
+from sessions import SearchSession, sort_listings
+
+
+@pytest.fixture
+def searched(agent, monkeypatch):
+    """The agent after a search that found 18 listings."""
+    monkeypatch.setattr(agent, "_parse_query",
+                        lambda query: HousingCriteria(location="Aarhus", max_price=20000, min_bedrooms=5))
+    agent.search_housing("5 rooms in Aarhus under 20000 kr")
+    return agent
+
+
+def test_tool_arguments_have_json_schema_types(agent):
+    # Swarm describes any other annotation, such as Optional[int], as a string.
+    for tool in (agent.search_housing, agent.show_more_results, agent.sort_results, agent.describe_listing):
+        for name, parameter in inspect.signature(tool).parameters.items():
+            if name != "context_variables":
+                assert parameter.annotation in (str, int, float, bool, list, dict), (tool.__name__, name)
+
+
+def test_search_housing_accepts_max_results_as_a_string(agent, monkeypatch):
+    monkeypatch.setattr(agent, "_parse_query",
+                        lambda query: HousingCriteria(location="Aarhus", max_price=20000, min_bedrooms=5))
+    assert agent.search_housing("5 rooms in Aarhus under 20000 kr", max_results="5").startswith(
+        "Found 5 matching properties")
+
+
+def test_follow_ups_page_without_searching_again(searched, backend):
+    fetched = len(backend.fetched)
+    assert searched.show_more_results(count="5").startswith("Properties 11-15 of 18")
+    assert searched.show_more_results().startswith("Properties 16-18 of 18")
+    assert searched.show_more_results() == "All 18 matching properties have been shown."
+    assert "count must be a number" in searched.show_more_results(count="five")
+    assert len(backend.fetched) == fetched
+
+
+def test_describe_listing_accepts_a_string_number(searched):
+    assert searched.describe_listing("2").startswith("2. ")
+    assert "no listing number 19" in searched.describe_listing(19)
+
+
+def test_sort_results_orders_by_the_key_with_unknown_values_last(searched):
+    response = searched.sort_results("size", descending=True)
+    assert response.index("Size: 67.0") < response.index("Size: 66.0")
+    listings = [Listing(size_m2=50), Listing(), Listing(size_m2=70)]
+    assert [listing.size_m2 for listing in sort_listings(listings, "size")] == [50, 70, None]
+
+
+def test_sessions_are_separate(searched):
+    assert searched.show_more_results(context_variables={"session_id": "other"}).startswith("There are no")
+
+
+def test_next_page_counts_listings_as_shown():
+    session = SearchSession(criteria=None, listings=[Listing(title=str(i)) for i in range(3)])
+    assert session.next_page(2) == (1, session.listings[:2])
+    assert session.next_page(2) == (3, session.listings[2:])
+    assert session.shown == 3
@@ -0,0 +1,209 @@
+import asyncio
+import threading
+
+import pytest
+
+from conftest import FakeBackend
+from singleflight import SharedStream, SingleFlight
+
+SEARCH_URL = "https://www.boligportal.dk/en/rental-properties/copenhagen/3-rooms/"
+
+
+class HeldBackend(FakeBackend):
+    """Holds each fetch until release is set, then fails with error if one is given."""
+
+    def __init__(self, error=None):
+        super().__init__()
+        self.release = threading.Event()
+        self.error = error
+
+    def fetch(self, url):
+        self.release.wait(5)
+        if self.error:
+            raise self.error
+        return super().fetch(url)
+
+    async def afetch(self, url):
+        while not self.release.is_set():
+            await asyncio.sleep(0.001)
+        return self.fetch(url)
+
+
+def fetch_concurrently(flights, backend, callers):
+    """Call flights.do for SEARCH_URL from callers threads once all have joined; return results or errors."""
+    results = []
+
+    def call():
+        try:
+            results.append(flights.do(SEARCH_URL, lambda: backend.fetch(SEARCH_URL)))
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    while flights.stats()["calls"] < callers:
+        pass
+    backend.release.set()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_concurrent_calls_for_a_key_share_one_fetch():
+    flights = SingleFlight()
+    backend = HeldBackend()
+    results = fetch_concurrently(flights, backend, callers=8)
+
+    assert backend.fetched == [SEARCH_URL]
+    assert len(results) == 8 and all(result is results[0] for result in results)
+    assert flights.stats() == {"calls": 8, "executions": 1, "coalesced": 7, "in_flight": 0}
+
+
+def test_every_caller_gets_the_error_of_the_shared_fetch():
+    flights = SingleFlight()
+    error = RuntimeError("crawl failed")
+    results = fetch_concurrently(flights, HeldBackend(error), callers=4)
+
+    assert results == [error] * 4
+    # Nothing is left in flight, so the next call fetches again.
+    assert flights.do(SEARCH_URL, lambda: "again") == "again"
+
+
+def test_async_callers_share_one_fetch_and_its_error():
+    flights = SingleFlight()
+    backend = HeldBackend()
+
+    async def run(backend):
+        calls = [flights.ado(SEARCH_URL, lambda: backend.afetch(SEARCH_URL)) for _ in range(5)]
+        gathered = asyncio.gather(*calls, return_exceptions=True)
+        await asyncio.sleep(0.01)
+        backend.release.set()
+        return await gathered
+
+    results = asyncio.run(run(backend))
+    assert backend.fetched == [SEARCH_URL]
+    assert all(result is results[0] for result in results)
+
+    failing = HeldBackend(RuntimeError("crawl failed"))
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(run(failing)))
+    assert flights.stats()["executions"] == 2 and flights.stats()["coalesced"] == 8
+
+
+def test_a_cancelled_async_caller_leaves_the_shared_fetch_running():
+    flights = SingleFlight()
+    backend = HeldBackend()
+
+    async def run():
+        first = asyncio.ensure_future(flights.ado(SEARCH_URL, lambda: backend.afetch(SEARCH_URL)))
+        second = asyncio.ensure_future(flights.ado(SEARCH_URL, lambda: backend.afetch(SEARCH_URL)))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        backend.release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run())[0]["url"] == SEARCH_URL
+    assert backend.fetched == [SEARCH_URL]
+
+
+def test_shared_stream_holds_only_items_not_yet_read_by_every_consumer():
+    streams = SharedStream()
+    held = []
+
+    def produce(stop):
+        for i in range(100):
+            held.append(len(streams._flights["key"].items))
+            yield i
+
+    assert list(streams.stream("key", produce, threading.Event())) == list(range(100))
+    assert max(held) <= 1
+
+
+def test_followers_get_every_item_and_items_are_dropped_once_all_have_read_them():
+    streams = SharedStream()
+    release = threading.Event()
+    joined = threading.Event()
+    held = []
+
+    def produce(stop):
+        joined.wait(5)
+        for i in range(50):
+            release.wait(5)
+            held.append(len(streams._flights["key"].items))
+            yield i
+
+    results = {}
+
+    def consume(name):
+        results[name] = list(streams.stream("key", produce, threading.Event()))
+
+    leader = threading.Thread(target=consume, args=("leader",))
+    leader.start()
+    while "key" not in streams._flights:
+        pass
+    follower = threading.Thread(target=consume, args=("follower",))
+    follower.start()
+    while len(streams._flights["key"].consumers) < 2:
+        pass
+    joined.set()
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert results["leader"] == results["follower"] == list(range(50))
+    assert streams.stats()["executions"] == 1
+    assert max(held) < 50
+
+
+def test_late_consumers_run_the_stream_themselves_once_its_start_was_dropped():
+    streams = SharedStream()
+    started = threading.Event()
+    finish = threading.Event()
+    runs = []
+
+    def produce(stop):
+        runs.append(1)
+        yield "first"
+        yield "second"
+        started.set()
+        finish.wait(5)
+        yield "third"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(list(streams.stream("key", produce, threading.Event()))))
+    leader.start()
+    started.wait(5)
+    # The leader has read "first", which was dropped; a late consumer can't be given it.
+    late_stream = streams.stream("key", produce, threading.Event())
+    late = [next(late_stream)]
+    finish.set()
+    late += list(late_stream)
+    leader.join(5)
+
+    assert late == ["first", "second", "third"]
+    assert results == [["first", "second", "third"]]
+    assert len(runs) == 2
+    assert streams.stats()["coalesced"] == 0
+
+
+def test_async_shared_stream_drops_items_every_listener_has_read():
+    streams = SharedStream()
+    held = []
+
+    async def produce():
+        for i in range(20):
+            await asyncio.sleep(0)
+            held.append(len(streams._aflights["key"].items))
+            yield i
+
+    async def collect():
+        return [item async for item in streams.astream("key", produce)]
+
+    async def run():
+        return await asyncio.gather(collect(), collect())
+
+    assert asyncio.run(run()) == [list(range(20)), list(range(20))]
+    assert streams.stats()["executions"] == 1
+    assert max(held) <= 1
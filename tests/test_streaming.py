@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import housing_search
+from conftest import FakeBackend
+from housing_search import HousingCriteria
+
+
+def criteria():
+    return HousingCriteria(location="Aarhus", max_price=20000, min_bedrooms=5)
+
+
+@pytest.mark.parametrize("max_results", [1, 5, 10, 17])
+def test_stream_search_yields_max_results(agent, max_results):
+    listings = list(agent.stream_search(criteria(), max_results=max_results))
+    assert len(listings) == max_results
+    assert agent.early_stops == 1
+
+
+def test_stream_search_yields_everything_below_max_results(agent):
+    assert len(list(agent.stream_search(criteria(), max_results=50))) == 18
+    assert agent.early_stops == 0
+
+
+@pytest.mark.parametrize("max_results", [1, 5, 10])
+def test_astream_search_yields_max_results(agent, max_results):
+    async def collect():
+        return [listing async for listing in agent.astream_search(criteria(), max_results=max_results)]
+
+    assert len(asyncio.run(collect())) == max_results
+
+
+def test_search_housing_shows_max_results(agent, monkeypatch):
+    monkeypatch.setattr(agent, "_parse_query", lambda query: criteria())
+    response = agent.search_housing("5 rooms in Aarhus under 20000 kr", max_results=10)
+    assert response.startswith("Found 10 matching properties")
+
+
+def test_crawls_waiting_for_a_worker_never_start_after_an_early_stop(monkeypatch):
+    monkeypatch.setenv("CRAWL_FANOUT_WORKERS", "1")
+
+    class LongCrawl(FakeBackend):
+        """Yields its pages at once, then keeps the crawl running until stopped."""
+
+        def stream(self, url, stop=None):
+            yield self.fetch(url)
+            stop.wait(5)
+
+    backend = LongCrawl()
+    agent = housing_search.HousingSearchAgent()
+    agent.register_fetch_backend(backend)
+    search = HousingCriteria(location="Aarhus", max_price=20000, min_bedrooms=2)
+    assert len(agent.plan_searches(search)) == 4
+
+    assert len(list(agent.stream_search(search, backend="fake", max_results=1))) == 1
+    for thread in threading.enumerate():
+        if thread.name.startswith("crawl-fanout"):
+            thread.join(5)
+    assert len(backend.fetched) == 1
+
+
+class SlowBackend(FakeBackend):
+    """Takes a while per crawl, so concurrent searches overlap."""
+
+    def fetch(self, url):
+        time.sleep(0.2)
+        return super().fetch(url)
+
+    async def afetch(self, url):
+        await asyncio.sleep(0.2)
+        return super().fetch(url)
+
+
+def test_concurrent_streamed_searches_share_one_crawl_and_cache_it(agent):
+    backend = SlowBackend()
+    agent.register_fetch_backend(backend)
+    searches = [threading.Thread(target=lambda: list(agent.stream_search(criteria(), max_results=50)))
+                for _ in range(3)]
+    for search in searches:
+        search.start()
+    for search in searches:
+        search.join()
+    assert len(backend.fetched) == 1
+
+    assert len(list(agent.stream_search(criteria(), max_results=50))) == 18
+    assert len(backend.fetched) == 1
+
+
+def test_concurrent_async_streamed_searches_share_one_crawl(agent):
+    backend = SlowBackend()
+    agent.register_fetch_backend(backend)
+
+    async def collect():
+        return [listing async for listing in agent.astream_search(criteria(), max_results=50)]
+
+    async def search_concurrently():
+        return await asyncio.gather(*[collect() for _ in range(3)])
+
+    assert [len(listings) for listings in asyncio.run(search_concurrently())] == [18, 18, 18]
+    assert len(backend.fetched) == 1
+
+
+def test_concurrent_searches_do_not_queue_behind_each_other(monkeypatch):
+    monkeypatch.setenv("CRAWL_FANOUT_WORKERS", "2")
+    agent = housing_search.HousingSearchAgent()
+    agent.register_fetch_backend(SlowBackend())
+    agent.default_backend = "fake"
+    searches = [HousingCriteria(location=location, max_price=20000, min_bedrooms=2)
+                for location in ("Aarhus", "Odense")]
+    # Four URLs each, two at a time: 0.4 s per search, also when both run at once.
+    assert all(len(agent.plan_searches(search)) == 4 for search in searches)
+
+    def search(criteria, streamed):
+        if streamed:
+            list(agent.stream_search(criteria, max_results=100))
+        else:
+            agent._perform_crawls(agent.plan_search_urls(criteria), backend="fake")
+
+    for streamed in (False, True):
+        agent.crawl_cache.cache.clear()
+        threads = [threading.Thread(target=search, args=(criteria, streamed)) for criteria in searches]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert time.perf_counter() - started < 0.7
+
+
+def test_a_single_streamed_crawl_runs_on_the_callers_thread(agent):
+    threads = []
+
+    class ThreadRecorder(FakeBackend):
+        def fetch(self, url):
+            threads.append(threading.current_thread())
+            return super().fetch(url)
+
+    agent.register_fetch_backend(ThreadRecorder())
+    assert len(list(agent.stream_search(criteria(), max_results=100))) == 18
+    assert threads == [threading.current_thread()]
+
+
+def test_streamed_crawls_larger_than_the_cache_bound_are_not_cached(agent, backend):
+    agent.stream_cache_max_bytes = 1000
+    assert len(list(agent.stream_search(criteria(), max_results=50))) == 18
+    assert len(list(agent.stream_search(criteria(), max_results=50))) == 18
+    assert len(backend.fetched) == 2
+
+    agent.stream_cache_max_bytes = 10 ** 6
+    list(agent.stream_search(criteria(), max_results=50))
+    list(agent.stream_search(criteria(), max_results=50))
+    assert len(backend.fetched) == 3